@@ -0,0 +1,257 @@
+import os
+import sys
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import argparse
+import threading
+
+# One local store for the parsed papers and the generated transcripts, replacing the
+# arxiv/, json/, sciencedirect/ and transcript/ folders of JSON files. Every artifact is a
+# zlib-compressed JSON blob in a SQLite table keyed by (kind, source id, version), with its
+# content hash, title and dates indexed for lookups. The version is the arXiv version of a
+# paper, the content hash of a PDF file (so two PDFs with the same file name never collide),
+# or the content hash of the artifact itself when there is no better one; a lookup without a
+# version returns the most recent one. Writes are transactions of a WAL-mode database, safe
+# for several runs at the same time, and the least recently used artifacts are evicted when
+# the blobs exceed max_bytes.
+#
+# The old folders are still read: a JSON file there that is missing from the store, or newer
+# than the stored artifact (e.g. a hand-edited transcript), is imported on lookup.
+#   python artifact_store.py migrate                    # import all the old folders at once
+#   python artifact_store.py list [kind] [--title attention]
+#   python artifact_store.py export transcript 1706.03762   # to transcript/1706.03762.json for editing
+
+# the folder each kind of artifact was kept in before the store
+legacy_folders = {
+    'arxiv': 'arxiv',
+    'pdf': 'json',
+    'sciencedirect': 'sciencedirect',
+    'transcript': 'transcript',
+}
+
+schema = '''
+CREATE TABLE IF NOT EXISTS artifacts (
+    kind TEXT NOT NULL,
+    source_id TEXT NOT NULL,
+    version TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    title TEXT,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (kind, source_id, version)
+);
+CREATE INDEX IF NOT EXISTS artifacts_title ON artifacts (title COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS artifacts_created ON artifacts (kind, created);
+CREATE INDEX IF NOT EXISTS artifacts_accessed ON artifacts (accessed);
+CREATE INDEX IF NOT EXISTS artifacts_content_hash ON artifacts (content_hash);
+'''
+
+def content_hash(blob):
+    return hashlib.sha256(blob).hexdigest()
+
+class ArtifactStore:
+    def __init__(self, path, max_bytes=1024 * 1024 * 1024, legacy_folders=legacy_folders):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.legacy_folders = legacy_folders
+        self.legacy_pdf_folder = 'pdfs'
+        # sqlite connections can not be shared between threads, each thread opens its own
+        self.local = threading.local()
+
+    def connect(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(schema)
+            self.local.connection = connection
+        return connection
+
+    # store a JSON serializable artifact, returns its version
+    def put(self, kind, source_id, data, version=None, title=None, created=None):
+        blob = json.dumps(data).encode('utf-8')
+        digest = content_hash(blob)
+        compressed = zlib.compress(blob, 6)
+        version = str(version) if version else digest[:16]
+        if title is None and isinstance(data, dict):
+            title = data.get('title')
+        now = time.time()
+        connection = self.connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                               (kind, source_id, version, digest, title, created or now, now,
+                                len(compressed), compressed))
+            self.evict(connection, (kind, source_id, version))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return version
+
+    # the artifact, or None. Without a version the most recent one
+    def get(self, kind, source_id, version=None):
+        self.import_legacy(kind, source_id, version)
+        connection = self.connect()
+        query = 'SELECT version, data FROM artifacts WHERE kind = ? AND source_id = ?'
+        parameters = [kind, source_id]
+        if version:
+            query += ' AND version = ?'
+            parameters.append(str(version))
+        row = connection.execute(query + ' ORDER BY created DESC LIMIT 1', parameters).fetchone()
+        if row is None:
+            return None
+        connection.execute('UPDATE artifacts SET accessed = ? WHERE kind = ? AND source_id = ? AND version = ?',
+                           (time.time(), kind, source_id, row[0]))
+        return json.loads(zlib.decompress(row[1]))
+
+    # the metadata of the stored artifacts, most recent first, optionally filtered
+    # by kind, source id, a part of the title and the creation time
+    def find(self, kind=None, source_id=None, title=None, since=None, limit=100):
+        conditions, parameters = [], []
+        for condition, value in [('kind = ?', kind), ('source_id = ?', source_id),
+                                 ('title LIKE ?', title and f"%{title}%"), ('created >= ?', since)]:
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        where = ' WHERE ' + ' AND '.join(conditions) if conditions else ''
+        rows = self.connect().execute(
+            'SELECT kind, source_id, version, content_hash, title, created, accessed, size FROM artifacts'
+            + where + ' ORDER BY created DESC LIMIT ?', parameters + [limit]).fetchall()
+        fields = ['kind', 'source_id', 'version', 'content_hash', 'title', 'created', 'accessed', 'size']
+        return [dict(zip(fields, row)) for row in rows]
+
+    # delete the least recently used artifacts until the blobs fit in max_bytes,
+    # inside the write transaction of put, except the one it has just written (keep)
+    def evict(self, connection, keep):
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM artifacts').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for kind, source_id, version, size in connection.execute(
+                'SELECT kind, source_id, version, size FROM artifacts ORDER BY accessed').fetchall():
+            if total <= self.max_bytes:
+                break
+            if (kind, source_id, version) == keep:
+                continue
+            connection.execute('DELETE FROM artifacts WHERE kind = ? AND source_id = ? AND version = ?',
+                               (kind, source_id, version))
+            total -= size
+
+    def legacy_path(self, kind, source_id):
+        folder = self.legacy_folders.get(kind)
+        return os.path.join(folder, source_id + '.json') if folder else None
+
+    # import the JSON file of the old folder if the store has nothing newer.
+    # The arxiv/ files were named with or without the version of the paper
+    def import_legacy(self, kind, source_id, version=None, path=None):
+        paths = [path] if path else [self.legacy_path(kind, source_id)]
+        if kind == 'arxiv' and version and not path:
+            paths.append(self.legacy_path(kind, f"{source_id}v{version}"))
+        paths = [path for path in paths if path and os.path.exists(path)]
+        if not paths:
+            return False
+        path = paths[-1]
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return False
+        newest = self.connect().execute('SELECT MAX(created) FROM artifacts WHERE kind = ? AND source_id = ?',
+                                        (kind, source_id)).fetchone()[0]
+        if newest is not None and newest >= mtime:
+            return False
+        try:
+            with open(path) as file:
+                data = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Error: can not import {path}: {e}")
+            return False
+        # only an arXiv version can be trusted: the version asked for a PDF is the hash of the
+        # file looked up now, not of the one the old file was extracted from. An old PDF extraction
+        # is imported under the hash of the PDF of that name in pdfs/ when it is still there, the
+        # old files of the other kinds under their own content hash
+        if kind == 'pdf':
+            version = self.legacy_pdf_version(source_id)
+        elif kind != 'arxiv':
+            version = None
+        elif version is None and data.get('version'):
+            version = data['version']
+        self.put(kind, source_id, data, version, created=mtime)
+        return True
+
+    # the version of the PDF a json/ file was extracted from: the hash of pdfs/<pdf id>.pdf
+    # (the version pdf_reader gives it), or None when the PDF is gone
+    def legacy_pdf_version(self, source_id):
+        try:
+            with open(os.path.join(self.legacy_pdf_folder, source_id + '.pdf'), 'rb') as file:
+                return content_hash(file.read())[:16]
+        except OSError:
+            return None
+
+    # import every JSON file of the old folders, returns the number of imported artifacts
+    def migrate(self):
+        imported = 0
+        for kind, folder in self.legacy_folders.items():
+            if not os.path.isdir(folder):
+                continue
+            for name in sorted(os.listdir(folder)):
+                if name.endswith('.json'):
+                    source_id = name[:-len('.json')]
+                    if kind == 'arxiv':
+                        source_id = strip_version(source_id)
+                    imported += self.import_legacy(kind, source_id, path=os.path.join(folder, name))
+        return imported
+
+    # write an artifact back to its old folder, e.g. a transcript to edit by hand
+    def export(self, kind, source_id, version=None):
+        data = self.get(kind, source_id, version)
+        if data is None:
+            return None
+        path = self.legacy_path(kind, source_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump(data, file, indent=1)
+        return path
+
+# an arXiv id without its version, e.g. 2405.04434v2 -> 2405.04434
+def strip_version(arxiv_id):
+    base, _, version = arxiv_id.rpartition('v')
+    return base if base and version.isdigit() else arxiv_id
+
+store = ArtifactStore(os.environ.get('PAPERCAST_STORE', 'papercast.db'),
+                      max_bytes=int(os.environ.get('PAPERCAST_STORE_MAX_BYTES', 1024 * 1024 * 1024)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='The local store of papers and transcripts')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('migrate', help='import the arxiv/, json/, sciencedirect/ and transcript/ folders')
+    list_parser = commands.add_parser('list', help='list the stored artifacts')
+    list_parser.add_argument('kind', nargs='?', choices=list(legacy_folders))
+    list_parser.add_argument('--title', help='only the artifacts whose title contains this')
+    list_parser.add_argument('--limit', type=int, default=100)
+    export_parser = commands.add_parser('export', help='write an artifact back to its old folder')
+    export_parser.add_argument('kind', choices=list(legacy_folders))
+    export_parser.add_argument('source_id')
+    export_parser.add_argument('--version')
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        print(f"imported {store.migrate()} artifacts into {store.path}")
+    elif args.command == 'list':
+        for entry in store.find(args.kind, title=args.title, limit=args.limit):
+            created = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['created']))
+            print(f"{entry['kind']:<14} {entry['source_id']:<32} {entry['version']:<16} {created} "
+                  f"{entry['size'] / 1024:8.1f} KB  {entry['title'] or ''}")
+    else:
+        path = store.export(args.kind, args.source_id, args.version)
+        if path is None:
+            print(f"Error: no {args.kind} {args.source_id} in {store.path}")
+            sys.exit(1)
+        print(f"exported to {path}")
@@ -1,12 +1,19 @@
-import requests
-from bs4 import BeautifulSoup
+from lxml import etree
+import io
 import os
 import re
-import json
+import xml.etree.ElementTree as ET
+from urllib.parse import urlencode
 
-import arxiv
+from http_fetch import fetch_text
+from artifact_store import store, strip_version
+import telemetry
 import logging
 
+# arXiv endpoints, overridable to point the readers at a local stand-in
+arxiv_base_url = os.environ.get('ARXIV_BASE_URL', 'https://arxiv.org')
+arxiv_api_url = os.environ.get('ARXIV_API_URL', 'https://export.arxiv.org/api/query')
+
 # a tool function to parse arxiv id from a url of either abs or pdf
 def get_arxiv_id(url):
     if 'arxiv.org/abs' in url:
@@ -18,128 +25,189 @@ def get_arxiv_id(url):
     else:
         return None
 
+# versions already resolved in this process, so a batch can resolve all its ids up front
+known_versions = {}
+
+# get latest versions of many arxiv papers with one id_list query of the arxiv API
+# (up to batch_size ids per request), returns a dict of arxiv id -> version number.
+# Ids given with an explicit version (e.g. 2405.04434v1) keep it and are not looked up
+def get_latest_versions(arxiv_ids, batch_size=100):
+    versions = {}
+    atom = '{http://www.w3.org/2005/Atom}'
+    arxiv_ids = list(dict.fromkeys(arxiv_ids))
+    for arxiv_id in arxiv_ids:
+        base_id = strip_version(arxiv_id)
+        if base_id != arxiv_id:
+            versions[arxiv_id] = arxiv_id[len(base_id) + 1:]
+    lookup_ids = [arxiv_id for arxiv_id in arxiv_ids if arxiv_id not in versions]
+    for i in range(0, len(lookup_ids), batch_size):
+        batch = lookup_ids[i:i + batch_size]
+        feed = fetch_text(arxiv_api_url + '?' + urlencode({'id_list': ','.join(batch), 'max_results': len(batch)}),
+                          revalidate=False)
+        if not feed:
+            continue
+        for entry in ET.fromstring(feed).iter(atom + 'entry'):
+            entry_id = entry.findtext(atom + 'id', '')
+            match = re.search(r'(?:abs|pdf)/(.+?)v(\d+)$', entry_id)
+            if match:
+                versions[match.group(1)] = match.group(2)
+    versions = {arxiv_id: versions.get(arxiv_id) for arxiv_id in arxiv_ids}
+    known_versions.update((arxiv_id, version) for arxiv_id, version in versions.items() if version)
+    return versions
+
 # get latest version of an arxiv paper so HTML link can be right
 def get_latest_version(arxiv_id):
-    search = arxiv.Search(id_list=[arxiv_id])
-    for result in search.results():
-        match = re.search(r'v(\d+)$', result.entry_id)
-        if match:
-            return match.group(1)
-    return None
+    if arxiv_id in known_versions:
+        return known_versions[arxiv_id]
+    return get_latest_versions([arxiv_id]).get(arxiv_id)
 
 def construct_html_link(arxiv_id, version_number):
-    return f"https://arxiv.org/html/{arxiv_id}v{version_number}"
+    return f"{arxiv_base_url}/html/{arxiv_id}v{version_number}"
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+# fetch through the shared pooled session, revalidating a previously fetched page
 def fetch_html(url):
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.text
-    except requests.RequestException as e:
-        logging.error(f"Error fetching the HTML content: {e}")
-        return None
-
-def parse_html(html_content):
-    return BeautifulSoup(html_content, 'html.parser') if html_content else None
+    return fetch_text(url)
 
-def extract_title(soup):
-    title_tag = soup.title
-    return title_tag.string if title_tag else "No Title"
+# The extraction engine: a single streaming pass over the LaTeXML page with lxml iterparse.
+# The title, the authors, the abstract and the sections are collected as the parser reaches the
+# end of their elements, and every paragraph and section is cleared once its text is taken, so
+# memory stays at about the elements of the current section instead of a whole document tree.
+# Sections are nested (ltx_section > ltx_subsection > ltx_subsubsection ...), each with the
+# text of its own paragraphs only, so no text is extracted twice
+parsed_tags = ('title', 'span', 'div', 'section', 'h2', 'h3', 'h4', 'h5', 'h6', 'p')
+heading_tags = {'h2', 'h3', 'h4', 'h5', 'h6'}
 
 def clean_author_name(name):
     return re.sub(r'\u2020.*', '', name).strip()
 
-def extract_authors(soup):
-    authors = []
-    author_tags = soup.find_all('span', class_='ltx_personname')
-    if author_tags:
-        authors = [clean_author_name(author_tag.text) for author_tag in author_tags]
-    return authors if authors else ["No Authors"]
-
-def extract_abstract(soup):
-    abstract_tag = soup.find('div', class_='ltx_abstract')
-    return abstract_tag.text.strip() if abstract_tag else "No Abstract"
-
-def extract_sections(soup):
-    sections = {}
-    section_tags = soup.find_all('section', class_='ltx_section')
-    for section_tag in section_tags:
-        section_title_tag = section_tag.find('h2')
-        section_title = section_title_tag.text.strip() if section_title_tag else 'No Title'
-        section_title = re.sub(r'^\d+\s', '', section_title)  # Remove section numbering
-        section_id = section_tag.get('id', 'No ID')
-        section_content = ' '.join(p.text.strip() for p in section_tag.find_all('p'))
-        sections[section_title] = {
-            'content': section_content,
-            'id': section_id
-        }
-    return sections if sections else {"No Sections": {"content": "Content not available", "id": "No ID"}}
-
-def sections_to_markdown(sections):
+def element_text(element):
+    return ''.join(element.itertext())
+
+def new_section(element):
+    return {'title': None, 'id': element.get('id', 'No ID'), 'paragraphs': [], 'subsections': {}}
+
+# the section dict of the page: {title: {'content': text, 'id': id, 'subsections': {...}}}
+def finish_section(section):
+    return {'content': ' '.join(section['paragraphs']), 'id': section['id'],
+            'subsections': section['subsections']}
+
+# title, authors, abstract and nested sections of an arXiv HTML page
+def extract_html(html_content):
+    page = {'title': "No Title", 'authors': [], 'abstract': [], 'sections': {}}
+    # the open sections, None for a section element outside of the ltx_section tree (e.g. the bibliography)
+    stack = []
+    in_abstract = False
+    with telemetry.span('html_extract', chars=len(html_content)):
+        # the page is decoded already, tell lxml the encoding of the bytes instead of letting it guess
+        events = etree.iterparse(io.BytesIO(html_content.encode('utf-8')), events=('start', 'end'),
+                                 tag=parsed_tags, html=True, recover=True, encoding='utf-8')
+        for event, element in events:
+            tag = element.tag
+            if event == 'start':
+                if tag == 'section':
+                    nested = bool(stack) and stack[-1] is not None
+                    stack.append(new_section(element) if nested or 'ltx_section' in element.get('class', '').split()
+                                 else None)
+                elif tag == 'div' and 'ltx_abstract' in element.get('class', '').split():
+                    in_abstract = True
+                continue
+            section = stack[-1] if stack else None
+            if tag == 'p':
+                if section is not None:
+                    section['paragraphs'].append(element_text(element).strip())
+                elif in_abstract:
+                    page['abstract'].append(element_text(element).strip())
+                element.clear(keep_tail=True)
+            elif tag == 'section':
+                stack.pop()
+                if section is not None:
+                    title = section['title'] or 'No Title'
+                    parent = stack[-1] if stack else None
+                    (parent['subsections'] if parent is not None else page['sections'])[title] = finish_section(section)
+                element.clear(keep_tail=True)
+            elif tag in heading_tags:
+                if section is not None and section['title'] is None:
+                    # remove the section numbering, e.g. 2.1
+                    section['title'] = re.sub(r'^\d+(\.\d+)*\s', '', element_text(element).strip())
+            elif tag == 'span':
+                if 'ltx_personname' in element.get('class', '').split():
+                    page['authors'].append(clean_author_name(element_text(element)))
+            elif tag == 'div':
+                if in_abstract and 'ltx_abstract' in element.get('class', '').split():
+                    in_abstract = False
+            elif tag == 'title' and page['title'] == "No Title":
+                page['title'] = element_text(element)
+    page['authors'] = page['authors'] or ["No Authors"]
+    page['abstract'] = ' '.join(page['abstract']) or "No Abstract"
+    page['sections'] = page['sections'] or {"No Sections": {"content": "Content not available", "id": "No ID",
+                                                            "subsections": {}}}
+    return page
+
+# the (title, content) of every section and subsection in document order, without the empty ones
+def flatten_sections(sections):
+    flat = []
+    for title, section in sections.items():
+        if section['content'].strip():
+            flat.append((title, section['content']))
+        flat += flatten_sections(section.get('subsections', {}))
+    return flat
+
+def sections_to_markdown(sections, level=2):
     markdown_str = ""
     for title, data in sections.items():
-        markdown_str += f"## {title}\n\n"
-        markdown_str += f"{data['content']}\n\n"
+        markdown_str += f"{'#' * level} {title}\n\n"
+        if data['content']:
+            markdown_str += f"{data['content']}\n\n"
         markdown_str += f"*Section ID: {data['id']}*\n\n"
+        markdown_str += sections_to_markdown(data.get('subsections', {}), level + 1)
     return markdown_str
 
 def arxiv_to_json(arxiv_id):
     latest_version = get_latest_version(arxiv_id)
     print(latest_version)
-    url = construct_html_link(arxiv_id, latest_version)
+    url = construct_html_link(strip_version(arxiv_id), latest_version)
     print(url)
     html_content = fetch_html(url)
     if not html_content:
         # TODO: switch to PDF parser
         return {}
-    soup = parse_html(html_content)
-    if not soup:
-        return {}
-    
-    sections = extract_sections(soup)
-    markdown_content = sections_to_markdown(sections)
+    page = extract_html(html_content)
     data = {
         'arxiv_id': arxiv_id,
         'version': latest_version,
-        'title': extract_title(soup),
-        'authors': ';'.join(extract_authors(soup)),
-        'abstract': extract_abstract(soup),
-        'sections': sections,
-        'content': markdown_content
+        'title': page['title'],
+        'authors': ';'.join(page['authors']),
+        'abstract': page['abstract'],
+        'sections': page['sections'],
+        'content': sections_to_markdown(page['sections'])
     }
-    
+
     return data
 
 # given an arxiv url, get the arxiv id, title, author, abstract and content in a dictionary
 def get_arxiv(url, use_cache=True):
     arxiv_id = get_arxiv_id(url)
     print(arxiv_id)
-    # check if this id is already saved in the arxiv folder
+    # check if this id (and version, if the url has one) is already in the artifact store
     # if yes and allow cache, load it and return, otherwise, get the arxiv info and content
-    folder = 'arxiv'
-    
-    if os.path.exists(os.path.join(folder, arxiv_id + '.json')) and use_cache:
-        with open(os.path.join(folder, arxiv_id + '.json')) as file:
-            return json.load(file)
-    else:
-        return arxiv_to_json(arxiv_id)
-
-# save the arxiv dictionary to a json file with the file name as the arxiv id in a subfolder named 'arxiv'
-# if the subfolder does not exist, create it
+    if use_cache:
+        version = arxiv_id[len(strip_version(arxiv_id)) + 1:] or None
+        arxiv_dict = store.get('arxiv', strip_version(arxiv_id), version)
+        if arxiv_dict:
+            return arxiv_dict
+    arxiv_dict = arxiv_to_json(arxiv_id)
+    if arxiv_dict:
+        save_arxiv(arxiv_dict)
+    return arxiv_dict
+
+# save the arxiv dictionary in the artifact store, keyed by the arxiv id and version
 def save_arxiv(arxiv_dict):
-    import os
-    import json
-    folder = 'arxiv'
-    if not os.path.exists(folder):
-        os.makedirs(folder)
-    with open(os.path.join(folder, arxiv_dict['arxiv_id'] + '.json'), 'w') as file:
-        json.dump(arxiv_dict, file)
+    store.put('arxiv', strip_version(arxiv_dict['arxiv_id']), arxiv_dict, version=arxiv_dict.get('version'))
 
 if __name__ == '__main__':
     url = 'https://arxiv.org/abs/2405.04434'
     arxiv_dict = get_arxiv(url, use_cache=False)
     print(arxiv_dict)
-    save_arxiv(arxiv_dict)
@@ -0,0 +1,138 @@
+from run import load_config, generate_episode_transcript, apply_llm_settings, apply_tts_settings, llm_setting_keys
+from tts_gen import produce_audio, warmup
+from arxiv_reader import get_arxiv_id, get_latest_versions
+from episode_writer import get_output_path, output_duration
+import llm_funcs
+import telemetry
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
+import os
+import time
+
+# expand the command line arguments into a list of run yaml files,
+# a directory stands for all the yaml files in it
+def find_configs(paths):
+    config_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            config_paths += sorted(os.path.join(path, name) for name in os.listdir(path)
+                                   if name.endswith(('.yaml', '.yml')))
+        else:
+            config_paths.append(path)
+    return config_paths
+
+# the LLM stage of one episode, run on the thread pool
+def timed_transcript(config):
+    start_time = time.perf_counter()
+    episode_id, parsed_transcript = generate_episode_transcript(config)
+    return episode_id, parsed_transcript, time.perf_counter() - start_time
+
+# Run many episodes as a pipeline: the network and LLM bound stages (fetch, summary,
+# transcript) of all the episodes run on a thread pool, while this thread acts as the single
+# TTS worker (the model is loaded once, in the background while the first transcripts are
+# written) and synthesizes each transcript as soon as it is finished, so the LLM work of
+# the next episodes overlaps the synthesis of the current one.
+# The TTS settings of each yaml (clip_cache, tts_pipeline, tts_workers, tts_server) are applied
+# before its episode is synthesized. The LLM settings are shared by the episodes written at the
+# same time, so they are applied once for the batch (see apply_batch_llm_settings)
+def run_batch(config_paths, llm_workers=4):
+    start_time = time.perf_counter()
+    warmup()
+    configs = {path: load_config(path) for path in config_paths}
+    apply_batch_llm_settings(configs)
+    if any(config['trace'] for config in configs.values()):
+        telemetry.enable()
+    # resolve the latest versions of all the arxiv papers with a single API query
+    urls = [url for config in configs.values()
+            for url in (config['url'] if isinstance(config['url'], list) else [config['url']])]
+    arxiv_ids = [get_arxiv_id(url) for url in urls if url.startswith('https://arxiv.org/')]
+    if arxiv_ids:
+        get_latest_versions(arxiv_ids)
+    results = []
+    with ThreadPoolExecutor(max_workers=llm_workers) as pool:
+        futures = {pool.submit(timed_transcript, config): path for path, config in configs.items()}
+        for future in as_completed(futures):
+            path = futures[future]
+            config = configs[path]
+            try:
+                episode_id, parsed_transcript, llm_seconds = future.result()
+            except Exception as e:
+                print(f"Error: failed to generate the transcript for {path}: {e}")
+                results.append({'config': path, 'error': str(e)})
+                continue
+
+            tts_start_time = time.perf_counter()
+            try:
+                apply_tts_settings(config)
+                produce_audio(parsed_transcript, audio_filename=episode_id+'.wav', offset=config['audio_offset'],
+                              batch_size=config['tts_batch_size'], master=config['master'],
+                              mix=config['mix'], audio_format=config['audio_format'],
+                              segment_seconds=config['segment_seconds'])
+                tts_seconds = time.perf_counter() - tts_start_time
+                audio_seconds = output_duration(get_output_path(episode_id+'.wav', config['audio_format'],
+                                                                config['segment_seconds']))
+            except Exception as e:
+                # the transcripts of the other episodes are still synthesized
+                print(f"Error: failed to produce the audio of {episode_id} ({path}): {e}")
+                results.append({'config': path, 'episode_id': episode_id, 'error': str(e)})
+                continue
+            results.append({
+                'config': path,
+                'episode_id': episode_id,
+                'lines': len(parsed_transcript),
+                'llm_seconds': llm_seconds,
+                'tts_seconds': tts_seconds,
+                'audio_seconds': audio_seconds,
+                'finished_at': time.perf_counter() - start_time,
+            })
+            print(f"finished episode {episode_id} ({path}) after {results[-1]['finished_at']:.1f}s")
+
+    report(results, time.perf_counter() - start_time)
+    return results
+
+# apply the LLM settings (llm_cache, map_reduce_threshold_tokens, ...) of the yaml files when they
+# all agree, otherwise warn about the differing keys and keep the defaults for the whole batch
+def apply_batch_llm_settings(configs):
+    differing = [key for key in llm_setting_keys if len({repr(config[key]) for config in configs.values()}) > 1]
+    if not differing:
+        if configs:
+            apply_llm_settings(next(iter(configs.values())))
+        return
+    for key in differing:
+        values = ', '.join(f"{os.path.basename(path)}: {config[key]}" for path, config in configs.items())
+        print(f"Warning: the batch configs differ in {key} ({values}), "
+              f"the episodes share the LLM stage settings so the default is used for all of them")
+
+def report(results, wall_seconds):
+    finished = [result for result in results if 'error' not in result]
+    print(f"\n{'config':<40} {'lines':>6} {'llm (s)':>9} {'tts (s)':>9} {'audio (s)':>10} {'done at (s)':>12}")
+    for result in results:
+        if 'error' in result:
+            print(f"{result['config']:<40} failed: {result['error']}")
+            continue
+        print(f"{result['config']:<40} {result['lines']:>6} {result['llm_seconds']:>9.1f} "
+              f"{result['tts_seconds']:>9.1f} {result['audio_seconds']:>10.1f} {result['finished_at']:>12.1f}")
+
+    serial_seconds = sum(result['llm_seconds'] + result['tts_seconds'] for result in finished)
+    audio_seconds = sum(result['audio_seconds'] for result in finished)
+    print(f"\n{len(finished)}/{len(results)} episodes in {wall_seconds:.1f}s "
+          f"({serial_seconds:.1f}s if run one after another)")
+    if finished:
+        print(f"throughput: {len(finished) * 3600 / wall_seconds:.1f} episodes/hour, "
+              f"{audio_seconds / wall_seconds:.2f}s of audio per second")
+    print('LLM response cache:', llm_funcs.llm_cache.stats())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Produce many episodes from run yaml files or directories of them')
+    parser.add_argument('configs', nargs='+', help='run yaml files or directories of run yaml files')
+    parser.add_argument('--llm-workers', type=int, default=4, help='episodes in the LLM stage at the same time')
+    parser.add_argument('--trace', action='store_true', help='write a json trace of every stage to traces/')
+    args = parser.parse_args()
+
+    if args.trace:
+        telemetry.enable()
+    run_batch(find_configs(args.configs), llm_workers=args.llm_workers)
+    if telemetry.enabled:
+        telemetry.print_summary()
+        telemetry.write_trace(os.path.join('traces', f"batch-{time.strftime('%Y%m%d-%H%M%S')}.json"))
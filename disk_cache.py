@@ -0,0 +1,102 @@
+import os
+import json
+import hashlib
+import threading
+
+# a tool function to hash any json serializable values into a hex cache key
+def hash_key(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+# A content-addressed cache of files in a folder, bounded by the total size in bytes.
+# Every entry is a file named by its key; a hit touches the file's mtime so
+# the least recently used entries are evicted first when the cache is full.
+# Writes go through a temporary file and os.replace, so concurrent runs never
+# read a partially written entry
+class DiskCache:
+    def __init__(self, folder, max_bytes=512 * 1024 * 1024, suffix=''):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.size = None
+        self.lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.folder, key[:2], key + self.suffix)
+
+    # the open file of an entry, to read a large one in parts, or None
+    def open(self, key):
+        path = self.path(key)
+        try:
+            os.utime(path)
+            file = open(path, 'rb')
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return file
+
+    def get(self, key):
+        file = self.open(key)
+        if file is None:
+            return None
+        with file:
+            return file.read()
+
+    def put(self, key, data):
+        self.put_chunks(key, [data])
+
+    # write an entry from an iterable of bytes, without holding all of it in memory
+    def put_chunks(self, key, chunks):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        size = 0
+        with open(tmp_path, 'wb') as file:
+            for chunk in chunks:
+                file.write(chunk)
+                size += len(chunk)
+        os.replace(tmp_path, path)
+        with self.lock:
+            if self.size is None:
+                self.size = self.total_size()
+            else:
+                self.size += size
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def entries(self):
+        entries = []
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def total_size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    # delete the least recently used entries until the cache fits in max_bytes
+    def evict(self):
+        entries = sorted(self.entries())
+        self.size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+
+    def stats(self):
+        return f"{self.hits} hits, {self.misses} misses"
@@ -0,0 +1,243 @@
+import os
+import math
+import shutil
+import numpy as np
+import soundfile
+import telemetry
+
+def format_srt_time(seconds):
+    return "{:02d}:{:02d}:{:02d},{:03d}".format(int(seconds//3600), int((seconds//60)%60), int(seconds%60),
+                                                int((seconds*1000)%1000))
+
+# the audio formats of an episode: soundfile format, subtype and file extension
+output_formats = {
+    'wav': ('WAV', 'PCM_16', 'wav'),
+    'flac': ('FLAC', 'PCM_16', 'flac'),
+    'opus': ('OGG', 'OPUS', 'opus'),
+}
+
+# the episode file for an audio file name like 1706.03762.wav: the same name with the extension
+# of the format, or the playlist of the segments
+def get_output_path(audio_filename, audio_format='wav', segment_seconds=None, folder='audio'):
+    base = os.path.splitext(audio_filename)[0]
+    extension = 'm3u8' if segment_seconds else output_formats[audio_format][2]
+    return os.path.join(folder, f"{base}.{extension}")
+
+# duration in seconds of an episode file or playlist
+def output_duration(path):
+    if not path.endswith('.m3u8'):
+        return soundfile.info(path).duration
+    with open(path) as file:
+        return sum(float(line[len('#EXTINF:'):].split(',')[0]) for line in file if line.startswith('#EXTINF:'))
+
+def write_srt(file, entries):
+    for number, (start_time, end_time, text) in enumerate(entries, 1):
+        file.write(f"{number}\n{format_srt_time(start_time)} --> {format_srt_time(end_time)}\n{text}\n\n")
+
+# The audio of an episode in one of output_formats, encoded as it is written. Either one file
+# (written to a .part file moved in place on close), or with segment_seconds a folder of
+# fixed-duration segments listed in an HLS-style playlist that is rewritten as every segment is
+# finished, so a player can start on the first segments while the episode is still produced:
+#   audio/1706.03762.m3u8
+#   audio/1706.03762/segment_00001.opus, audio/1706.03762/segment_00001.srt ...
+# Every segment has its own SRT with the subtitles (added with add_subtitle before their audio)
+# that overlap it, in times relative to the start of the segment. close(keep=False) removes what
+# was written and leaves the output of a previous run as it was
+class AudioOutput:
+    def __init__(self, path, sample_rate=24000, audio_format='wav', segment_seconds=None, subtype=None):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.format, default_subtype, self.extension = output_formats[audio_format]
+        self.subtype = subtype or default_subtype
+        self.segment_samples = int(segment_seconds * sample_rate) if segment_seconds else None
+        self.subtitles = []
+        self.segments = []
+        self.file = None
+        self.file_samples = 0
+        self.bytes_written = 0
+        if self.segment_samples:
+            self.folder = os.path.splitext(path)[0]
+            self.set_aside_previous()
+            os.makedirs(self.folder)
+        else:
+            self.file = self.open(path + '.part')
+
+    # The segments and playlist of a previous run are moved aside to <id>.prev and <id>.m3u8.prev
+    # while the new ones are written in their place (so the live playlist keeps its path), then
+    # dropped when the episode is complete, or moved back if it fails. After a crashed run the
+    # .prev copies are the previous output and the partial segments next to them are dropped
+    def set_aside_previous(self):
+        self.previous = (self.folder + '.prev', self.path + '.prev')
+        if os.path.exists(self.previous[0]):
+            shutil.rmtree(self.folder, ignore_errors=True)
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        for path, previous_path in zip((self.folder, self.path), self.previous):
+            if os.path.exists(path):
+                os.replace(path, previous_path)
+
+    def drop_previous(self):
+        shutil.rmtree(self.previous[0], ignore_errors=True)
+        if os.path.exists(self.previous[1]):
+            os.remove(self.previous[1])
+
+    def restore_previous(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        for path, previous_path in zip((self.folder, self.path), self.previous):
+            if os.path.exists(previous_path):
+                os.replace(previous_path, path)
+
+    def open(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        return soundfile.SoundFile(path, 'w', samplerate=self.sample_rate, channels=1,
+                                   format=self.format, subtype=self.subtype)
+
+    def segment_path(self, number, extension):
+        return os.path.join(self.folder, f"segment_{number:05d}.{extension}")
+
+    def add_subtitle(self, start_time, end_time, text):
+        self.subtitles.append((start_time, end_time, text))
+
+    def write(self, audio):
+        if not self.segment_samples:
+            self.file.write(audio)
+            self.file_samples += len(audio)
+            return
+        while len(audio):
+            if self.file is None:
+                self.file = self.open(self.segment_path(len(self.segments) + 1, self.extension))
+                self.file_samples = 0
+            part = audio[:self.segment_samples - self.file_samples]
+            self.file.write(part)
+            self.file_samples += len(part)
+            audio = audio[len(part):]
+            if self.file_samples == self.segment_samples:
+                self.finish_segment()
+
+    def finish_segment(self):
+        self.file.close()
+        self.file = None
+        number = len(self.segments) + 1
+        path = self.segment_path(number, self.extension)
+        self.bytes_written += os.path.getsize(path)
+        start = self.segment_samples * (number - 1) / self.sample_rate
+        duration = self.file_samples / self.sample_rate
+        entries = [(max(start_time, start) - start, min(end_time, start + duration) - start, text)
+                   for start_time, end_time, text in self.subtitles
+                   if start_time < start + duration and end_time > start]
+        with open(self.segment_path(number, 'srt'), 'w') as file:
+            write_srt(file, entries)
+        self.segments.append((os.path.basename(path), duration))
+        self.write_playlist(complete=False)
+
+    def write_playlist(self, complete):
+        target_duration = math.ceil(max([duration for _, duration in self.segments], default=0))
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', f"#EXT-X-TARGETDURATION:{target_duration}",
+                 '#EXT-X-MEDIA-SEQUENCE:0', '#EXT-X-PLAYLIST-TYPE:' + ('VOD' if complete else 'EVENT')]
+        folder = os.path.basename(self.folder)
+        for name, duration in self.segments:
+            lines += [f"#EXTINF:{duration:.3f},", f"{folder}/{name}"]
+        if complete:
+            lines.append('#EXT-X-ENDLIST')
+        tmp_path = self.path + '.part'
+        with open(tmp_path, 'w') as file:
+            file.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.path)
+
+    def close(self, keep=True):
+        if not self.segment_samples:
+            self.file.close()
+            if keep:
+                os.replace(self.path + '.part', self.path)
+                self.bytes_written = os.path.getsize(self.path)
+            else:
+                os.remove(self.path + '.part')
+            return
+        if self.file is not None:
+            self.finish_segment()
+        if keep:
+            self.write_playlist(complete=True)
+            self.drop_previous()
+        else:
+            self.restore_previous()
+
+# Write an episode clip by clip: every clip is appended to the open audio file as soon as it is
+# synthesized (encoded in audio_format, and cut into segments with segment_seconds, see
+# AudioOutput), and its SRT entry and refined text line are written along with it, so memory stays
+# at one clip whatever the episode length. Everything is written to .part files that are moved
+# in place when the episode is complete; an error removes them and leaves the files of a
+# previous run untouched.
+#   with EpisodeWriter('1706.03762.wav', offset=12) as writer:
+#       writer.add(text, audio, refined_text)
+class EpisodeWriter:
+    def __init__(self, audio_filename, offset=0, sample_rate=24000, folder='audio', subtype=None,
+                 audio_format='wav', segment_seconds=None, audio_path=None):
+        self.sample_rate = sample_rate
+        self.offset = offset
+        self.subtype = subtype
+        self.audio_format = audio_format
+        self.segment_seconds = segment_seconds
+        self.paths = {
+            'audio': audio_path or get_output_path(audio_filename, audio_format, segment_seconds, folder),
+            'srt': os.path.join(folder, f"subtitle_{audio_filename}.srt"),
+            'text': os.path.join(folder, f"refined_text_{audio_filename}.txt"),
+        }
+        self.time = offset
+        self.entries = 0
+        self.samples = 0
+        # sum of the squared samples, for the loudness of the whole episode
+        self.sum_squares = 0.0
+        self.refined_texts = []
+        # (start, end, text) of every subtitle, in the times of the SRT file
+        self.subtitles = []
+
+    def __enter__(self):
+        self.audio = AudioOutput(self.paths['audio'], self.sample_rate, self.audio_format, self.segment_seconds,
+                                 self.subtype)
+        self.srt_file = open(self.paths['srt'] + '.part', 'w')
+        self.text_file = open(self.paths['text'] + '.part', 'w')
+        if self.offset > 0: # from zero to offset time, there is music, just show [MUSIC]
+            self.write_srt_entry(0, self.offset, '[AI GENERATED MUSIC]')
+        return self
+
+    def write_srt_entry(self, start_time, end_time, text):
+        self.entries += 1
+        self.srt_file.write(f"{self.entries}\n")
+        self.srt_file.write(f"{format_srt_time(start_time)} --> {format_srt_time(end_time)}\n")
+        self.srt_file.write(f"{text}\n\n")
+        self.subtitles.append((start_time, end_time, text))
+        # the audio written here starts at offset, where the music ends
+        self.audio.add_subtitle(start_time - self.offset, end_time - self.offset, text)
+
+    # append one clip with the transcript text of its subtitle
+    def add(self, text, audio, refined_text):
+        audio = np.asarray(audio).flatten()
+        duration = len(audio) / self.sample_rate
+        with telemetry.span('write_clip', audio_seconds=round(duration, 3)):
+            print(format_srt_time(self.time), '-->', format_srt_time(self.time + duration))
+            self.write_srt_entry(self.time, self.time + duration, text)
+            self.audio.write(audio)
+            self.text_file.write(f"{refined_text}\n")
+        self.time += duration
+        self.samples += len(audio)
+        self.sum_squares += float(np.dot(audio, audio))
+        self.refined_texts.append(refined_text)
+
+    def close(self, keep=True):
+        with telemetry.span('finalize_episode', audio_seconds=round(self.samples / self.sample_rate, 3)):
+            self.audio.close(keep)
+            for file in (self.srt_file, self.text_file):
+                file.close()
+            for name in ['srt', 'text']:
+                path = self.paths[name]
+                if keep:
+                    os.replace(path + '.part', path)
+                elif os.path.exists(path + '.part'):
+                    os.remove(path + '.part')
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close(keep=exc_type is None)
+        return False
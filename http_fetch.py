@@ -0,0 +1,112 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+import requests
+import telemetry
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (connect, read) timeouts in seconds for every request
+timeout = (10, 60)
+
+# One pooled session shared by all the readers, retrying connection errors and
+# 429/5xx responses with exponential backoff (1s, 2s, 4s...)
+session = requests.Session()
+retry = Retry(total=4, backoff_factor=1.0, status_forcelist=(429, 500, 502, 503, 504),
+              allowed_methods=frozenset(['GET', 'HEAD']), respect_retry_after_header=True)
+adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=retry)
+session.mount('http://', adapter)
+session.mount('https://', adapter)
+session.headers['User-Agent'] = 'papercast (https://github.com/phunterlau/papercast)'
+
+# fetched pages are kept here with their ETag / Last-Modified for revalidation
+http_cache_dir = os.environ.get('PAPERCAST_HTTP_CACHE_DIR', 'http_cache')
+
+def load_meta(meta_path):
+    try:
+        with open(meta_path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def save_meta(meta_path, response):
+    meta = {
+        'url': response.url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+    tmp_path = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(meta, file)
+    os.replace(tmp_path, meta_path)
+
+# the request headers to revalidate a local copy described by meta
+def conditional_headers(meta):
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    return headers
+
+# GET a text page through the shared session. The page is kept in http_cache and the
+# next fetch of the same url sends If-None-Match / If-Modified-Since, so an unchanged
+# page costs a 304 instead of a full download. Returns None if the request fails
+def fetch_text(url, revalidate=True):
+    key = hashlib.sha256(url.encode()).hexdigest()
+    body_path = os.path.join(http_cache_dir, key + '.body')
+    meta_path = os.path.join(http_cache_dir, key + '.json')
+    meta = load_meta(meta_path) if revalidate and os.path.exists(body_path) else {}
+    with telemetry.span('fetch', url=url) as span:
+        try:
+            response = session.get(url, headers=conditional_headers(meta), timeout=timeout)
+            span.set(status=str(response.status_code), bytes=len(response.content))
+            if response.status_code == 304 and meta:
+                with open(body_path, encoding='utf-8') as file:
+                    return file.read()
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logging.error(f"Error fetching {url}: {e}")
+            return None
+
+    text = response.text
+    if revalidate and (response.headers.get('ETag') or response.headers.get('Last-Modified')):
+        os.makedirs(http_cache_dir, exist_ok=True)
+        tmp_path = f"{body_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        os.replace(tmp_path, body_path)
+        save_meta(meta_path, response)
+    return text
+
+# Stream a (binary) file such as a PDF to file_path in chunks instead of buffering it in memory.
+# An existing copy with a saved ETag / Last-Modified is revalidated and kept on 304.
+# The file is written to a temporary name of its own and moved in place, so a failed or
+# concurrent download of the same url never leaves a truncated file. Returns True on success
+def download_file(url, file_path, chunk_size=1024 * 1024):
+    meta_path = file_path + '.meta.json'
+    meta = load_meta(meta_path) if os.path.exists(file_path) else {}
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with telemetry.span('fetch', url=url) as span, \
+                session.get(url, headers=conditional_headers(meta), timeout=timeout, stream=True) as response:
+            span.set(status=str(response.status_code))
+            if response.status_code == 304 and meta:
+                return True
+            response.raise_for_status()
+            size = 0
+            with open(tmp_path, 'wb') as file:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    file.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, file_path)
+            save_meta(meta_path, response)
+            span.set(bytes=size)
+        return True
+    except (requests.RequestException, OSError) as e:
+        logging.error(f"Error downloading {url}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
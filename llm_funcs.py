@@ -1,12 +1,57 @@
-import openai
+from disk_cache import DiskCache, hash_key
+import telemetry
+import threading
 import os
 
-client = openai.OpenAI(api_key=os.environ['OPENAI_API_KEY'])
+# The OpenAI client is created on the first request, so importing this module needs
+# neither the openai package import time nor OPENAI_API_KEY (e.g. a run from the transcript cache)
+client = None
+client_lock = threading.Lock()
+
+def get_client():
+    global client
+    with client_lock:
+        if client is None:
+            import openai
+            client = openai.OpenAI(api_key=os.environ['OPENAI_API_KEY'])
+    return client
+
+# On-disk response cache keyed by a hash of the whole request (model, messages,
+# temperature, max_tokens, response_format...), so re-running an episode only pays
+# for the calls whose inputs changed. Calls sampled with a temperature above
+# llm_cache_max_temperature are never cached, None caches every call
+llm_cache = DiskCache(os.environ.get('PAPERCAST_LLM_CACHE_DIR', 'llm_cache'),
+                      max_bytes=int(os.environ.get('PAPERCAST_LLM_CACHE_MAX_BYTES', 256 * 1024 * 1024)),
+                      suffix='.json')
+llm_cache_enabled = os.environ.get('PAPERCAST_LLM_CACHE', '1') != '0'
+llm_cache_max_temperature = None
+
+# send a chat completion request, going through the response cache if allowed.
+# use_cache=None follows the module settings, True/False forces it for this call
+def create_chat_completion(use_cache=None, **request):
+    if use_cache is None:
+        use_cache = llm_cache_enabled and (llm_cache_max_temperature is None
+                                           or request['temperature'] <= llm_cache_max_temperature)
+    with telemetry.span('llm_call', model=request['model'], max_tokens=request['max_tokens']) as span:
+        key = hash_key(request) if use_cache else None
+        cached = llm_cache.get(key) if use_cache else None
+        if cached is not None:
+            from openai.types.chat import ChatCompletion
+            response = ChatCompletion.model_validate_json(cached)
+        else:
+            response = get_client().chat.completions.create(**request)
+            if use_cache:
+                llm_cache.put(key, response.model_dump_json().encode())
+        if response.usage:
+            span.set(prompt_tokens=response.usage.prompt_tokens,
+                     completion_tokens=response.usage.completion_tokens)
+        span.set(cache_hit=cached is not None)
+    return response
 
 def gen_gpt_chat_completion(system_prompt, user_prompt, temp=0.1, engine="gpt-4o", max_tokens=2048,
-                            top_p=1, frequency_penalty=0, presence_penalty=0,):
+                            top_p=1, frequency_penalty=0, presence_penalty=0, use_cache=None):
     
-    response = client.chat.completions.create(
+    response = create_chat_completion(use_cache,
                     model="gpt-4o",
                     messages=[{"role":"system", "content":system_prompt},
                             {"role":"user", "content":user_prompt}],
@@ -19,9 +64,9 @@ def gen_gpt_chat_completion(system_prompt, user_prompt, temp=0.1, engine="gpt-4o
 
 # json mode
 def gen_gpt_chat_json(system_prompt, user_prompt, temp=0.1, engine="gpt-4o", max_tokens=2048,
-                            top_p=1, frequency_penalty=0, presence_penalty=0,):
+                            top_p=1, frequency_penalty=0, presence_penalty=0, use_cache=None):
     
-    response = client.chat.completions.create(
+    response = create_chat_completion(use_cache,
                     model="gpt-4o",
                     response_format={ "type": "json_object" },
                     messages=[{"role":"system", "content":system_prompt},
@@ -31,4 +76,41 @@ def gen_gpt_chat_json(system_prompt, user_prompt, temp=0.1, engine="gpt-4o", max
                     top_p=1,
                     frequency_penalty=0,
                     presence_penalty=0)
-    return response
\ No newline at end of file
+    return response
+
+# streaming mode, yield the content of each chunk as soon as the model produces it.
+# a cached response is replayed as a single chunk
+def gen_gpt_chat_stream(system_prompt, user_prompt, temp=0.1, engine="gpt-4o", max_tokens=2048,
+                        top_p=1, frequency_penalty=0, presence_penalty=0, use_cache=None):
+
+    request = dict(model="gpt-4o",
+                   messages=[{"role":"system", "content":system_prompt},
+                           {"role":"user", "content":user_prompt}],
+                   temperature=temp,
+                   max_tokens=max_tokens,
+                   top_p=1,
+                   frequency_penalty=0,
+                   presence_penalty=0,
+                   stream=True)
+    if use_cache is None:
+        use_cache = llm_cache_enabled and (llm_cache_max_temperature is None
+                                           or temp <= llm_cache_max_temperature)
+    key = hash_key(request)
+    if use_cache:
+        cached = llm_cache.get(key)
+        if cached is not None:
+            telemetry.record('llm_call', 0, model=request['model'], max_tokens=max_tokens, cache_hit=True, stream=True)
+            yield cached.decode()
+            return
+
+    chunks = []
+    with telemetry.span('llm_call', model=request['model'], max_tokens=max_tokens, cache_hit=False, stream=True) as span:
+        for chunk in get_client().chat.completions.create(**request):
+            if chunk.choices and chunk.choices[0].delta.content:
+                if not chunks:
+                    span.set(first_token_seconds=telemetry.elapsed(span))
+                chunks.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+        span.set(completion_chunks=len(chunks))
+    if use_cache:
+        llm_cache.put(key, ''.join(chunks).encode())
@@ -0,0 +1,129 @@
+import os
+import re
+import json
+import time
+import threading
+from disk_cache import hash_key
+
+# The manifest of a run: every stage of an episode (the parsed document, the topic, the research
+# questions, each pass, the transcript, each synthesized clip, the audio) is recorded once it has
+# finished, with a hash of its inputs, and its result is kept next to the manifest. A crashed or
+# killed run started again with run.py --resume reuses the stages whose inputs hash is unchanged
+# and restarts from the first incomplete one. The results of the upstream stages are part of the
+# inputs of the downstream ones, so a changed input (an edited prompt, another PDF file) reruns
+# its stage and what depends on it, and nothing else.
+#   runs/<run_id>/manifest.json        {stage: {'inputs': hash, 'file': path, 'finished': time, 'seconds': s}}
+#   runs/<run_id>/stages/<stage>.json  the result of a stage
+#   runs/<run_id>/clips/<clip key>.npz the synthesized clips, until the episode is written, when
+#                                      the clip cache (which a resumed run reads too) is off
+runs_folder = os.environ.get('PAPERCAST_RUNS_DIR', 'runs')
+
+class RunManifest:
+    def __init__(self, run_id, resume=False, folder=runs_folder):
+        self.run_id = run_id
+        self.folder = os.path.join(folder, run_id)
+        self.path = os.path.join(self.folder, 'manifest.json')
+        self.lock = threading.Lock()
+        # the stages reused from the previous run
+        self.restored = set()
+        self.restored_clips = 0
+        self.stages = self.load() if resume else {}
+        if resume:
+            print(f"resuming run {run_id}: {len(self.stages)} stages already complete in {self.path}")
+        else:
+            # a fresh run drops the stage records of an earlier one, but not its files: another
+            # run of the same episode may be using them, and the files are overwritten as the
+            # stages finish again (the clips are content addressed, so a clip found is still valid)
+            with self.lock:
+                self.write_manifest()
+
+    def load(self):
+        try:
+            with open(self.path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    # write a file of the run folder through a temporary file, so a crash never leaves half of it
+    def write_file(self, relative_path, data):
+        path = os.path.join(self.folder, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    def read_file(self, relative_path):
+        try:
+            with open(os.path.join(self.folder, relative_path), 'rb') as file:
+                return file.read()
+        except OSError:
+            return None
+
+    # record a finished stage; without flush it is only written with the next flushed one
+    def record(self, name, inputs, relative_path=None, seconds=0.0, flush=True):
+        with self.lock:
+            self.stages[name] = {'inputs': hash_key(inputs), 'file': relative_path,
+                                 'finished': time.time(), 'seconds': round(seconds, 3)}
+            if flush:
+                self.write_manifest()
+
+    # called with the lock held
+    def write_manifest(self):
+        self.write_file('manifest.json', json.dumps(self.stages, indent=1).encode('utf-8'))
+
+    def is_complete(self, name, inputs):
+        stage = self.stages.get(name)
+        return stage is not None and stage['inputs'] == hash_key(inputs)
+
+    # the result of a stage: the recorded one if its inputs are unchanged, otherwise
+    # function() is called and its result recorded (None results, i.e. failures, are not)
+    def run(self, name, inputs, function):
+        if self.is_complete(name, inputs):
+            data = self.read_file(self.stages[name]['file'])
+            if data is not None:
+                print(f"stage {name} restored from {self.folder}")
+                with self.lock:
+                    self.restored.add(name)
+                return json.loads(data)['result']
+        start_time = time.perf_counter()
+        result = function()
+        if result is not None:
+            relative_path = os.path.join('stages', re.sub(r'[^\w.-]', '_', name) + '.json')
+            self.write_file(relative_path, json.dumps({'result': result}).encode('utf-8'))
+            self.record(name, inputs, relative_path, time.perf_counter() - start_time)
+        return result
+
+    # the synthesized clips are content addressed by their clip cache key (see tts_gen.get_clip_key),
+    # so a line moved by an edit of the transcript is still found. They are found by their file,
+    # not by the manifest, which is only rewritten with the next stage instead of once per clip
+    def load_clip(self, key):
+        data = self.read_file(os.path.join('clips', key + '.npz'))
+        if data is not None:
+            with self.lock:
+                self.restored_clips += 1
+        return data
+
+    def save_clip(self, name, key, data):
+        relative_path = os.path.join('clips', key + '.npz')
+        self.write_file(relative_path, data)
+        self.record(name, key, relative_path, flush=False)
+
+    # the clips are in the episode once it is written, keep the manifest only. Only the clips
+    # recorded by this run are removed, another run of the episode may be writing its own
+    def remove_clips(self):
+        with self.lock:
+            clips = [stage['file'] for name, stage in self.stages.items() if name.startswith('clip_')]
+            self.stages = {name: stage for name, stage in self.stages.items() if not name.startswith('clip_')}
+            self.write_manifest()
+        for relative_path in clips:
+            try:
+                os.remove(os.path.join(self.folder, relative_path))
+            except OSError:
+                pass
+
+# run a stage through the manifest of the run, or just run it without one
+def checkpoint(manifest, name, inputs, function):
+    if manifest is None:
+        return function()
+    return manifest.run(name, inputs, function)
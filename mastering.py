@@ -0,0 +1,220 @@
+import argparse
+import numpy as np
+import soundfile
+import os
+
+# Mastering of a finished episode with vectorized NumPy instead of pydub's per-sample loop:
+#   1. gain normalization to a target loudness (dBFS of the whole episode)
+#   2. a compressor after pydub's compress_dynamic_range: the level is the RMS of the trailing
+#      attack window, and the gain reduction is the peak of the last quarter of the release time
+#      while the level is above the threshold, held at its last value while it is below (pydub
+#      only releases above the threshold), for at most compressor_hold_ms
+#   3. a lookahead peak limiter that keeps every sample under the ceiling
+# Long files are processed in blocks with enough surrounding context that the result matches
+# processing the whole array at once, so memory does not grow with the episode length.
+#   python mastering.py audio/1706.03762.wav audio/1706.03762_mastered.wav --target-dbfs -10
+
+default_settings = {
+    'target_dbfs': -10.0,
+    'threshold': -20.0,  # dBFS
+    'ratio': 4.0,
+    'attack': 5.0,  # ms
+    'release': 50.0,  # ms
+    'ceiling': -1.0,  # dBFS, None to only clip at full scale
+}
+
+limiter_lookahead_ms = 2.0
+# pydub holds the gain reduction through any quiet passage, here for at most this long, so that
+# a block only needs this much context (see context_samples)
+compressor_hold_ms = 5000.0
+
+def db_to_gain(db):
+    return 10 ** (db / 20)
+
+def gain_to_db(gain):
+    return 20 * np.log10(gain)
+
+# loudness of float audio in dBFS, from the sum of squares so it can be accumulated clip by clip
+def dbfs(sum_squares, samples):
+    if samples == 0 or sum_squares == 0:
+        return -np.inf
+    return float(gain_to_db(np.sqrt(sum_squares / samples)))
+
+# the gain that brings audio of this loudness to target_dbfs; silence (-inf dBFS) is left as it is
+def normalization_gain_db(target_dbfs, loudness_dbfs):
+    return 0.0 if np.isinf(loudness_dbfs) else target_dbfs - loudness_dbfs
+
+# out[n] = max(x[n - window + 1 .. n]) in O(n) whatever the window (van Herk / Gil-Werman):
+# the padded signal is cut into blocks of the window length, and every window is covered by
+# the suffix max of one block and the prefix max of the next
+def sliding_max(x, window):
+    if window <= 1:
+        return x.copy()
+    n = len(x)
+    padded_length = -(-(n + window - 1) // window) * window
+    padded = np.full(padded_length, -np.inf)
+    padded[window - 1:window - 1 + n] = x
+    blocks = padded.reshape(-1, window)
+    prefix = np.maximum.accumulate(blocks, axis=1).ravel()
+    suffix = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    return np.maximum(suffix[:n], prefix[window - 1:window - 1 + n])
+
+# out[n] = min(x[n .. n + window - 1])
+def lookahead_min(x, window):
+    return -sliding_max(-x[::-1], window)[::-1]
+
+# out[n] = mean(x[n - window + 1 .. n]), the first values padded with x[0]
+def moving_average(x, window):
+    if window <= 1:
+        return x.copy()
+    cumsum = np.cumsum(np.concatenate([np.full(window, x[0]), x]))
+    return (cumsum[window:] - cumsum[:-window]) / window
+
+# pydub's compressor is a per-sample loop: the reduction climbs to its target in the attack
+# time, falls by target / release per sample while the level is above the threshold and the
+# reduction above its target, and stays where it is below the threshold. Its trailing peak over
+# release / 4 tracks that loop, and the hold is the forward fill of the last value above the
+# threshold. The result is not identical: on speech-like audio tools/bench_mastering.py measures
+# a median short-term loudness difference of 0.7-0.8 dB from pydub (95th percentile 2.5-4.5 dB,
+# at the onsets, where pydub ramps the reduction over the attack time instead of at once)
+def compressor_gain_db(x, sample_rate, threshold, ratio, attack, release):
+    look = max(1, int(sample_rate * attack / 1000))
+    cumsum = np.concatenate([[0.0], np.cumsum(np.square(x, dtype=np.float64))])
+    # RMS of the trailing window x[n - look .. n - 1], shorter at the start (as pydub does)
+    ends = np.arange(len(x))
+    starts = np.maximum(ends - look, 0)
+    rms = np.sqrt(np.maximum(cumsum[ends] - cumsum[starts], 0) / np.maximum(ends - starts, 1))
+    with np.errstate(divide='ignore'):
+        over_db = np.maximum(gain_to_db(rms) - threshold, 0)
+    reduction = sliding_max((1 - 1 / ratio) * over_db, max(1, int(sample_rate * release / 4000)))
+    last_above = np.where(over_db > 0, ends, -1)
+    np.maximum.accumulate(last_above, out=last_above)
+    hold = int(sample_rate * compressor_hold_ms / 1000)
+    return np.where((last_above >= 0) & (ends - last_above <= hold), reduction[np.maximum(last_above, 0)], 0.0)
+
+def limiter_gain(x, sample_rate, ceiling):
+    window = max(1, int(sample_rate * limiter_lookahead_ms / 1000))
+    with np.errstate(divide='ignore'):
+        needed = np.minimum(1.0, db_to_gain(ceiling) / np.abs(x))
+    # the lookahead min followed by a moving average of the same length starts lowering the
+    # gain one window before a peak and never lets it above the needed gain at the peak
+    return moving_average(lookahead_min(needed, window), window)
+
+# the compressor and limiter on an array already normalized to the target loudness. The channels
+# of a (samples, channels) array share one gain, from the power and the peaks of all of them,
+# so the stereo image does not move
+def dynamics(x, sample_rate, settings):
+    linked = (lambda gain: gain) if x.ndim == 1 else (lambda gain: gain[:, None])
+    level = x if x.ndim == 1 else np.sqrt(np.mean(np.square(x), axis=1))
+    x = x * linked(db_to_gain(-compressor_gain_db(level, sample_rate, settings['threshold'], settings['ratio'],
+                                                  settings['attack'], settings['release'])))
+    if settings['ceiling'] is not None:
+        peaks = x if x.ndim == 1 else np.max(np.abs(x), axis=1)
+        x = x * linked(limiter_gain(peaks, sample_rate, settings['ceiling']))
+    return np.clip(x, -1.0, 1.0)
+
+# samples of context needed on each side of a block for dynamics() to match the whole-array result
+def context_samples(sample_rate, settings):
+    history = settings['attack'] + settings['release'] / 4 + compressor_hold_ms + 2 * limiter_lookahead_ms
+    return int(sample_rate * history / 1000) + 2, int(sample_rate * limiter_lookahead_ms / 1000) + 2
+
+def master(audio, sample_rate=24000, gain_db=None, **settings):
+    settings = {**default_settings, **settings}
+    audio = np.asarray(audio, dtype=np.float64)
+    if gain_db is None:
+        gain_db = normalization_gain_db(settings['target_dbfs'], dbfs(np.sum(np.square(audio)), audio.size))
+    return dynamics(audio * db_to_gain(gain_db), sample_rate, settings)
+
+# loudness of a sound file over all its channels, read block by block
+def file_dbfs(path, block_seconds=30):
+    sum_squares, samples = 0.0, 0
+    info = soundfile.info(path)
+    for block in soundfile.blocks(path, blocksize=int(info.samplerate * block_seconds), dtype='float64', always_2d=True):
+        sum_squares += np.sum(np.square(block))
+        samples += block.size
+    return dbfs(sum_squares, samples)
+
+# float64 blocks of a sound file, the input of write_processed: mono (the channels averaged),
+# or with mono=False (samples, channels) blocks of all the channels
+class FileSource:
+    def __init__(self, path, mono=True):
+        self.file = soundfile.SoundFile(path)
+        self.samplerate = self.file.samplerate
+        self.frames = self.file.frames
+        self.mono = mono
+        self.channels = 1 if mono else self.file.channels
+
+    def read(self, position, count):
+        self.file.seek(position)
+        data = self.file.read(count, dtype='float64', always_2d=True)
+        return data.mean(axis=1) if self.mono else data
+
+    def close(self):
+        self.file.close()
+
+# Write source (anything with samplerate, frames and read(position, count), e.g. a FileSource
+# or a mixing.MixSource) to output_path block by block, multiplied by gain and, unless settings
+# is None, through the compressor and limiter. The file is written next to output_path and
+# moved in place, so output_path may be the file the source reads. With output (an
+# episode_writer.AudioOutput) the blocks are written to it instead, encoded as they come
+def write_processed(source, output_path, gain=1.0, settings=None, block_seconds=30, subtype='PCM_16', output=None):
+    if output is not None:
+        process_blocks(source, output, gain, settings, block_seconds)
+        return
+    tmp_path = output_path + '.mastering'
+    with soundfile.SoundFile(tmp_path, 'w', samplerate=source.samplerate, channels=getattr(source, 'channels', 1),
+                             format='WAV', subtype=subtype) as file:
+        process_blocks(source, file, gain, settings, block_seconds)
+    os.replace(tmp_path, output_path)
+
+def process_blocks(source, output, gain, settings, block_seconds):
+    sample_rate = source.samplerate
+    before, after = context_samples(sample_rate, settings) if settings is not None else (0, 0)
+    block = int(sample_rate * block_seconds)
+    history = None
+    position = 0
+    while position < source.frames:
+        data = source.read(position, min(block + after, source.frames - position)) * gain
+        if history is None:
+            history = data[:0]
+        if settings is None:
+            output.write(np.clip(data, -1.0, 1.0))
+        else:
+            # the block is processed with the samples before it and the lookahead after it
+            processed = dynamics(np.concatenate([history, data]), sample_rate, settings)
+            output.write(processed[len(history):len(history) + min(block, len(data))])
+            history = np.concatenate([history, data[:block]])[-before:]
+        position += block
+
+# Master a sound file block by block into output_path, which may be the input file, keeping its
+# channels (see dynamics). With output (mono) the channels are averaged.
+# gain_db skips the loudness pass when the caller already knows it
+# (e.g. from the sum of squares of the clips)
+def master_file(input_path, output_path, gain_db=None, block_seconds=30, subtype='PCM_16', output=None, **settings):
+    settings = {**default_settings, **settings}
+    if gain_db is None:
+        gain_db = normalization_gain_db(settings['target_dbfs'], file_dbfs(input_path, block_seconds))
+    source = FileSource(input_path, mono=output is not None)
+    try:
+        write_processed(source, output_path, db_to_gain(gain_db), settings, block_seconds, subtype, output)
+    finally:
+        source.close()
+    return gain_db
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Normalize, compress and limit a WAV file')
+    parser.add_argument('input')
+    parser.add_argument('output')
+    parser.add_argument('--target-dbfs', type=float, default=default_settings['target_dbfs'])
+    parser.add_argument('--threshold', type=float, default=default_settings['threshold'], help='compressor threshold in dBFS')
+    parser.add_argument('--ratio', type=float, default=default_settings['ratio'])
+    parser.add_argument('--attack', type=float, default=default_settings['attack'], help='ms')
+    parser.add_argument('--release', type=float, default=default_settings['release'], help='ms')
+    parser.add_argument('--ceiling', type=float, default=default_settings['ceiling'], help='limiter ceiling in dBFS')
+    parser.add_argument('--block-seconds', type=float, default=30)
+    args = parser.parse_args()
+
+    gain_db = master_file(args.input, args.output, block_seconds=args.block_seconds,
+                          target_dbfs=args.target_dbfs, threshold=args.threshold, ratio=args.ratio,
+                          attack=args.attack, release=args.release, ceiling=args.ceiling)
+    print(f"Mastered {args.input} ({gain_db:+.1f} dB gain) to {args.output}")
@@ -0,0 +1,154 @@
+import io
+import os
+import hashlib
+import threading
+import numpy as np
+import soundfile
+import mastering
+from disk_cache import DiskCache, hash_key
+
+# Intro / outro music around the speech of an episode, replacing the ffmpeg acrossfade step of
+# tools/gen_audio_video.sh. The timeline is
+#   intro |------------|
+#   speech        |c|-------------------------|c|
+#   outro                                     |-----------|
+# with the speech starting crossfade seconds (c) before the end of the intro. The overlaps are
+# triangular crossfades like ffmpeg's acrossfade c1=tri:c2=tri, or with duck_db the speech comes in
+# at full level and the music is turned down by duck_db under it instead of fading out.
+# The mix is read block by block (MixSource) and written together with the mastering in one pass.
+
+sample_rate = 24000
+# how long the music takes to duck under the speech and to come back after it
+duck_ramp_seconds = 0.3
+
+# music beds resampled to the episode sample rate, kept on disk and in memory
+bed_cache = DiskCache(os.environ.get('PAPERCAST_MUSIC_CACHE_DIR', 'music_cache'),
+                      max_bytes=512 * 1024 * 1024, suffix='.npy')
+beds = {}
+beds_lock = threading.Lock()
+
+# band-limited resampling of a whole (short) signal through its spectrum
+def resample(audio, from_rate, to_rate):
+    if from_rate == to_rate:
+        return audio
+    length = int(round(len(audio) * to_rate / from_rate))
+    spectrum = np.fft.rfft(audio)
+    resampled = np.zeros(length // 2 + 1, dtype=complex)
+    bins = min(len(spectrum), len(resampled))
+    resampled[:bins] = spectrum[:bins]
+    return np.fft.irfft(resampled, length) * (length / len(audio))
+
+# a music file as mono float64 at the episode sample rate
+def load_bed(path):
+    with beds_lock:
+        if path in beds:
+            return beds[path]
+    with open(path, 'rb') as file:
+        key = hash_key(hashlib.sha256(file.read()).hexdigest(), sample_rate)
+    cached = bed_cache.get(key)
+    if cached is not None:
+        bed = np.load(io.BytesIO(cached))
+    else:
+        audio, rate = soundfile.read(path, dtype='float64', always_2d=True)
+        bed = resample(audio.mean(axis=1), rate, sample_rate)
+        buffer = io.BytesIO()
+        np.save(buffer, bed)
+        bed_cache.put(key, buffer.getvalue())
+    with beds_lock:
+        beds[path] = bed
+    return bed
+
+# mix settings of an episode: {'intro': path, 'outro': path, 'crossfade': seconds, 'duck_db': dB or None}
+def load_mix(mix):
+    intro = load_bed(mix['intro']) if mix.get('intro') else np.zeros(0)
+    outro = load_bed(mix['outro']) if mix.get('outro') else np.zeros(0)
+    return intro, outro
+
+# samples of overlap between the speech and a bed, never longer than the bed
+def overlap_samples(bed, crossfade):
+    return min(len(bed), int(crossfade * sample_rate))
+
+# seconds from the start of the episode to the start of the speech, for the subtitles
+def speech_offset(intro, crossfade):
+    return (len(intro) - overlap_samples(intro, crossfade)) / sample_rate
+
+# The mixed episode, read block by block like a mastering.FileSource
+class MixSource:
+    def __init__(self, speech, intro, outro, crossfade=1.0, duck_db=None, speech_gain=1.0):
+        self.speech = speech
+        self.intro = intro
+        self.outro = outro
+        self.duck_gain = None if duck_db is None else mastering.db_to_gain(-abs(duck_db))
+        self.speech_gain = speech_gain
+        self.samplerate = sample_rate
+        self.intro_overlap = overlap_samples(intro, crossfade)
+        self.outro_overlap = min(overlap_samples(outro, crossfade), speech.frames)
+        self.speech_start = len(intro) - self.intro_overlap
+        self.speech_end = self.speech_start + speech.frames
+        self.outro_start = self.speech_end - self.outro_overlap
+        self.frames = max(self.speech_end, self.outro_start + len(outro))
+        ramp = int(duck_ramp_seconds * sample_rate)
+        self.intro_ramp = max(1, min(ramp, self.intro_overlap // 2))
+        self.outro_ramp = max(1, min(ramp, self.outro_overlap // 2))
+
+    def speech_envelope(self, t):
+        envelope = np.ones(len(t))
+        if self.duck_gain is not None:
+            return envelope
+        if self.intro_overlap:
+            envelope *= np.interp(t, [self.speech_start, len(self.intro)], [0.0, 1.0])
+        if self.outro_overlap:
+            envelope *= np.interp(t, [self.outro_start, self.speech_end], [1.0, 0.0])
+        return envelope
+
+    def intro_envelope(self, t):
+        if self.duck_gain is None:
+            return np.interp(t, [self.speech_start, len(self.intro)], [1.0, 0.0])
+        # down to the duck gain when the speech starts, faded out at the end of the bed
+        return np.interp(t, [self.speech_start, self.speech_start + self.intro_ramp,
+                             len(self.intro) - self.intro_ramp, len(self.intro)],
+                         [1.0, self.duck_gain, self.duck_gain, 0.0])
+
+    def outro_envelope(self, t):
+        if self.duck_gain is None:
+            return np.interp(t, [self.outro_start, self.speech_end], [0.0, 1.0])
+        # faded in to the duck gain under the speech, up to full level when the speech ends
+        return np.interp(t, [self.outro_start, self.outro_start + self.outro_ramp,
+                             self.speech_end - self.outro_ramp, self.speech_end],
+                         [0.0, self.duck_gain, self.duck_gain, 1.0])
+
+    # add the part of a track (starting at start in the episode) that falls into the block
+    def add_track(self, mix, position, start, end, read, envelope):
+        first, last = max(position, start), min(position + len(mix), end)
+        if first >= last:
+            return
+        t = np.arange(first, last)
+        mix[first - position:last - position] += read(first - start, last - first) * envelope(t)
+
+    def read(self, position, count):
+        count = min(count, self.frames - position)
+        mix = np.zeros(count)
+        self.add_track(mix, position, 0, len(self.intro),
+                       lambda offset, length: self.intro[offset:offset + length], self.intro_envelope)
+        self.add_track(mix, position, self.speech_start, self.speech_end,
+                       lambda offset, length: self.speech.read(offset, length) * self.speech_gain,
+                       self.speech_envelope)
+        self.add_track(mix, position, self.outro_start, self.outro_start + len(self.outro),
+                       lambda offset, length: self.outro[offset:offset + length], self.outro_envelope)
+        return mix
+
+# Mix the intro and outro around the speech file and write the result (mastered with the
+# mastering settings unless master is None) to output_path, which may be the speech file.
+# speech_gain_db is applied to the speech only, e.g. its loudness normalization. With output
+# (an episode_writer.AudioOutput) the mix is written to it instead of output_path
+def mix_file(speech_path, output_path, mix, master=None, speech_gain_db=0.0, subtype='PCM_16', output=None):
+    intro, outro = load_mix(mix)
+    speech = mastering.FileSource(speech_path)
+    try:
+        source = MixSource(speech, intro, outro, mix.get('crossfade', 1.0), mix.get('duck_db'),
+                           mastering.db_to_gain(speech_gain_db))
+        settings = None if master is None else {**mastering.default_settings, **master}
+        mastering.write_processed(source, output_path, settings=settings, subtype=subtype, output=output)
+    finally:
+        speech.close()
+    return source
@@ -1,23 +1,87 @@
-from pypdf import PdfReader
+import fitz  # PyMuPDF
 from llm_funcs import gen_gpt_chat_json
+from disk_cache import DiskCache, hash_key
+from artifact_store import store
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import telemetry
+import hashlib
 import json
 import os
 
+# processes used to extract the page text, PDFs with fewer uncached pages
+# than parallel_min_pages are extracted in this process
+pdf_workers = min(8, os.cpu_count() or 1)
+parallel_min_pages = 16
+
+# Per-page text cache. A page is keyed by the hash of the file and its page number, so re-runs
+# are free. (A key from the content stream of the page is not safe: the pages that draw their
+# content through a form XObject all have the same one-line content stream)
+page_text_cache = DiskCache(os.environ.get('PAPERCAST_PDF_TEXT_CACHE_DIR', 'pdf_text_cache'),
+                            max_bytes=int(os.environ.get('PAPERCAST_PDF_TEXT_CACHE_MAX_BYTES', 256 * 1024 * 1024)),
+                            suffix='.txt')
+
 # tool function to generate json file name from pdf path 
 def get_json_id(pdf_path):
     # get the file name without extension
     # for example, '1-s2.0-S0079742124000033-main.pdf' gives '1-s2.0-S0079742124000033-main'
     return os.path.splitext(os.path.basename(pdf_path))[0]
 
-# load PDF raw content
-def load_pdf_content(pdf_path = "pdfs/1-s2.0-S0079742124000033-main.pdf"):
-    reader = PdfReader(pdf_path)
-    number_of_pages = len(reader.pages)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text()
+def get_file_hash(pdf_path):
+    with open(pdf_path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+def get_page_key(file_hash, page_number):
+    return hash_key(file_hash, page_number)
+
+# extract the text of the given pages, each worker process opens the file by itself
+def extract_pages(pdf_path, page_numbers):
+    with fitz.open(pdf_path) as doc:
+        return [doc[page_number].get_text() for page_number in page_numbers]
+
+# load PDF raw content: the page texts come from the page text cache and the missing
+# pages are extracted with PyMuPDF, fanned out over a process pool for large PDFs
+def load_pdf_content(pdf_path = "pdfs/1-s2.0-S0079742124000033-main.pdf", workers=None, use_cache=True):
+    with telemetry.span('pdf_extract', path=pdf_path) as span:
+        text, pages, extracted_pages = load_pdf_pages(pdf_path, workers, use_cache)
+        span.set(pages=pages, extracted_pages=extracted_pages, chars=len(text))
     return text
 
+def load_pdf_pages(pdf_path, workers=None, use_cache=True):
+    workers = workers or pdf_workers
+    file_hash = get_file_hash(pdf_path)
+    with fitz.open(pdf_path) as doc:
+        page_keys = [get_page_key(file_hash, page_number) for page_number in range(len(doc))]
+
+    texts = [None] * len(page_keys)
+    if use_cache:
+        for page_number, page_key in enumerate(page_keys):
+            cached_text = page_text_cache.get(page_key)
+            if cached_text is not None:
+                texts[page_number] = cached_text.decode('utf-8')
+    missing = [page_number for page_number, text in enumerate(texts) if text is None]
+
+    if workers > 1 and len(missing) >= parallel_min_pages:
+        # contiguous runs of pages per task, a few tasks per worker to balance the load
+        chunk_size = max(1, len(missing) // (workers * 4))
+        chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+        # spawned, not forked: the TTS warmup thread may be importing torch and loading the model,
+        # and a multi-paper run calls this from several threads
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            chunk_texts = list(pool.map(extract_pages, [pdf_path] * len(chunks), chunks))
+    elif missing:
+        chunks = [missing]
+        chunk_texts = [extract_pages(pdf_path, missing)]
+    else:
+        chunks, chunk_texts = [], []
+
+    for page_numbers, page_texts in zip(chunks, chunk_texts):
+        for page_number, text in zip(page_numbers, page_texts):
+            texts[page_number] = text
+            if use_cache:
+                page_text_cache.put(page_keys[page_number], text.encode('utf-8'))
+    return ''.join(texts), len(texts), len(missing)
+
 # call a GPT-4o json mode and extract pdf text for title, abstract, authors, 
 # and full text by each section
 def extract_pdf_info(pdf_path):
@@ -41,32 +105,41 @@ def extract_pdf_info(pdf_path):
     json_obj['content'] = pdf_text
     return json_obj
 
-# save the json object to a file in "json" folder
-def save_json(json_obj, file_name):
-    # if 'json' folder does not exist, create it
-    if not os.path.exists('json'):
-        os.makedirs('json')
+# save the json object in the artifact store under the pdf id, versioned by the
+# content of the pdf file so that two files with the same name never collide
+def save_json(json_obj, file_name, version=None):
+    store.put('pdf', file_name, json_obj, version=version)
 
-    with open('json/' + file_name + '.json', 'w') as file:
-        json.dump(json_obj, file)
+# the version of a pdf in the artifact store: the hash of its content
+def get_pdf_version(pdf_path):
+    return get_file_hash(pdf_path)[:16]
 
-    return
+# the latest stored extraction of a pdf id without this version (e.g. a json/ file imported
+# while its PDF was not in pdfs/), re-validated against the text of the file: if it was
+# extracted from the same content it is stored again under the version of the file
+def get_unversioned_pdf(pdf_path, json_id, version):
+    pdf_json = store.get('pdf', json_id)
+    if not pdf_json or pdf_json.get('content') != load_pdf_content(pdf_path):
+        return None
+    save_json(pdf_json, json_id, version)
+    return pdf_json
 
 # since the PDF extractor and data generation is time-consuming, use_cache is set to True by default
 def get_pdf(pdf_path, use_cache=True):
     json_id = get_json_id(pdf_path)
-    # check if the json file already exists
-    if os.path.exists('json/' + json_id + '.json') and use_cache:
-        with open('json/' + json_id + '.json') as file:
-            pdf_json = json.load(file)
+    version = get_pdf_version(pdf_path)
+    # check if this pdf is already in the artifact store
+    if use_cache:
+        pdf_json = store.get('pdf', json_id, version) or get_unversioned_pdf(pdf_path, json_id, version)
+        if pdf_json:
             return pdf_json
-    # if not, extract the pdf info and save it to a json file
+    # if not, extract the pdf info and save it
     pdf_json = extract_pdf_info(pdf_path)
+    save_json(pdf_json, json_id, version)
     return pdf_json
 
 if __name__ == '__main__':
     pdf_path = "pdfs/1-s2.0-S0079742124000033-main.pdf"
     pdf_json = get_pdf(pdf_path, use_cache=False)
     print(pdf_json)
-    save_json(pdf_json, pdf_json['pdf_id'])
-    print("JSON file saved successfully!")
\ No newline at end of file
+    print("JSON saved in the artifact store!")
\ No newline at end of file
@@ -1,12 +1,23 @@
-from summarizer import generate_summary_arxiv
+from summarizer import generate_summary_arxiv, generate_summary_multi, unique_sources, is_sciencedirect
 from tts_gen import produce_audio
 from arxiv_reader import get_arxiv_id
 from pdf_reader import get_json_id
+from text_norm import TranscriptParser
+from artifact_store import store
+from manifest import RunManifest
+from episode_writer import get_output_path
 
-import json
+import llm_funcs
+import summarizer
+import telemetry
+import tts_gen
+import argparse
+import hashlib
 import os
 import yaml
-import sys
+import time
+import queue
+import threading
 
 # magic numbers for some good speaker seeds for podcasting
 speaker_seed_map = {"Justin": 2800,
@@ -14,121 +25,319 @@ speaker_seed_map = {"Justin": 2800,
                     "Bertie": 4600,
                     'Doudou': 13200}
 
-# generate summary for an arxiv paper and save the transcript in json in 'transcript/' with file name of the arxiv id
+# a transcript saved in the artifact store (or transcript/<episode_id>.json of older runs), None if missing
+def load_transcript(episode_id, stream_callback=None):
+    transcript_dict = store.get('transcript', episode_id)
+    if transcript_dict is None:
+        print(f"no cached transcript for {episode_id}, generating it")
+        return None
+    if stream_callback is not None:
+        stream_callback(transcript_dict['summary'])
+    return transcript_dict['summary']
+
+# generate summary for an arxiv paper and save the transcript in the artifact store under the arxiv id
 def generate_transcript_arxiv(arxiv_url, episode='1', use_cache=False,
                               prompt="dialogue_prompt",
                               background_knowledge="None",
-                              additional_research_questions="None"):
+                              additional_research_questions="None", stream_callback=None, manifest=None):
     # remove new line characters in the background knowledge
     background_knowledge = background_knowledge.replace('\n', ' ')
-    if not os.path.exists('transcript'):
-        os.makedirs('transcript')
-    if not use_cache:
+    # if use_cache, load the transcript from the store
+    transcript = load_transcript(get_arxiv_id(arxiv_url), stream_callback) if use_cache else None
+    if transcript is None:
         arxiv_dict = generate_summary_arxiv(arxiv_url, episode, use_cache, prompt, 
-                                            background_knowledge, additional_research_questions)
+                                            background_knowledge, additional_research_questions,
+                                            stream_callback=stream_callback, manifest=manifest)
         transcript = arxiv_dict['summary']
-        arxiv_id = arxiv_dict['arxiv_id']
-        # save arxiv_dict to a json file in 'transcript' folder
-        with open(os.path.join('transcript', arxiv_id + '.json'), 'w') as file:
-            json.dump(arxiv_dict, file)
-    else: # if use_cache, load the transcript from the json file
-        arxiv_id = get_arxiv_id(arxiv_url)
-        with open(os.path.join('transcript', arxiv_id + '.json')) as file:
-            arxiv_dict = json.load(file)
-            transcript = arxiv_dict['summary']
+        store.put('transcript', get_arxiv_id(arxiv_url), arxiv_dict)
 
     return transcript
 
-# generate summary of an pdf file and save the transcript in json in 'transcript/' with file name of the pdf id
+# generate summary of an pdf file and save the transcript in the artifact store under the pdf id
 def generate_transcript_pdf(pdf_path, episode='1', use_cache=False, 
                             prompt='dialogue_prompt', background_knowledge='None',
-                            additional_research_questions="None"):
+                            additional_research_questions="None", stream_callback=None, manifest=None):
     from summarizer import generate_summary_pdf
-    if not os.path.exists('transcript'):
-        os.makedirs('transcript')
-    if not use_cache:
+    transcript = load_transcript(get_json_id(pdf_path), stream_callback) if use_cache else None
+    if transcript is None:
         pdf_json = generate_summary_pdf(pdf_path, episode, use_cache, prompt, 
-                                        background_knowledge, additional_research_questions)
+                                        background_knowledge, additional_research_questions,
+                                        stream_callback=stream_callback, manifest=manifest)
         transcript = pdf_json['summary']
-        pdf_id = pdf_json['pdf_id']
-        # save pdf_json to a json file in 'transcript' folder
-        with open(os.path.join('transcript', pdf_id + '.json'), 'w') as file:
-            json.dump(pdf_json, file)
-    else: # if use_cache, load the transcript from the json file
-        pdf_id = get_json_id(pdf_path)
-        with open(os.path.join('transcript', pdf_id + '.json')) as file:
-            pdf_json = json.load(file)
-            transcript = pdf_json['summary']
+        store.put('transcript', pdf_json['pdf_id'], pdf_json)
 
     return transcript
 
-# a tool function to sanitize the transcript text by removing special characters
-# it is critical to ensure ChatTTS to avoid speaking the break and laugh symbols
-# if seeing more invalid characters, add them here
-def sanitize_text(text):
-    text = text.replace('?', ',')
-    text = text.replace('\'', ' ')
-    # remove '’' '!' '-' '(' ')'' "'and replace with ','
-    text = text.replace('’', ' ')
-    text = text.replace('!', ',')
-    text = text.replace('-', ' ')
-    text = text.replace('(', ' ')
-    text = text.replace(')', ' ')
-    # remove '"' and replace with ','
-    text = text.replace('"', ' ')
-    text = text.replace("'", ' ')
-    text = text.replace(":", ' ')
-    return text
-
-# each line of the transcript starts with the speaker name like 
+# a multi-paper episode is named after its sources: the id of its only source,
+# otherwise a hash of all the source ids
+def get_multi_episode_id(urls):
+    source_ids = list(unique_sources(urls))
+    if len(source_ids) == 1:
+        return source_ids[0]
+    return 'multi_' + hashlib.sha256('+'.join(sorted(source_ids)).encode('utf-8')).hexdigest()[:12]
+
+# generate one transcript about several papers (see summarizer.generate_summary_multi)
+# and save it in the artifact store under the multi-paper episode id
+def generate_transcript_multi(urls, episode='1', use_cache=False, prompt='dialogue_prompt',
+                              background_knowledge='None', additional_research_questions="None",
+                              stream_callback=None, manifest=None):
+    background_knowledge = background_knowledge.replace('\n', ' ')
+    episode_id = get_multi_episode_id(urls)
+    transcript = load_transcript(episode_id, stream_callback) if use_cache else None
+    if transcript is not None:
+        return transcript
+    multi_dict = generate_summary_multi(urls, episode, use_cache, prompt, background_knowledge,
+                                        additional_research_questions, stream_callback=stream_callback,
+                                        manifest=manifest)
+    if multi_dict is None:
+        raise ValueError(f"no transcript could be generated for {', '.join(urls)}")
+    store.put('transcript', episode_id, multi_dict)
+    return multi_dict['summary']
+
+# map the (text, speaker) turns of text_norm.TranscriptParser to the (text, speaker_seed, sequence_id)
+# lines of produce_audio, numbered from first_sequence_id
+def number_turns(turns, first_sequence_id=1):
+    return [(text, speaker_seed_map[speaker], sequence_id)
+            for sequence_id, (text, speaker) in enumerate(turns, first_sequence_id)]
+
+# each line of the transcript starts with the speaker name like
 # **Justin:** Interesting. So, how does sparse computation impact the training costs of DeepSeek-V2?
-def parse_transcript(transcript):
-    lines = transcript.split('\n')
-    sequence_id = 1
-    result = []
-    for line in lines:
-        print(line)
-        if line.startswith('**'):
-            speaker = line.split('**',2)[1].strip(':')
-            # if the speaker is not in the map, ignore this line and continue
-            if speaker not in speaker_seed_map:
-                continue
-            speaker_seed = speaker_seed_map[speaker]
-            text = sanitize_text(line.split('**',2)[2].strip())
-            result.append((text, speaker_seed, sequence_id))
-            sequence_id += 1
-    return result
+# the text is normalized with the rules of text_norm.yaml for the language, lines without a speaker
+# continue the previous turn, or belong to default_speaker (e.g. a monologue) before the first one
+def parse_transcript(transcript, language='en', default_speaker=None):
+    parser = TranscriptParser(language, speaker_seed_map, default_speaker)
+    return number_turns(parser.parse(transcript))
 
-if __name__ == '__main__':
-    # load url, episode, use_cache and background knowledge from a yaml file from sys.argv[1]
-    with open(sys.argv[1]) as file:
+# incremental version of parse_transcript for a transcript streamed from the LLM:
+# feed() takes the next text chunk and returns the turns whose line has ended,
+# close() returns the last turn once the stream is over
+class TranscriptStreamParser:
+    def __init__(self, language='en', default_speaker=None):
+        self.buffer = ''
+        self.sequence_id = 1
+        self.parser = TranscriptParser(language, speaker_seed_map, default_speaker)
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        *lines, self.buffer = self.buffer.split('\n')
+        return self.parse_lines(lines)
+
+    def close(self):
+        lines, self.buffer = [self.buffer], ''
+        return self.parse_lines(lines)
+
+    def parse_lines(self, lines):
+        turns = [turn for turn in map(self.parser.parse_line, lines) if turn]
+        result = number_turns(turns, self.sequence_id)
+        self.sequence_id += len(result)
+        return result
+
+# streaming mode: run the transcript generation in a background thread and
+# synthesize every completed speaker turn while the LLM is still writing the next ones
+def stream_episode(generate_transcript, url, audio_filename, audio_offset=0, tts_batch_size=1, master=None,
+                   mix=None, language='en', default_speaker=None, manifest=None, audio_format='wav',
+                   segment_seconds=None, **kwargs):
+    start_time = time.perf_counter()
+    turns = queue.Queue()
+    parser = TranscriptStreamParser(language, default_speaker)
+    errors = []
+
+    def on_chunk(chunk):
+        for turn in parser.feed(chunk):
+            if turn[2] == 1:
+                print(f"first turn ready after {time.perf_counter() - start_time:.1f}s")
+            turns.put(turn)
+
+    def llm_worker():
+        try:
+            generate_transcript(url, stream_callback=on_chunk, manifest=manifest, **kwargs)
+            print(f"transcript finished after {time.perf_counter() - start_time:.1f}s")
+        except Exception as e:
+            errors.append(e)
+        finally:
+            for turn in parser.close():
+                turns.put(turn)
+            turns.put(None)
+
+    worker = threading.Thread(target=llm_worker, daemon=True)
+    worker.start()
+    produce_audio(iter(turns.get, None), audio_filename=audio_filename, offset=audio_offset,
+                  batch_size=tts_batch_size, master=master, mix=mix, manifest=manifest,
+                  audio_format=audio_format, segment_seconds=segment_seconds)
+    worker.join()
+    if errors:
+        raise errors[0]
+    print(f"episode finished after {time.perf_counter() - start_time:.1f}s")
+
+# the master key of a run yaml: true for the default mastering settings, or a dict of settings
+def get_master_settings(master):
+    if master is True:
+        return {}
+    return master or None
+
+# the intro / outro keys of a run yaml as the mix settings of produce_audio, None without music
+def get_mix_settings(config):
+    if not config.get('intro') and not config.get('outro'):
+        return None
+    return {'intro': config.get('intro'), 'outro': config.get('outro'),
+            'crossfade': config.get('crossfade', 1.0), 'duck_db': config.get('duck_db')}
+
+# a monologue transcript has no speaker names, all of it is spoken by its host
+def get_default_speaker(prompt):
+    return 'Justin' if prompt == 'monologue_prompt' else None
+
+# load url, episode, use_cache, background knowledge and the optional settings from a run yaml file
+def load_config(config_path):
+    with open(config_path) as file:
         config = yaml.load(file, Loader=yaml.FullLoader)
-    url = config['url']
-    episode = str(config['episode'])
-    use_cache = config['use_cache']
-    prompt = config['prompt']
-    background_knowledge = config['background_knowledge']
-    additional_research_questions = config.get('additional_questions', ['None'])
-    additional_research_questions = '\n'.join(additional_research_questions)
-    print('additional_research_questions:', additional_research_questions)
-    audio_offset = config.get('audio_offset',0)
-
-    # check the url and see if it is an arxiv url or a local PDF file
-    # if it is an arxiv url, get the arxiv id and generate the transcript
-    # if it is a local PDF file, load the PDF content and generate the transcript
+    return {
+        # a single source, or with urls a list of them for a multi-paper episode
+        'url': config.get('urls') or config['url'],
+        'episode': str(config['episode']),
+        'use_cache': config['use_cache'],
+        'prompt': config.get('prompt', 'dialogue_prompt'),
+        # normalization rules of text_norm.yaml for the transcript
+        'language': config.get('language', 'en'),
+        # the speaker of the lines before the first speaker name, Justin for a monologue
+        'default_speaker': config.get('default_speaker', get_default_speaker(config.get('prompt'))),
+        'background_knowledge': config['background_knowledge'],
+        'additional_research_questions': '\n'.join(config.get('additional_questions', ['None'])),
+        'audio_offset': config.get('audio_offset', 0),
+        # number of lines per ChatTTS infer call, 1 keeps the line-by-line synthesis
+        'tts_batch_size': config.get('tts_batch_size', 1),
+        # overlap the transcript generation and the speech synthesis
+        'stream': config.get('stream', False),
+        # the LLM response cache, optionally skipping the high temperature (creative) calls
+        'llm_cache': config.get('llm_cache', llm_funcs.llm_cache_enabled),
+        'llm_cache_max_temperature': config.get('llm_cache_max_temperature', None),
+        # refine the text of the lines in cached batches ahead of their audio (see tts_gen.iter_refined)
+        'tts_pipeline': config.get('tts_pipeline', tts_gen.pipeline_enabled),
+        # reuse the synthesized clips of unchanged transcript lines
+        'clip_cache': config.get('clip_cache', tts_gen.clip_cache_enabled),
+        # the content of all the papers of a multi-paper episode together stays under this many tokens
+        'multi_paper_token_budget': config.get('multi_paper_token_budget', summarizer.multi_paper_token_budget),
+        # papers longer than this many tokens are summarized section by section
+        'map_reduce_threshold_tokens': config.get('map_reduce_threshold_tokens', summarizer.map_reduce_threshold_tokens),
+        # write a json trace of every stage to traces/ and print a summary
+        'trace': config.get('trace', telemetry.enabled),
+        # load the ChatTTS model in the background while the transcript is written
+        'tts_warmup': config.get('tts_warmup', True),
+        # synthesize the lines on this many worker processes, each line with its own seed (see tts_gen.iter_sharded_clips)
+        'tts_workers': config.get('tts_workers', tts_gen.tts_workers),
+        # synthesize on a running tts_server.py instead of loading the model in this process
+        'tts_server': config.get('tts_server', tts_gen.tts_server_url),
+        # normalize, compress and limit the finished episode (see mastering.py)
+        'master': get_master_settings(config.get('master', False)),
+        # intro and outro music crossfaded with the speech (see mixing.py)
+        'mix': get_mix_settings(config),
+        # wav, flac or opus, encoded as the clips are synthesized (see episode_writer.output_formats)
+        'audio_format': config.get('audio_format', 'wav'),
+        # cut the episode into segments of this many seconds listed in audio/<id>.m3u8, for progressive playback
+        'segment_seconds': config.get('segment_seconds', None),
+    }
+
+def apply_settings(config):
+    apply_llm_settings(config)
+    apply_tts_settings(config)
+    if config['trace']:
+        telemetry.enable()
+
+# the settings read by the LLM stages (fetch, summary, transcript)
+llm_setting_keys = ['llm_cache', 'llm_cache_max_temperature', 'map_reduce_threshold_tokens', 'multi_paper_token_budget']
+
+def apply_llm_settings(config):
+    llm_funcs.llm_cache_enabled = config['llm_cache']
+    llm_funcs.llm_cache_max_temperature = config['llm_cache_max_temperature']
+    summarizer.map_reduce_threshold_tokens = config['map_reduce_threshold_tokens']
+    summarizer.multi_paper_token_budget = config['multi_paper_token_budget']
+
+def apply_tts_settings(config):
+    tts_gen.clip_cache_enabled = config['clip_cache']
+    tts_gen.pipeline_enabled = config['tts_pipeline']
+    tts_gen.tts_server_url = config['tts_server']
+    tts_gen.tts_workers = config['tts_workers']
+
+# check the url and see if it is an arxiv url or a local PDF file
+# if it is an arxiv url, the episode id is the arxiv id, 
+# if it is a local PDF file, the episode id is the PDF file name.
+# A list of urls (and a ScienceDirect url) is a multi-paper episode
+def get_episode_source(url):
+    if isinstance(url, list) or is_sciencedirect(url):
+        urls = url if isinstance(url, list) else [url]
+        return get_multi_episode_id(urls), generate_transcript_multi
     if url.startswith('https://arxiv.org/'):
-        arxiv_id = get_arxiv_id(url)
-        transcript = generate_transcript_arxiv(url, episode, use_cache, prompt, 
-                                               background_knowledge=background_knowledge,
-                                               additional_research_questions=additional_research_questions)
-        #print(transcript)
-        parsed_transcript = parse_transcript(transcript)
-        produce_audio(parsed_transcript, audio_filename=arxiv_id+'.wav', offset=audio_offset)
+        return get_arxiv_id(url), generate_transcript_arxiv
+    return get_json_id(url), generate_transcript_pdf
+
+# the LLM half of an episode: generate (or load) the transcript and parse it.
+# With the manifest of the run every LLM stage is checkpointed (see manifest.py)
+def generate_episode_transcript(config, manifest=None):
+    episode_id, generate_transcript = get_episode_source(config['url'])
+    with telemetry.span('transcript', episode_id=episode_id):
+        transcript = generate_transcript(config['url'], config['episode'], config['use_cache'], config['prompt'],
+                                         background_knowledge=config['background_knowledge'],
+                                         additional_research_questions=config['additional_research_questions'],
+                                         manifest=manifest)
+    return episode_id, parse_transcript(transcript, config['language'], config['default_speaker'])
+
+# everything that changes the audio of a parsed transcript, the inputs of the audio stage of the manifest
+def get_audio_inputs(parsed_transcript, config):
+    return (parsed_transcript, config['audio_offset'], config['tts_batch_size'], config['master'], config['mix'],
+            tts_gen.synthesis_params, config['audio_format'], config['segment_seconds'])
+
+# run a whole episode: transcript then audio, or both overlapped in streaming mode.
+# transcript_only stops after the transcript, without ever loading the TTS model.
+# Every stage is recorded in the manifest of the run, runs/<episode_id>/; with resume the
+# stages completed by a previous (e.g. crashed) run of the episode are reused
+def run_episode(config, transcript_only=False, resume=False):
+    episode_id, generate_transcript = get_episode_source(config['url'])
+    manifest = RunManifest(episode_id, resume)
+    if transcript_only:
+        episode_id, parsed_transcript = generate_episode_transcript(config, manifest)
+        print(f"transcript {episode_id}: {len(parsed_transcript)} lines, audio skipped")
+        return episode_id
+    if config['tts_warmup']:
+        tts_gen.warmup()
+    if config['stream']:
+        stream_episode(generate_transcript, config['url'], episode_id+'.wav',
+                       config['audio_offset'], config['tts_batch_size'], config['master'], config['mix'],
+                       config['language'], config['default_speaker'], manifest,
+                       audio_format=config['audio_format'], segment_seconds=config['segment_seconds'],
+                       episode=config['episode'], use_cache=config['use_cache'], prompt=config['prompt'],
+                       background_knowledge=config['background_knowledge'],
+                       additional_research_questions=config['additional_research_questions'])
+        manifest.remove_clips()
     else:
-        pdf_id = get_json_id(url)
-        transcript = generate_transcript_pdf(url, episode, use_cache, prompt, 
-                                            background_knowledge=background_knowledge,
-                                            additional_research_questions=additional_research_questions)
-        #print(transcript)
-        parsed_transcript = parse_transcript(transcript)
-        produce_audio(parsed_transcript, audio_filename=pdf_id+'.wav', offset=audio_offset)
+        episode_id, parsed_transcript = generate_episode_transcript(config, manifest)
+        audio_inputs = get_audio_inputs(parsed_transcript, config)
+        output_path = get_output_path(episode_id+'.wav', config['audio_format'], config['segment_seconds'])
+        if manifest.is_complete('audio', audio_inputs) and os.path.exists(output_path):
+            print(f"{output_path} is complete, nothing to resume")
+            return episode_id
+        with telemetry.span('audio', episode_id=episode_id, lines=len(parsed_transcript)):
+            produce_audio(parsed_transcript, audio_filename=episode_id+'.wav', offset=config['audio_offset'],
+                          batch_size=config['tts_batch_size'], master=config['master'],
+                          mix=config['mix'], manifest=manifest, audio_format=config['audio_format'],
+                          segment_seconds=config['segment_seconds'])
+        manifest.record('audio', audio_inputs)
+        manifest.remove_clips()
+    return episode_id
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Produce a podcast episode from a run yaml file')
+    parser.add_argument('config', help='run yaml file')
+    parser.add_argument('--transcript-only', action='store_true',
+                        help='generate (or load from the cache) the transcript and skip the speech synthesis')
+    parser.add_argument('--resume', action='store_true',
+                        help='reuse the stages (LLM calls, synthesized clips) completed by a previous run of the episode')
+    args = parser.parse_args()
+
+    # load the run configuration from the yaml file
+    config = load_config(args.config)
+    print('additional_research_questions:', config['additional_research_questions'])
+    apply_settings(config)
+    episode_id = run_episode(config, transcript_only=args.transcript_only, resume=args.resume)
+    print('LLM response cache:', llm_funcs.llm_cache.stats())
+    if telemetry.enabled:
+        telemetry.print_summary()
+        telemetry.write_trace(os.path.join('traces', f"{episode_id}-{time.strftime('%Y%m%d-%H%M%S')}.json"))
@@ -1,14 +1,12 @@
-import requests
-from bs4 import BeautifulSoup
-import os
-import json
+from http_fetch import fetch_text
+from artifact_store import store
 import re
 
 def get_sciencedirect_content(url):
-    response = requests.get('https://r.jina.ai/' + url)
+    text = fetch_text('https://r.jina.ai/' + url) or ''
     # sanitize the content by removing lines starting with '>'
     sanitized_content = []
-    for line in response.text.split('\n'):
+    for line in text.split('\n'):
         if not line.startswith('>'):
             sanitized_content.append(line)
     return '\n'.join(sanitized_content)
@@ -25,36 +23,31 @@ def extract_title_abstract(text):
     return title, abstract
 
 def get_sciencedirect(url, use_cache=True):
-    folder = 'sciencedirect'
-    
     # get the article ID from the URL
-    article_id = url.split('/')[-1]
+    article_id = url.rstrip('/').split('/')[-1]
 
-    if os.path.exists(os.path.join(folder, article_id + '.json')) and use_cache:
-        with open(os.path.join(folder, article_id+ '.json')) as file:
-            return json.load(file)
-    else:
-        content = get_sciencedirect_content(url)
-        title, abstract = extract_title_abstract(content)
-        return {
-            'article_id': article_id,
-            'title': title,
-            'abstract': abstract,
-            'content': content
-        }
+    if use_cache:
+        article_dict = store.get('sciencedirect', article_id)
+        if article_dict:
+            return article_dict
+    content = get_sciencedirect_content(url)
+    title, abstract = extract_title_abstract(content)
+    article_dict = {
+        'article_id': article_id,
+        'title': title,
+        'abstract': abstract,
+        'content': content
+    }
+    if content.strip():
+        save_article(article_dict)
+    return article_dict
 
+# save the article dictionary in the artifact store, keyed by the article id
 def save_article(article_dict):
-    import os
-    import json
-    folder = 'sciencedirect'
-    if not os.path.exists(folder):
-        os.makedirs(folder)
-    with open(os.path.join(folder, article_dict['article_id'] + '.json'), 'w') as file:
-        json.dump(article_dict, file)
+    store.put('sciencedirect', article_dict['article_id'], article_dict)
 
 if __name__ == '__main__':
     url = 'https://www.sciencedirect.com/science/article/abs/pii/S0079742124000033'
 
-    article_dict = get_sciencedirect(url)
-    print(article_dict)
-    save_article(article_dict)
\ No newline at end of file
+    article_dict = get_sciencedirect(url, use_cache=False)
+    print(article_dict)
\ No newline at end of file
@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import time
+import telemetry
+
+def timed_call(name, function, kwargs, inputs, start_time, manifest):
+    started = time.perf_counter() - start_time
+    with telemetry.span('stage', stage=name) as span:
+        if manifest is None:
+            result = function(**kwargs)
+        else:
+            result = manifest.run(name, (inputs, kwargs), lambda: function(**kwargs))
+            span.set(restored=name in manifest.restored)
+    return result, started, time.perf_counter() - start_time
+
+# Run a dependency graph of stages on a thread pool.
+# stages maps each stage name to (dependencies, function); the function is called with
+# the results of its dependencies as keyword arguments as soon as they are all available,
+# so independent stages run concurrently and the wall time is only as long as the
+# longest dependency chain. Returns the results and the timings of every stage
+# as {name: {'start': s, 'end': s, 'seconds': s}} relative to the start of the graph.
+# With the manifest of a run (see manifest.py) every finished stage is checkpointed and a
+# resumed run reuses the stages whose inputs are unchanged: the results of its dependencies
+# and, as an optional third element (dependencies, function, inputs), the other values the
+# function reads (prompts, title...). Reused stages are marked 'restored' in the timings
+def run_stages(stages, max_workers=4, manifest=None):
+    start_time = time.perf_counter()
+    results = {}
+    timings = {}
+    pending = dict(stages)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            for name, (dependencies, function, *inputs) in list(pending.items()):
+                if all(dependency in results for dependency in dependencies):
+                    del pending[name]
+                    kwargs = {dependency: results[dependency] for dependency in dependencies}
+                    running[pool.submit(timed_call, name, function, kwargs, inputs, start_time, manifest)] = name
+            if not running:
+                raise ValueError(f"stages with missing or cyclic dependencies: {', '.join(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                result, started, finished = future.result()
+                results[name] = result
+                timings[name] = {'start': round(started, 3), 'end': round(finished, 3),
+                                 'seconds': round(finished - started, 3)}
+                if manifest is not None and name in manifest.restored:
+                    timings[name]['restored'] = True
+    return results, timings
+
+def print_stage_timings(timings):
+    for name, timing in sorted(timings.items(), key=lambda item: item[1]['start']):
+        restored = ', restored' if timing.get('restored') else ''
+        print(f"stage {name:<20} {timing['start']:>8.1f}s -> {timing['end']:>8.1f}s ({timing['seconds']:.1f}s{restored})")
+    print(f"critical path: {max(timing['end'] for timing in timings.values()):.1f}s, "
+          f"sum of stages: {sum(timing['seconds'] for timing in timings.values()):.1f}s")
@@ -0,0 +1,361 @@
+import os
+import json
+import time
+import struct
+import argparse
+import itertools
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import soundfile
+
+import tts_gen
+from disk_cache import DiskCache, hash_key
+from episode_writer import format_srt_time
+from run import load_config, get_episode_source, generate_episode_transcript, parse_transcript, load_transcript, \
+    speaker_seed_map
+
+# Listen to an episode while it is synthesized, instead of waiting for the finished WAV file:
+#   python stream_server.py --port 8766
+#   mpv http://127.0.0.1:8766/episodes/1706.03762.opus
+# GET /episodes/<id>.wav, /episodes/<id>.opus and /episodes/<id>.vtt stream (chunked transfer
+# encoding) the audio and the WebVTT cues of the transcript <id> (from the artifact store or
+# transcript/<id>.json, parsed with the language and default_speaker query parameters of the
+# run yaml keys, e.g. ?language=zh) from the first synthesized clip on. POST /episodes {"config": "examples/run_attention.yaml"}
+# generates the transcript of a run yaml in the background and returns the id of the episode,
+# whose synthesis starts as soon as the transcript is ready (parsed with the language and
+# default speaker of the yaml).
+# Every listener of an episode follows the same synthesis run: one joining late gets what is
+# already synthesized at once, then the rest as it comes. The audio is encoded once for all
+# the listeners into spool files on disk, not memory, and if the synthesis fails the streams
+# are cut without their final chunk, so a client sees an incomplete transfer instead of a
+# complete but truncated file. A finished episode is kept in stream_cache/ (keyed by its transcript and
+# the synthesis parameters) and replayed from there with a Content-Length. Episodes are
+# synthesized one at a time, since the model is not thread safe; the TTS settings (clip cache,
+# workers, tts_server) are those of the server, not of the run yaml.
+
+stream_cache = DiskCache(os.environ.get('PAPERCAST_STREAM_CACHE_DIR', 'stream_cache'),
+                         max_bytes=int(os.environ.get('PAPERCAST_STREAM_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024)))
+sample_rate = 24000
+tts_batch_size = 1
+
+content_types = {
+    'wav': 'audio/wav',
+    'opus': 'audio/ogg; codecs=opus',
+    'vtt': 'text/vtt; charset=utf-8',
+}
+# the speaker of a transcript line is its seed, the cues show the name
+speaker_names = {seed: name for name, seed in speaker_seed_map.items()}
+
+synthesis_lock = threading.Lock()
+live = {}
+live_lock = threading.Lock()
+# the episodes posted as a run yaml: the future of their parsed transcript, their language
+# and default speaker
+transcripts = {}
+transcript_pool = ThreadPoolExecutor(max_workers=2)
+
+# the header of a 16 bit mono WAV file, with the largest sizes while the length is unknown
+def wav_header(data_bytes=None):
+    data_size = 0xFFFFFFFF - 36 if data_bytes is None else data_bytes
+    return (b'RIFF' + struct.pack('<I', data_size + 36) + b'WAVE' +
+            b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 1, sample_rate, sample_rate * 2, 2, 16) +
+            b'data' + struct.pack('<I', data_size))
+
+def format_vtt_time(seconds):
+    return format_srt_time(seconds).replace(',', '.')
+
+def episode_key(episode_id, parsed_transcript, language='en', default_speaker=None):
+    return hash_key(episode_id, parsed_transcript, language, default_speaker, tts_gen.synthesis_params, tts_batch_size)
+
+# the file object soundfile encodes the Ogg/Opus stream into: every page written is published
+class StreamSink:
+    def __init__(self, publish):
+        self.publish = publish
+        self.position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.publish(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    # libsndfile only asks for the current position, nothing is rewritten
+    def seek(self, offset, whence=0):
+        return self.position
+
+    def read(self, size=-1):
+        return b''
+
+class SynthesisFailed(Exception):
+    pass
+
+# One synthesis run of an episode and the byte streams (wav, opus, vtt) it produces, each
+# spooled whole to a temporary file so that any listener can start from the beginning without
+# the episode being held in memory. The spools are closed (and so removed) by release() once
+# the run is done and its last listener has left
+class LiveEpisode:
+    # the most bytes a listener reads from a spool at a time
+    read_size = 256 * 1024
+
+    def __init__(self, episode_id, key, parsed_transcript):
+        self.episode_id = episode_id
+        self.key = key
+        self.parsed_transcript = parsed_transcript
+        self.condition = threading.Condition()
+        self.spools = {name: tempfile.TemporaryFile() for name in content_types}
+        self.sizes = {name: 0 for name in content_types}
+        self.error = None
+        self.done = False
+        self.listeners = 0
+        self.publish('wav', wav_header())
+        self.publish('vtt', b'WEBVTT\n\n')
+
+    def publish(self, name, data):
+        with self.condition:
+            spool = self.spools[name]
+            spool.seek(0, os.SEEK_END)
+            spool.write(data)
+            spool.flush()
+            self.sizes[name] += len(data)
+            self.condition.notify_all()
+
+    # the bytes of a stream from offset, at most size of them
+    def read(self, name, offset, size=-1):
+        with self.condition:
+            spool = self.spools[name]
+            spool.seek(offset)
+            return spool.read(size)
+
+    # the chunks of a finished stream from offset, read_size bytes at a time
+    def iter_spool(self, name, offset=0):
+        while True:
+            chunk = self.read(name, offset, self.read_size)
+            if not chunk:
+                return
+            offset += len(chunk)
+            yield chunk
+
+    # called when the run is done and when a listener leaves (listeners are counted by get_live_episode)
+    def release(self, listener=False):
+        with self.condition:
+            if listener:
+                self.listeners -= 1
+            if self.done and self.listeners == 0 and self.spools:
+                for spool in self.spools.values():
+                    spool.close()
+                self.spools = {}
+
+    def run(self):
+        start_time = time.perf_counter()
+        samples = 0
+        try:
+            with synthesis_lock:
+                print(f"{self.episode_id}: synthesis started after {time.perf_counter() - start_time:.1f}s in the queue")
+                with soundfile.SoundFile(StreamSink(lambda data: self.publish('opus', data)), 'w',
+                                         samplerate=sample_rate, channels=1, format='OGG', subtype='OPUS') as opus:
+                    for text, speaker_name, sequence_id, (audio, _, _) in tts_gen.iter_clips(self.parsed_transcript,
+                                                                                             tts_batch_size):
+                        audio = np.clip(np.asarray(audio, dtype=np.float32).flatten(), -1.0, 1.0)
+                        start, end = samples / sample_rate, (samples + len(audio)) / sample_rate
+                        self.publish('vtt', f"{sequence_id}\n{format_vtt_time(start)} --> {format_vtt_time(end)}\n"
+                                            f"<v {speaker_names.get(speaker_name, speaker_name)}>{text}\n\n".encode('utf-8'))
+                        self.publish('wav', (audio * 32767).astype('<i2').tobytes())
+                        opus.write(audio)
+                        if samples == 0:
+                            print(f"{self.episode_id}: first clip after {time.perf_counter() - start_time:.1f}s")
+                        samples += len(audio)
+            # the spools are copied to the cache in parts, the wav with the header of its actual length
+            stream_cache.put_chunks(self.key + '.wav',
+                                    itertools.chain([wav_header(self.sizes['wav'] - 44)], self.iter_spool('wav', 44)))
+            stream_cache.put_chunks(self.key + '.opus', self.iter_spool('opus'))
+            # the vtt is put last, it marks the episode as cached
+            stream_cache.put_chunks(self.key + '.vtt', self.iter_spool('vtt'))
+            print(f"{self.episode_id}: {samples / sample_rate:.1f}s of audio finished after "
+                  f"{time.perf_counter() - start_time:.1f}s, cached for replay")
+        except Exception as e:
+            print(f"Error: synthesis of {self.episode_id} failed: {e}")
+            self.error = e
+        finally:
+            with live_lock:
+                live.pop(self.key, None)
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+            self.release()
+
+    # the chunks of a stream from its start, waiting for the next ones until the run is done.
+    # Raises SynthesisFailed after the last chunk if the run failed
+    def follow(self, name):
+        offset = 0
+        while True:
+            with self.condition:
+                while offset == self.sizes[name] and not self.done:
+                    self.condition.wait()
+                if offset == self.sizes[name]:
+                    if self.error is not None:
+                        raise SynthesisFailed(f"synthesis of {self.episode_id} failed: {self.error}")
+                    return
+            chunk = self.read(name, offset, self.read_size)
+            offset += len(chunk)
+            yield chunk
+
+# the live episode of a transcript, started if there is none, or None if the episode is cached.
+# With listen the caller is counted as a listener, and calls episode.release(listener=True) when it leaves
+def get_live_episode(episode_id, parsed_transcript, language='en', default_speaker=None, listen=True):
+    key = episode_key(episode_id, parsed_transcript, language, default_speaker)
+    # the listener is counted before live_lock is released, so the run can not close the
+    # spools between its end and the listener starting to read them
+    with live_lock:
+        if key in live:
+            episode = live[key]
+            with episode.condition:
+                episode.listeners += listen
+            return episode
+        if os.path.exists(stream_cache.path(key + '.vtt')):
+            return None
+        episode = live[key] = LiveEpisode(episode_id, key, parsed_transcript)
+        episode.listeners += listen
+    threading.Thread(target=episode.run, daemon=True).start()
+    return episode
+
+# the parsed transcript of an episode with the language and default speaker it was parsed with:
+# posted as a run yaml (waiting for it to be generated, with the settings of the yaml), or saved
+# in the artifact store. None if there is none
+def get_parsed_transcript(episode_id, language='en', default_speaker=None):
+    if episode_id in transcripts:
+        future, language, default_speaker = transcripts[episode_id]
+        return future.result(), language, default_speaker
+    transcript = load_transcript(episode_id)
+    if transcript is None:
+        return None
+    return parse_transcript(transcript, language, default_speaker), language, default_speaker
+
+def prepare_config(config):
+    episode_id, parsed_transcript = generate_episode_transcript(config)
+    get_live_episode(episode_id, parsed_transcript, config['language'], config['default_speaker'], listen=False)
+    return parsed_transcript
+
+class StreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_chunked(self, chunks, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        for chunk in chunks:
+            if chunk:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+        self.wfile.write(b'0\r\n\r\n')
+
+    # a cached episode file with its Content-Length, read LiveEpisode.read_size bytes at a time
+    def send_file(self, file, content_type):
+        with file:
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(os.fstat(file.fileno()).st_size))
+            self.end_headers()
+            while True:
+                chunk = file.read(LiveEpisode.read_size)
+                if not chunk:
+                    return
+                self.wfile.write(chunk)
+
+    def do_GET(self):
+        if self.path == '/health':
+            with live_lock:
+                episodes = {episode.episode_id: episode.listeners for episode in live.values()}
+            health = {'status': 'ok', 'model_loaded': tts_gen.chat is not None, 'live': episodes}
+            self.send_body(200, json.dumps(health).encode(), 'application/json')
+            return
+        url = urlsplit(self.path)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        directory, _, name = url.path.rpartition('/')
+        episode_id, _, extension = name.rpartition('.')
+        if directory != '/episodes' or extension not in content_types or not episode_id:
+            self.send_error(404)
+            return
+        try:
+            result = get_parsed_transcript(episode_id, query.get('language', 'en'), query.get('default_speaker'))
+        except Exception as e:
+            print(f"Error: no transcript for {episode_id}: {e}")
+            self.send_body(500, json.dumps({'error': str(e)}).encode(), 'application/json')
+            return
+        if result is None:
+            self.send_error(404, f"no transcript for {episode_id}")
+            return
+        parsed_transcript, language, default_speaker = result
+        key = f"{episode_key(episode_id, parsed_transcript, language, default_speaker)}.{extension}"
+        cached = stream_cache.open(key)
+        episode = get_live_episode(episode_id, parsed_transcript, language, default_speaker) if cached is None else None
+        if episode is None:
+            cached = cached if cached is not None else stream_cache.open(key)
+            if cached is None:
+                self.send_error(503, 'evicted from the cache, try again')
+                return
+            try:
+                self.send_file(cached, content_types[extension])
+            except (BrokenPipeError, ConnectionResetError):
+                self.close_connection = True
+            return
+        try:
+            self.send_chunked(episode.follow(extension), content_types[extension])
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        except SynthesisFailed as e:
+            # the final chunk is never sent: the client sees the transfer cut short
+            print(f"Error: {episode_id}.{extension} stream cut: {e}")
+            self.close_connection = True
+        finally:
+            episode.release(listener=True)
+
+    def do_POST(self):
+        if self.path != '/episodes':
+            self.send_error(404)
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            config = load_config(json.loads(self.rfile.read(length))['config'])
+            episode_id, _ = get_episode_source(config['url'])
+        except Exception as e:
+            self.send_body(400, json.dumps({'error': str(e)}).encode(), 'application/json')
+            return
+        transcripts[episode_id] = (transcript_pool.submit(prepare_config, config), config['language'],
+                                   config['default_speaker'])
+        urls = {extension: f"/episodes/{episode_id}.{extension}" for extension in content_types}
+        self.send_body(202, json.dumps({'id': episode_id, **urls}).encode(), 'application/json')
+
+def make_server(host='127.0.0.1', port=8766):
+    return ThreadingHTTPServer((host, port), StreamHandler)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stream episodes while they are synthesized')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--tts-batch-size', type=int, default=tts_batch_size)
+    args = parser.parse_args()
+
+    tts_batch_size = args.tts_batch_size
+    server = make_server(args.host, args.port)
+    tts_gen.warmup().join()
+    print(f"stream server listening on http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -1,9 +1,23 @@
 import yaml
 import os
-from llm_funcs import gen_gpt_chat_completion
-from arxiv_reader import get_arxiv, get_arxiv_id
-from pdf_reader import get_pdf
-import requests
+import re
+import telemetry
+from llm_funcs import gen_gpt_chat_completion, gen_gpt_chat_stream
+from arxiv_reader import get_arxiv, get_arxiv_id, get_latest_versions, arxiv_base_url, flatten_sections
+from pdf_reader import get_pdf, get_json_id, get_pdf_version
+from scidir_reader import get_sciencedirect
+from stage_graph import run_stages, print_stage_timings
+from manifest import checkpoint
+from concurrent.futures import ThreadPoolExecutor
+from http_fetch import download_file
+
+# papers longer than this (in estimated tokens) are summarized section by section
+# (map) and the three-pass analysis and transcript work on the section digests (reduce);
+# shorter papers keep the single-call path. Set to None to disable map-reduce
+map_reduce_threshold_tokens = 24000
+# the most tokens of paper content sent in one section summary call
+section_token_budget = 6000
+section_summary_tokens = 600
 
 def load_system_prompt(yaml_file):
     with open(yaml_file) as file:
@@ -81,17 +95,103 @@ def third_pass(content, first_pass_summary, second_pass_summary):
     """
     return gen_gpt_chat_completion("", prompt.format(content=content, first_pass_summary=first_pass_summary, second_pass_summary=second_pass_summary), temp=0.7).choices[0].message.content
 
+# generate the final transcript with some high temperature for more creativity.
+# if stream_callback is given, the completion is streamed and every text chunk
+# is passed to it as soon as it arrives, so speech synthesis can start early
+def generate_transcript_text(system_prompt, user_prompt, stream_callback=None):
+    if stream_callback is None:
+        return gen_gpt_chat_completion(system_prompt, user_prompt, temp=0.7, max_tokens=4096).choices[-1].message.content.strip()
+    chunks = []
+    for chunk in gen_gpt_chat_stream(system_prompt, user_prompt, temp=0.7, max_tokens=4096):
+        chunks.append(chunk)
+        stream_callback(chunk)
+    return ''.join(chunks).strip()
+
+# rough token count, about 4 characters per token for English text
+def estimate_tokens(text):
+    return len(text) // 4
+
+# split the (title, text) sections into pieces of at most token_budget tokens:
+# long sections are cut on paragraph boundaries and short neighbouring sections are merged
+def split_sections(sections, token_budget):
+    max_chars = token_budget * 4
+    pieces = []
+    for title, text in sections:
+        chunk, chunk_chars = [], 0
+        for paragraph in text.split('\n'):
+            # a single paragraph over the budget is cut into budget-sized parts
+            for i in range(0, max(len(paragraph), 1), max_chars):
+                part = paragraph[i:i + max_chars]
+                if chunk and chunk_chars + len(part) > max_chars:
+                    pieces.append((title, '\n'.join(chunk)))
+                    chunk, chunk_chars = [], 0
+                chunk.append(part)
+                chunk_chars += len(part) + 1
+        if ''.join(chunk).strip():
+            pieces.append((title, '\n'.join(chunk)))
+
+    merged = []
+    for title, text in pieces:
+        if merged and len(merged[-1][1]) + len(text) < max_chars // 2:
+            merged[-1] = (merged[-1][0] + ' / ' + title, merged[-1][1] + '\n' + text)
+        else:
+            merged.append((title, text))
+    return merged
+
+def summarize_section(title, text, max_tokens=None):
+    prompt = """
+    Summarize the following part of a scientific paper for a reader who will later analyze the whole paper
+    from the summaries of all its parts. Keep the claims, methods, key numbers and results, the figures and
+    tables mentioned, and any assumptions or limitations. Do not add anything that is not in the text.
+
+    Section: {title}
+
+    {text}
+
+    Summary:
+    """
+    return gen_gpt_chat_completion("", prompt.format(title=title, text=text), temp=0.1,
+                                   max_tokens=max_tokens or section_summary_tokens).choices[0].message.content.strip()
+
+# summarize the parts of the (title, text) sections concurrently, each summary in at most
+# summary_tokens tokens, and join them into a digest with the part titles as headings
+def summarize_parts(sections, summary_tokens=section_summary_tokens, max_workers=8):
+    pieces = split_sections(sections, section_token_budget)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        summaries = list(pool.map(lambda piece: summarize_section(*piece, max_tokens=summary_tokens), pieces))
+    return ''.join(f"## {title}\n\n{summary}\n\n" for (title, _), summary in zip(pieces, summaries)), len(pieces)
+
+# Map-reduce mode for long papers: summarize the sections concurrently, each call under
+# the section token budget, and join the summaries into a digest that replaces the full
+# content in the later calls. Short papers return the content unchanged
+def condense_content(content, sections, max_workers=8):
+    if map_reduce_threshold_tokens is None or estimate_tokens(content) <= map_reduce_threshold_tokens:
+        return content
+    digest, parts = summarize_parts(sections, max_workers=max_workers)
+    print(f"long paper: {estimate_tokens(content)} tokens summarized in {parts} parts "
+          f"into a {estimate_tokens(digest)} token digest")
+    return digest
+
+# predict the research field of the article from its title and abstract
+def predict_article_topic(topic_prompt, title, abstract):
+    topic_prediction = gen_gpt_chat_completion("", topic_prompt + '\n Title:' + title + '\nAbstract:' + abstract + '\n')
+    generated_topic = topic_prediction.choices[-1].message.content.strip()
+    print("article topic:", generated_topic)
+    return generated_topic
+
+# a transcript restored from the manifest of a resumed run was never streamed,
+# it is passed on in one chunk
+def replay_restored(stage_timings, summary, stream_callback):
+    if stream_callback is not None and stage_timings['summary'].get('restored'):
+        stream_callback(summary)
+
+# stream the PDF to disk, revalidating a previously downloaded copy
 def download_pdf(url, file_path):
-    response = requests.get(url)
-    if response.status_code == 200:
-        with open(file_path, 'wb') as f:
-            f.write(response.content)
-        return True
-    return False
+    return download_file(url, file_path)
 
-def generate_summary_arxiv(url='https://arxiv.org/abs/2405.04434', episode='1', use_cache=False,
-                           prompt='dialogue_prompt', background_knowledge='None',
-                           additional_research_questions="None"):
+# fetch and parse an arXiv paper from its HTML render, or from its PDF if there is none.
+# Returns the paper dict of arxiv_reader (or pdf_reader for the PDF), None on failure
+def load_arxiv_paper(url, use_cache=False):
     arxiv_id = get_arxiv_id(url)
     if not arxiv_id:
         print(f"Error: Could not extract arXiv ID from URL: {url}")
@@ -103,10 +203,10 @@ def generate_summary_arxiv(url='https://arxiv.org/abs/2405.04434', episode='1',
     if not arxiv_dict or 'content' not in arxiv_dict or not arxiv_dict['content'].strip():
         print(f"HTML content not available for {url}. Attempting to fetch PDF...")
         # Construct PDF URL and local file path
-        pdf_url = f"https://arxiv.org/pdf/{arxiv_id}"
+        pdf_url = f"{arxiv_base_url}/pdf/{arxiv_id}"
         pdf_dir = 'pdfs'
         if not os.path.exists(pdf_dir):
-            os.makedirs(pdf_dir)
+            os.makedirs(pdf_dir, exist_ok=True)
         pdf_path = os.path.join(pdf_dir, f"{arxiv_id}.pdf")
         
         if use_cache and os.path.exists(pdf_path):
@@ -122,7 +222,18 @@ def generate_summary_arxiv(url='https://arxiv.org/abs/2405.04434', episode='1',
         except Exception as e:
             print(f"Error processing PDF: {str(e)}")
             return None
-    
+    return arxiv_dict
+
+def generate_summary_arxiv(url='https://arxiv.org/abs/2405.04434', episode='1', use_cache=False,
+                           prompt='dialogue_prompt', background_knowledge='None',
+                           additional_research_questions="None", stream_callback=None, manifest=None):
+    arxiv_id = get_arxiv_id(url)
+    if not arxiv_id:
+        print(f"Error: Could not extract arXiv ID from URL: {url}")
+        return None
+
+    arxiv_dict = checkpoint(manifest, 'document', url, lambda: load_arxiv_paper(url, use_cache))
+
     prompt_dict = load_system_prompt('prompts.yaml')
 
     # Check if arxiv_dict is empty or doesn't contain expected keys
@@ -150,20 +261,44 @@ def generate_summary_arxiv(url='https://arxiv.org/abs/2405.04434', episode='1',
     abstract = arxiv_dict['abstract']
     content = arxiv_dict['content']
     dummy_content = 'Not available.'
-
-    topic_prediction = gen_gpt_chat_completion("", topic_prompt + '\n Title:' + title + '\nAbstract:' + abstract + '\n')
-    generated_topic = topic_prediction.choices[-1].message.content.strip()
-    print("article topic:", generated_topic)
-    research_question_prompt = research_question_prompt.replace('<TITLE>', title).replace('<ABSTRACT>', abstract).replace('<TOPIC>', generated_topic).replace('<CONTENT>', dummy_content)
-    # generate the research question using title and abstract
-    # TODO: research questions from title and abstract may not be the best choice
-    # the full text with selected sections may be better
-    research_questions = gen_gpt_chat_completion(research_question_prompt,'', temp=0.5).choices[-1].message.content.strip()
-    research_questions += "Additional research questions:\n" + additional_research_questions
-    # inject the generated topic, research questions etc
-    summarizer_prompt = generation_prompt.replace('<EPISODE_NUMBER>', episode).replace('<BACKGROUND_KNOWLEDGE>',background_knowledge_prompt).replace('<TITLE>', title).replace('<ABSTRACT>', abstract).replace('<AUTHORS>',authors).replace('<TOPIC>', generated_topic).replace('<RESEARCH_QUESTIONS>', research_questions)
-    # generate the summary with some high temperature for more creativity
-    summary = gen_gpt_chat_completion(summarizer_prompt, content, temp=0.7, max_tokens=4096).choices[-1].message.content.strip()
+    sections = flatten_sections(arxiv_dict.get('sections', {}))
+    if not sections:
+        sections = [(title, content)]
+
+    # the LLM calls as a dependency graph: topic -> research questions -> summary,
+    # with the section summaries of a long paper (paper_content) computed alongside
+    def condense_paper():
+        return condense_content(content, sections)
+
+    def predict_topic():
+        return predict_article_topic(topic_prompt, title, abstract)
+
+    def generate_research_questions(generated_topic):
+        prompt = research_question_prompt.replace('<TITLE>', title).replace('<ABSTRACT>', abstract).replace('<TOPIC>', generated_topic).replace('<CONTENT>', dummy_content)
+        # generate the research question using title and abstract
+        # TODO: research questions from title and abstract may not be the best choice
+        # the full text with selected sections may be better
+        research_questions = gen_gpt_chat_completion(prompt,'', temp=0.5).choices[-1].message.content.strip()
+        return research_questions + "Additional research questions:\n" + additional_research_questions
+
+    def generate_summary(paper_content, generated_topic, research_questions):
+        # inject the generated topic, research questions etc
+        summarizer_prompt = generation_prompt.replace('<EPISODE_NUMBER>', episode).replace('<BACKGROUND_KNOWLEDGE>',background_knowledge_prompt).replace('<TITLE>', title).replace('<ABSTRACT>', abstract).replace('<AUTHORS>',authors).replace('<TOPIC>', generated_topic).replace('<RESEARCH_QUESTIONS>', research_questions)
+        # generate the summary with some high temperature for more creativity
+        return generate_transcript_text(summarizer_prompt, paper_content, stream_callback)
+
+    results, stage_timings = run_stages({
+        'paper_content': ((), condense_paper, (content, sections, map_reduce_threshold_tokens)),
+        'generated_topic': ((), predict_topic, (topic_prompt, title, abstract)),
+        'research_questions': (('generated_topic',), generate_research_questions,
+                               (research_question_prompt, title, abstract, additional_research_questions)),
+        'summary': (('paper_content', 'generated_topic', 'research_questions'), generate_summary,
+                    (generation_prompt, episode, background_knowledge, title, abstract, authors)),
+    }, manifest=manifest)
+    print_stage_timings(stage_timings)
+    research_questions = results['research_questions']
+    summary = results['summary']
+    replay_restored(stage_timings, summary, stream_callback)
 
     return {
         'arxiv_id': arxiv_id,
@@ -173,13 +308,14 @@ def generate_summary_arxiv(url='https://arxiv.org/abs/2405.04434', episode='1',
         'content': content,
         'research_questions': research_questions,
         'summary': summary,
+        'stage_timings': stage_timings,
     }
 
 def generate_summary_pdf(pdf_path='pdfs/1-s2.0-S0079742124000033-main.pdf', episode='1', 
                          use_cache=False, prompt='dialogue_prompt', background_knowledge='None',
-                         additional_research_questions="None"):
-    from pdf_reader import get_pdf
-    pdf_json = get_pdf(pdf_path, use_cache=use_cache)
+                         additional_research_questions="None", stream_callback=None, manifest=None):
+    pdf_json = checkpoint(manifest, 'document', (pdf_path, get_pdf_version(pdf_path)),
+                          lambda: get_pdf(pdf_path, use_cache=use_cache))
     prompt_dict = load_system_prompt('prompts.yaml')
 
     generation_prompt = prompt_dict[prompt]
@@ -197,12 +333,36 @@ def generate_summary_pdf(pdf_path='pdfs/1-s2.0-S0079742124000033-main.pdf', epis
     for section, text in selected_content.items():
         short_content += section + ":\n" + text + '\n'
 
-    # Perform three-pass analysis
-    first_pass_summary = first_pass(content)
-    second_pass_summary = second_pass(content, first_pass_summary)
-    third_pass_summary = third_pass(content, first_pass_summary, second_pass_summary)
-    
-    three_pass_summary = f"""
+    # The LLM calls as a dependency graph. The topic and research questions do not depend
+    # on the three-pass analysis, so the two chains run concurrently:
+    # paper content -> first pass -> second pass -> third pass \
+    #                                                          -> summary
+    # topic -> research questions                             /
+    # where the paper content of a long paper is the digest of its parts
+    def condense_paper():
+        # the full_text sections are a short LLM extraction, so the raw text is split instead
+        return condense_content(content, [(title, content)])
+
+    def run_first_pass(paper_content):
+        return first_pass(paper_content)
+
+    def run_second_pass(paper_content, first_pass_summary):
+        return second_pass(paper_content, first_pass_summary)
+
+    def run_third_pass(paper_content, first_pass_summary, second_pass_summary):
+        return third_pass(paper_content, first_pass_summary, second_pass_summary)
+
+    def predict_topic():
+        return predict_article_topic(topic_prompt, title, abstract)
+
+    def generate_research_questions(generated_topic):
+        prompt = research_question_prompt.replace('<TITLE>', title).replace('<ABSTRACT>', abstract).replace('<TOPIC>', generated_topic).replace('<CONTENT>', short_content)
+        research_questions = gen_gpt_chat_completion(prompt,'', temp=0.5).choices[-1].message.content.strip()
+        return research_questions + "\nAdditional research questions:\n" + additional_research_questions
+
+    def generate_summary(paper_content, first_pass_summary, second_pass_summary, third_pass_summary,
+                         generated_topic, research_questions):
+        three_pass_summary = f"""
     First Pass:
     {first_pass_summary}
 
@@ -213,24 +373,34 @@ def generate_summary_pdf(pdf_path='pdfs/1-s2.0-S0079742124000033-main.pdf', epis
     {third_pass_summary}
     """
 
-    topic_prediction = gen_gpt_chat_completion("", topic_prompt + '\n Title:' + title + '\nAbstract:' + abstract + '\n')
-    generated_topic = topic_prediction.choices[-1].message.content.strip()
-    print("article topic:", generated_topic)
-    research_question_prompt = research_question_prompt.replace('<TITLE>', title).replace('<ABSTRACT>', abstract).replace('<TOPIC>', generated_topic).replace('<CONTENT>', short_content)
-    research_questions = gen_gpt_chat_completion(research_question_prompt,'', temp=0.5).choices[-1].message.content.strip()
-    research_questions += "\nAdditional research questions:\n" + additional_research_questions
-    
-    summarizer_prompt = generation_prompt.replace('<EPISODE_NUMBER>', episode)
-    summarizer_prompt = summarizer_prompt.replace('<BACKGROUND_KNOWLEDGE>', background_knowledge_prompt)
-    summarizer_prompt = summarizer_prompt.replace('<TITLE>', title)
-    summarizer_prompt = summarizer_prompt.replace('<ABSTRACT>', abstract)
-    summarizer_prompt = summarizer_prompt.replace('<AUTHORS>', authors)
-    summarizer_prompt = summarizer_prompt.replace('<TOPIC>', generated_topic)
-    summarizer_prompt = summarizer_prompt.replace('<RESEARCH_QUESTIONS>', research_questions)
-    summarizer_prompt = summarizer_prompt.replace('<THREE_PASS_ANALYSIS>', three_pass_summary)
-    summarizer_prompt = summarizer_prompt.replace('<ORIGINAL_CONTENT>', content)
-    
-    summary = gen_gpt_chat_completion(summarizer_prompt, '', temp=0.7, max_tokens=4096).choices[-1].message.content.strip()
+        summarizer_prompt = generation_prompt.replace('<EPISODE_NUMBER>', episode)
+        summarizer_prompt = summarizer_prompt.replace('<BACKGROUND_KNOWLEDGE>', background_knowledge_prompt)
+        summarizer_prompt = summarizer_prompt.replace('<TITLE>', title)
+        summarizer_prompt = summarizer_prompt.replace('<ABSTRACT>', abstract)
+        summarizer_prompt = summarizer_prompt.replace('<AUTHORS>', authors)
+        summarizer_prompt = summarizer_prompt.replace('<TOPIC>', generated_topic)
+        summarizer_prompt = summarizer_prompt.replace('<RESEARCH_QUESTIONS>', research_questions)
+        summarizer_prompt = summarizer_prompt.replace('<THREE_PASS_ANALYSIS>', three_pass_summary)
+        summarizer_prompt = summarizer_prompt.replace('<ORIGINAL_CONTENT>', paper_content)
+
+        return generate_transcript_text(summarizer_prompt, '', stream_callback)
+
+    results, stage_timings = run_stages({
+        'paper_content': ((), condense_paper, (content, title, map_reduce_threshold_tokens)),
+        'first_pass_summary': (('paper_content',), run_first_pass),
+        'second_pass_summary': (('paper_content', 'first_pass_summary'), run_second_pass),
+        'third_pass_summary': (('paper_content', 'first_pass_summary', 'second_pass_summary'), run_third_pass),
+        'generated_topic': ((), predict_topic, (topic_prompt, title, abstract)),
+        'research_questions': (('generated_topic',), generate_research_questions,
+                               (research_question_prompt, title, abstract, short_content, additional_research_questions)),
+        'summary': (('paper_content', 'first_pass_summary', 'second_pass_summary', 'third_pass_summary',
+                     'generated_topic', 'research_questions'), generate_summary,
+                    (generation_prompt, episode, background_knowledge, title, abstract, authors)),
+    }, manifest=manifest)
+    print_stage_timings(stage_timings)
+    research_questions = results['research_questions']
+    summary = results['summary']
+    replay_restored(stage_timings, summary, stream_callback)
 
     return {
         'pdf_id': pdf_json['pdf_id'],
@@ -240,6 +410,173 @@ def generate_summary_pdf(pdf_path='pdfs/1-s2.0-S0079742124000033-main.pdf', epis
         'content': content,
         'research_questions': research_questions,
         'summary': summary,
+        'stage_timings': stage_timings,
+    }
+
+# Multi-paper episodes: the sources (arXiv URLs, ScienceDirect URLs, local PDFs) are fetched
+# and parsed concurrently, deduplicated by id, and condensed in parallel so that their content
+# together stays under multi_paper_token_budget tokens (an equal share for each paper), before
+# a single transcript is written about all of them. The wall time is about the one of the
+# slowest paper instead of the sum
+multi_paper_token_budget = 24000
+# the smallest summary of one part of a paper, whatever its share of the budget
+min_part_summary_tokens = 100
+
+def is_sciencedirect(url):
+    return 'sciencedirect.com' in url
+
+# the id a source is deduplicated by: the arXiv id without its version, the ScienceDirect
+# article id or the id of the PDF file
+def get_source_id(url):
+    arxiv_id = get_arxiv_id(url)
+    if arxiv_id:
+        return re.sub(r'v\d+$', '', arxiv_id)
+    if is_sciencedirect(url):
+        return url.rstrip('/').split('/')[-1]
+    return get_json_id(url)
+
+# the sources of an episode without duplicates, as {source id: url} in the given order
+def unique_sources(urls):
+    sources = {}
+    for url in urls:
+        sources.setdefault(get_source_id(url), url)
+    return sources
+
+# fetch and parse any source into a paper dict with its id, title, authors, abstract,
+# content and (title, text) sections, None on failure
+def load_paper(url, use_cache=False):
+    if get_arxiv_id(url):
+        paper = load_arxiv_paper(url, use_cache)
+        if not paper:
+            return None
+        sections = flatten_sections(paper.get('sections', {}))
+    elif is_sciencedirect(url):
+        paper = get_sciencedirect(url, use_cache=use_cache)
+        sections = []
+    else:
+        paper = get_pdf(url, use_cache=use_cache)
+        sections = []
+    if not paper or not paper.get('content', '').strip():
+        print(f"Error: Failed to retrieve data for URL: {url}")
+        return None
+    authors = paper.get('authors', '')
+    if isinstance(authors, list):
+        authors = ', '.join(authors)
+    return {
+        'id': get_source_id(url),
+        'title': paper.get('title', ''),
+        'authors': authors,
+        'abstract': paper.get('abstract', ''),
+        'content': paper['content'],
+        'sections': sections or [(paper.get('title', ''), paper['content'])],
+    }
+
+# the content of one paper in at most token_budget tokens: the full text if it fits,
+# otherwise the digest of its parts with a summary length that fits the budget.
+# map_reduce_threshold_tokens = None keeps the full text, as for a single paper
+def condense_to_budget(paper, token_budget, max_workers=8):
+    tokens = estimate_tokens(paper['content'])
+    if map_reduce_threshold_tokens is None or tokens <= token_budget:
+        return paper['content']
+    parts = len(split_sections(paper['sections'], section_token_budget))
+    summary_tokens = max(min_part_summary_tokens, min(section_summary_tokens, token_budget // parts))
+    digest, _ = summarize_parts(paper['sections'], summary_tokens, max_workers)
+    print(f"{paper['id']}: {tokens} tokens summarized in {parts} parts into a {estimate_tokens(digest)} token digest")
+    return digest
+
+def generate_summary_multi(urls, episode='1', use_cache=False, prompt='dialogue_prompt',
+                           background_knowledge='None', additional_research_questions="None",
+                           stream_callback=None, manifest=None):
+    sources = unique_sources(urls)
+    if len(sources) < len(urls):
+        print(f"{len(urls) - len(sources)} duplicate sources skipped")
+    if not sources:
+        print(f"Error: Failed to retrieve any of the sources: {', '.join(urls)}")
+        return None
+    # resolve the latest versions of all the arxiv papers with a single API query
+    arxiv_ids = [get_arxiv_id(url) for url in sources.values() if get_arxiv_id(url)]
+    if len(arxiv_ids) > 1:
+        get_latest_versions(arxiv_ids)
+
+    with telemetry.span('fetch_papers', papers=len(sources)):
+        with ThreadPoolExecutor(max_workers=len(sources)) as pool:
+            papers = [paper for paper in pool.map(
+                lambda item: checkpoint(manifest, f"document_{item[0]}", item[1], lambda: load_paper(item[1], use_cache)),
+                sources.items()) if paper]
+    if not papers:
+        print(f"Error: Failed to retrieve any of the sources: {', '.join(urls)}")
+        return None
+
+    prompt_dict = load_system_prompt('prompts.yaml')
+    generation_prompt = prompt_dict[prompt]
+    research_question_prompt = prompt_dict['research_question_prompt']
+    topic_prompt = prompt_dict['topic_prompt']
+    token_budget = multi_paper_token_budget // len(papers)
+    titles = [paper['title'] for paper in papers]
+    if len(papers) == 1:
+        title = titles[0]
+    else:
+        title = f"A roundup of {len(papers)} papers: " + '; '.join(titles)
+    authors = '; '.join(paper['authors'] for paper in papers if paper['authors'])
+    abstract = '\n\n'.join(f"{paper['title']}: {paper['abstract']}" for paper in papers)
+
+    # the papers are condensed concurrently with each other and with the topic and the
+    # research questions, which only need the titles and abstracts
+    def condense_paper(paper):
+        return lambda: condense_to_budget(paper, token_budget)
+
+    def predict_topic():
+        return predict_article_topic(topic_prompt, title, abstract)
+
+    def generate_research_questions(generated_topic):
+        prompt = research_question_prompt.replace('<TITLE>', title).replace('<ABSTRACT>', abstract).replace('<TOPIC>', generated_topic).replace('<CONTENT>', 'Not available.')
+        research_questions = gen_gpt_chat_completion(prompt, '', temp=0.5).choices[-1].message.content.strip()
+        return research_questions + "\nAdditional research questions:\n" + additional_research_questions
+
+    def generate_summary(generated_topic, research_questions, **paper_contents):
+        contents = [paper_contents[f'paper_content_{i}'] for i in range(len(papers))]
+        paper_content = ''
+        if len(papers) > 1:
+            paper_content = (f"This episode covers the following {len(papers)} papers. Discuss each of them "
+                             f"and how they relate to each other.\n\n")
+        paper_content += ''.join(f"# Paper {i + 1}: {paper['title']}\nAuthors: {paper['authors']}\n\n{content}\n\n"
+                                 for i, (paper, content) in enumerate(zip(papers, contents)))
+        summarizer_prompt = generation_prompt.replace('<EPISODE_NUMBER>', episode)
+        summarizer_prompt = summarizer_prompt.replace('<BACKGROUND_KNOWLEDGE>', background_knowledge)
+        summarizer_prompt = summarizer_prompt.replace('<TITLE>', title)
+        summarizer_prompt = summarizer_prompt.replace('<ABSTRACT>', abstract)
+        summarizer_prompt = summarizer_prompt.replace('<AUTHORS>', authors)
+        summarizer_prompt = summarizer_prompt.replace('<TOPIC>', generated_topic)
+        summarizer_prompt = summarizer_prompt.replace('<RESEARCH_QUESTIONS>', research_questions)
+        # the prompts written for the PDF mode take the content in the system prompt
+        if '<ORIGINAL_CONTENT>' in summarizer_prompt:
+            summarizer_prompt = summarizer_prompt.replace('<THREE_PASS_ANALYSIS>', 'Not available.')
+            return generate_transcript_text(summarizer_prompt.replace('<ORIGINAL_CONTENT>', paper_content), '',
+                                            stream_callback)
+        return generate_transcript_text(summarizer_prompt, paper_content, stream_callback)
+
+    paper_stages = {f'paper_content_{i}': ((), condense_paper(paper), (paper, token_budget, map_reduce_threshold_tokens))
+                    for i, paper in enumerate(papers)}
+    results, stage_timings = run_stages({
+        **paper_stages,
+        'generated_topic': ((), predict_topic, (topic_prompt, title, abstract)),
+        'research_questions': (('generated_topic',), generate_research_questions,
+                               (research_question_prompt, title, abstract, additional_research_questions)),
+        'summary': (('generated_topic', 'research_questions', *paper_stages), generate_summary,
+                    (generation_prompt, episode, background_knowledge, title, abstract, authors, papers)),
+    }, max_workers=len(papers) + 2, manifest=manifest)
+    print_stage_timings(stage_timings)
+    replay_restored(stage_timings, results['summary'], stream_callback)
+
+    return {
+        'source_ids': [paper['id'] for paper in papers],
+        'titles': titles,
+        'title': title,
+        'authors': authors,
+        'abstract': abstract,
+        'research_questions': results['research_questions'],
+        'summary': results['summary'],
+        'stage_timings': stage_timings,
     }
 
 if __name__ == '__main__':
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import threading
+
+# Per-stage timing and counters for a run. Stages are recorded as spans:
+#   with telemetry.span('llm_call', model='gpt-4o') as span:
+#       ...
+#       span.set(prompt_tokens=120)
+# Tracing is off unless enable() is called (the trace key of a run yaml, or PAPERCAST_TRACE=1);
+# a disabled span is a shared no-op object, so instrumented code pays one function call.
+
+enabled = os.environ.get('PAPERCAST_TRACE', '0') == '1'
+spans = []
+lock = threading.Lock()
+start_time = time.perf_counter()
+
+class Span:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        end = time.perf_counter()
+        record = {
+            'name': self.name,
+            'start': round(self.start - start_time, 6),
+            'seconds': round(end - self.start, 6),
+            'thread': threading.current_thread().name,
+            **self.attrs,
+        }
+        if exc_type is not None:
+            record['error'] = repr(exc)
+        with lock:
+            spans.append(record)
+        return False
+
+class NoopSpan:
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+noop_span = NoopSpan()
+
+def span(name, **attrs):
+    if not enabled:
+        return noop_span
+    return Span(name, attrs)
+
+# record a span measured by the caller, e.g. the share of one utterance in a batch
+def record(name, seconds, **attrs):
+    if not enabled:
+        return
+    with lock:
+        spans.append({'name': name, 'start': round(time.perf_counter() - seconds - start_time, 6),
+                      'seconds': round(seconds, 6), 'thread': threading.current_thread().name, **attrs})
+
+# seconds since a span was entered, 0 for a disabled span
+def elapsed(span):
+    if isinstance(span, Span):
+        return round(time.perf_counter() - span.start, 6)
+    return 0
+
+def enable():
+    global enabled, start_time
+    enabled = True
+    start_time = time.perf_counter()
+    with lock:
+        spans.clear()
+
+# aggregate the spans by name: count, total seconds, and the sum of every numeric attribute
+def summarize():
+    summary = {}
+    with lock:
+        records = list(spans)
+    for record in records:
+        entry = summary.setdefault(record['name'], {'count': 0, 'seconds': 0.0})
+        entry['count'] += 1
+        entry['seconds'] += record['seconds']
+        for key, value in record.items():
+            if key not in ('name', 'start', 'seconds') and not key.endswith('_id') and isinstance(value, (int, float)) and not isinstance(value, bool):
+                entry[key] = entry.get(key, 0) + value
+    # real-time factor of the speech synthesis over the whole run
+    tts = summary.get('tts_utterance')
+    if tts and tts.get('audio_seconds'):
+        tts['real_time_factor'] = tts['synthesis_seconds'] / tts['audio_seconds']
+    for entry in summary.values():
+        for key, value in entry.items():
+            if isinstance(value, float):
+                entry[key] = round(value, 3)
+    return summary
+
+def write_trace(path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with lock:
+        records = list(spans)
+    with open(path, 'w') as file:
+        json.dump({'spans': records, 'summary': summarize(),
+                   'wall_seconds': round(time.perf_counter() - start_time, 3)}, file, indent=1)
+    print(f"Trace saved to {path}")
+
+def print_summary():
+    print(f"\n{'stage':<20} {'count':>6} {'seconds':>10}  details")
+    for name, entry in sorted(summarize().items(), key=lambda item: -item[1]['seconds']):
+        details = ', '.join(f"{key}={value}" for key, value in entry.items() if key not in ('count', 'seconds'))
+        print(f"{name:<20} {entry['count']:>6} {entry['seconds']:>10.2f}  {details}")
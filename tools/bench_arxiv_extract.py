@@ -0,0 +1,163 @@
+import os
+import re
+import sys
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, tools_dir)
+sys.path.insert(0, os.path.dirname(tools_dir))
+
+from bs4 import BeautifulSoup
+from make_fixtures import make_arxiv_html
+import arxiv_reader
+
+# Compare the single-pass lxml extraction of arxiv_reader.extract_html with the BeautifulSoup
+# html.parser path it replaces, on saved arXiv HTML pages (--fixtures, every *.html file under
+# the folder) or on large synthetic LaTeXML pages with inline MathML: the parse and extraction
+# time, and the peak memory over the pages, measured in a fresh process for each engine.
+# The extracted text must be the same: the content of every section of the old path is the
+# content of the section and its subsections in the new one.
+#   python tools/bench_arxiv_extract.py --papers 5 --sections 20 --formulas 3
+#   python tools/bench_arxiv_extract.py --fixtures saved_pages/
+
+# the extraction of arxiv_reader before the lxml engine: a full html.parser tree,
+# rescanned by each of the extract functions
+def old_extract_html(html_content):
+    soup = BeautifulSoup(html_content, 'html.parser')
+    title_tag = soup.title
+    authors = [arxiv_reader.clean_author_name(tag.text) for tag in soup.find_all('span', class_='ltx_personname')]
+    abstract_tag = soup.find('div', class_='ltx_abstract')
+    sections = {}
+    for section_tag in soup.find_all('section', class_='ltx_section'):
+        section_title_tag = section_tag.find('h2')
+        section_title = section_title_tag.text.strip() if section_title_tag else 'No Title'
+        section_title = re.sub(r'^\d+\s', '', section_title)
+        sections[section_title] = {
+            'content': ' '.join(p.text.strip() for p in section_tag.find_all('p')),
+            'id': section_tag.get('id', 'No ID'),
+        }
+    return {
+        'title': title_tag.string if title_tag else "No Title",
+        'authors': authors or ["No Authors"],
+        'abstract': abstract_tag.text.strip() if abstract_tag else "No Abstract",
+        'sections': sections or {"No Sections": {"content": "Content not available", "id": "No ID"}},
+    }
+
+engines = {
+    'bs4 html.parser': old_extract_html,
+    'lxml single pass': arxiv_reader.extract_html,
+}
+
+def read_pages(paths):
+    pages = []
+    for path in paths:
+        with open(path, encoding='utf-8') as file:
+            pages.append(file.read())
+    return pages
+
+def best_time(function, pages, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for page in pages:
+            function(page)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def rss_kb(field):
+    with open('/proc/self/status') as file:
+        for line in file:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return 0
+
+# run in a child process: the peak memory of extracting the pages one after the other,
+# over the memory of the process with the pages already loaded
+def measure_memory(engine, paths):
+    pages = read_pages(paths)
+    baseline = rss_kb('VmRSS')
+    for page in pages:
+        engines[engine](page)
+    print(max(rss_kb('VmHWM') - baseline, 0) / 1024)
+
+def normalize(text):
+    return ' '.join(text.split())
+
+# the differences between the old and the new extraction of a page
+def compare(old, new):
+    differences = []
+    for key in ['title', 'authors']:
+        if old[key] != new[key]:
+            differences.append(key)
+    # the old abstract started with its "Abstract" heading
+    if not normalize(old['abstract']).endswith(normalize(new['abstract'])):
+        differences.append('abstract')
+    if list(old['sections']) != list(new['sections']):
+        differences.append('section titles')
+    for title, section in new['sections'].items():
+        content = ' '.join([section['content']] + [text for _, text in
+                                                  arxiv_reader.flatten_sections(section.get('subsections', {}))])
+        if title in old['sections'] and normalize(old['sections'][title]['content']) != normalize(content):
+            differences.append(f"content of {title}")
+    return differences
+
+def count_sections(sections):
+    return sum(1 + count_sections(section.get('subsections', {})) for section in sections.values())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fixtures', help='a folder of saved arXiv HTML pages, instead of synthetic ones')
+    parser.add_argument('--papers', type=int, default=5)
+    parser.add_argument('--sections', type=int, default=20)
+    parser.add_argument('--subsections', type=int, default=3)
+    parser.add_argument('--paragraphs', type=int, default=8)
+    parser.add_argument('--formulas', type=int, default=3, help='inline formulas per paragraph')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--memory', help=argparse.SUPPRESS)
+    parser.add_argument('paths', nargs='*', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.memory:
+        measure_memory(args.memory, args.paths)
+        sys.exit(0)
+
+    work_dir = None
+    if args.fixtures:
+        paths = sorted(glob.glob(os.path.join(args.fixtures, '**', '*.html'), recursive=True))
+    else:
+        work_dir = tempfile.mkdtemp()
+        paths = []
+        for index in range(args.papers):
+            path = os.path.join(work_dir, f"2401.{index + 1:05d}v1.html")
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(make_arxiv_html(f"2401.{index + 1:05d}", args.sections, args.subsections,
+                                           args.paragraphs, seed=index, formulas=args.formulas))
+            paths.append(path)
+    pages = read_pages(paths)
+    megabytes = sum(len(page.encode('utf-8')) for page in pages) / 1e6
+    print(f"{len(pages)} pages, {megabytes:.1f} MB")
+
+    print(f"{'engine':<18} {'time (s)':>9} {'MB/s':>8} {'peak memory (MB)':>17}")
+    for name, function in engines.items():
+        seconds = best_time(function, pages, args.repeat)
+        memory = subprocess.run([sys.executable, os.path.abspath(__file__), '--memory', name, *paths],
+                                capture_output=True, text=True, check=True).stdout.strip()
+        print(f"{name:<18} {seconds:>9.3f} {megabytes / seconds:>8.1f} {float(memory):>17.1f}")
+
+    mismatches = 0
+    for path, page in zip(paths, pages):
+        new = arxiv_reader.extract_html(page)
+        differences = compare(old_extract_html(page), new)
+        if differences:
+            mismatches += 1
+            print(f"{os.path.basename(path)}: differs in {', '.join(differences)}")
+    print(f"{len(pages) - mismatches}/{len(pages)} pages with the same text, "
+          f"{sum(count_sections(arxiv_reader.extract_html(page)['sections']) for page in pages)} sections and subsections")
+    if work_dir:
+        shutil.rmtree(work_dir)
+    sys.exit(1 if mismatches else 0)
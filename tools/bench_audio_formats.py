@@ -0,0 +1,94 @@
+import os
+import sys
+import glob
+import time
+import argparse
+
+import numpy as np
+import soundfile
+
+# run from the repo root so the speaker embeddings and ChatTTS are found
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, tools_dir)
+sys.path.insert(0, os.path.dirname(tools_dir))
+
+from make_fixtures import make_transcript
+from run import parse_transcript
+from episode_writer import get_output_path, output_duration
+from tts_gen import produce_audio
+import tts_gen
+
+# The output formats of an episode (audio_format and segment_seconds) against the WAV file:
+# the bytes written, the end-to-end time of produce_audio, and the time until the first audio
+# can be played (the whole episode for a single file, the first segment of a playlist).
+# Every format must decode to as many seconds as the WAV file, and every subtitle of the
+# segment SRTs must fall inside its segment.
+#   python tools/bench_audio_formats.py --lines 40 --segment-seconds 10
+# Without the model weights, with the stand-in of tools/fake_chattts:
+#   PYTHONPATH=tools/fake_chattts FAKE_TTS_RTF=0.05 python tools/bench_audio_formats.py --master
+def output_files(path):
+    if not path.endswith('.m3u8'):
+        return [path]
+    return [path] + sorted(glob.glob(os.path.join(os.path.splitext(path)[0], 'segment_*')))
+
+def decoded_seconds(path):
+    if not path.endswith('.m3u8'):
+        return soundfile.info(path).frames / 24000
+    folder = os.path.splitext(path)[0]
+    return sum(soundfile.info(segment).frames for segment in glob.glob(os.path.join(folder, 'segment_*'))
+               if not segment.endswith('.srt')) / 24000
+
+# the subtitles of the segment SRTs that start before 0 or end after the segment
+def misaligned_subtitles(path, segment_seconds):
+    misaligned = 0
+    for srt_path in glob.glob(os.path.join(os.path.splitext(path)[0], 'segment_*.srt')):
+        with open(srt_path) as file:
+            for line in file:
+                if '-->' in line:
+                    times = [sum(float(part) * scale for part, scale in zip(stamp.strip().replace(',', '.').split(':'),
+                                                                           [3600, 60, 1]))
+                             for stamp in line.split('-->')]
+                    misaligned += times[0] < 0 or times[1] > segment_seconds + 0.001
+    return misaligned
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=40, help='lines of the synthetic transcript')
+    parser.add_argument('--formats', default='wav,flac,opus')
+    parser.add_argument('--segment-seconds', type=float, default=10.0, help='also write each format as segments, 0 not to')
+    parser.add_argument('--master', action='store_true', help='through the mastering final pass')
+    args = parser.parse_args()
+
+    parsed_transcript = parse_transcript(make_transcript(args.lines))
+    tts_gen.clip_cache_enabled = False
+    master = {} if args.master else None
+    runs = [(audio_format, None) for audio_format in args.formats.split(',')]
+    if args.segment_seconds:
+        runs += [(audio_format, args.segment_seconds) for audio_format in args.formats.split(',')]
+
+    results = []
+    for audio_format, segment_seconds in runs:
+        audio_filename = 'bench_formats.wav'
+        path = get_output_path(audio_filename, audio_format, segment_seconds)
+        start = time.time()
+        produce_audio(parsed_transcript, audio_filename=audio_filename, master=master,
+                      audio_format=audio_format, segment_seconds=segment_seconds)
+        elapsed = time.time() - start
+        files = output_files(path)
+        first_audio = os.path.getmtime(files[1] if segment_seconds else path) - start
+        results.append((audio_format + (f" segments of {segment_seconds:g}s" if segment_seconds else ''),
+                        sum(os.path.getsize(file) for file in files), elapsed, first_audio,
+                        output_duration(path), decoded_seconds(path),
+                        misaligned_subtitles(path, segment_seconds) if segment_seconds else 0))
+
+    print(f"\n{len(parsed_transcript)} lines{', mastered' if args.master else ''}")
+    print(f"{'output':<24} {'bytes':>11} {'vs wav':>7} {'wall (s)':>9} {'first audio (s)':>16} "
+          f"{'audio (s)':>10} {'decoded (s)':>12} {'misaligned':>11}")
+    wav_bytes = next((size for name, size, *_ in results if name == 'wav'), results[0][1])
+    wav_seconds = next((seconds for name, _, _, _, _, seconds, _ in results if name == 'wav'), results[0][5])
+    mismatches = 0
+    for name, size, elapsed, first_audio, seconds, decoded, misaligned in results:
+        mismatches += not np.isclose(decoded, wav_seconds, atol=0.05) or misaligned > 0
+        print(f"{name:<24} {size:>11,} {size / wav_bytes:>7.3f} {elapsed:>9.2f} {first_audio:>16.2f} "
+              f"{seconds:>10.1f} {decoded:>12.2f} {misaligned:>11}")
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(tools_dir)
+sys.path.insert(0, tools_dir)
+
+import fake_openai_server
+import fixture_server
+from make_fixtures import make_fixtures, make_transcript
+
+# Offline end-to-end benchmark of the whole run.py flow, with local stand-ins for every
+# external dependency:
+#   - tools/fake_openai_server.py for the OpenAI API (canned completions with injected latency)
+#   - tools/fixture_server.py for arxiv.org (synthetic LaTeXML pages from tools/make_fixtures.py)
+#   - tools/fake_chattts for ChatTTS (deterministic audio with a simulated real-time factor)
+# Every scenario runs run.py or batch_run.py in a subprocess with tracing on, in a fresh
+# working directory, and reports the wall time, the peak RSS and the per-stage breakdown.
+#   python tools/bench_e2e.py --save bench.json
+#   python tools/bench_e2e.py --baseline bench.json   # flag scenarios that got slower
+
+scenarios = {
+    'one_paper': {'papers': 1, 'lines': None, 'batch': False, 'stream': False},
+    'one_paper_stream': {'papers': 1, 'lines': None, 'batch': False, 'stream': True},
+    'twenty_papers': {'papers': 20, 'lines': None, 'batch': True, 'stream': False},
+    'long_transcript': {'papers': 1, 'lines': 200, 'batch': False, 'stream': False},
+    # one episode about five papers (urls list), should take about as long as one_paper
+    'five_paper_roundup': {'papers': 5, 'lines': None, 'batch': False, 'stream': False, 'multi': True},
+}
+
+def start_in_thread(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+def write_configs(config_dir, arxiv_ids, stream, multi=False):
+    os.makedirs(config_dir, exist_ok=True)
+    # a multi-paper episode is a single config named after its first paper
+    sources = [arxiv_ids] if multi else [[arxiv_id] for arxiv_id in arxiv_ids]
+    for episode, ids in enumerate(sources, 1):
+        urls = ', '.join(f'"https://arxiv.org/abs/{arxiv_id}"' for arxiv_id in ids)
+        with open(os.path.join(config_dir, f"{ids[0]}.yaml"), 'w') as file:
+            file.write((f'urls: [{urls}]\n' if multi else f'url: {urls}\n') +
+                       f'use_cache: false\n'
+                       f'episode: {episode}\n'
+                       f'prompt: "dialogue_prompt"\n'
+                       f'background_knowledge: "None"\n'
+                       f'stream: {str(stream).lower()}\n'
+                       f'trace: true\n')
+
+# run a command and return its wall time, exit status and peak RSS in MB (from wait4)
+def run_measured(command, cwd, env, log_path):
+    start = time.perf_counter()
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen(command, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+        _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return time.perf_counter() - start, process.returncode, rusage.ru_maxrss / 1024
+
+def run_scenario(name, scenario, args, fixture_url, fixture_ids, work_root):
+    work_dir = os.path.join(work_root, name)
+    os.makedirs(work_dir)
+    # run.py loads the prompts and the speaker embeddings from the working directory
+    for file_name in ['prompts.yaml', 'seed_1509_restored_emb.pt', 'seed_1742_restored_emb.pt']:
+        os.symlink(os.path.join(repo_dir, file_name), os.path.join(work_dir, file_name))
+
+    transcript = make_transcript(scenario['lines']) if scenario['lines'] else None
+    llm_server = fake_openai_server.make_server(port=0, transcript=transcript, latency=args.llm_latency,
+                                                token_delay=args.token_delay)
+    llm_url = start_in_thread(llm_server)
+
+    arxiv_ids = fixture_ids[:scenario['papers']]
+    config_dir = os.path.join(work_dir, 'configs')
+    write_configs(config_dir, arxiv_ids, scenario['stream'], scenario.get('multi', False))
+    if scenario['batch']:
+        command = [sys.executable, os.path.join(repo_dir, 'batch_run.py'), config_dir, '--trace']
+    else:
+        command = [sys.executable, os.path.join(repo_dir, 'run.py'), os.path.join(config_dir, f"{arxiv_ids[0]}.yaml")]
+
+    env = dict(os.environ,
+               PYTHONPATH=os.path.join(tools_dir, 'fake_chattts'),
+               OPENAI_API_KEY='fake',
+               OPENAI_BASE_URL=llm_url + '/v1',
+               ARXIV_BASE_URL=fixture_url,
+               ARXIV_API_URL=fixture_url + '/api/query',
+               PAPERCAST_LLM_CACHE='0',
+               PAPERCAST_CLIP_CACHE='0',
+               PAPERCAST_REFINE_CACHE='0',
+               FAKE_TTS_RTF=str(args.tts_rtf))
+    wall_seconds, returncode, peak_rss_mb = run_measured(command, work_dir, env, os.path.join(work_dir, 'log.txt'))
+    llm_server.shutdown()
+
+    traces = sorted(glob.glob(os.path.join(work_dir, 'traces', '*.json')))
+    stages = {}
+    if traces:
+        with open(traces[-1]) as file:
+            stages = {stage: round(entry['seconds'], 3) for stage, entry in json.load(file)['summary'].items()}
+    return {
+        'wall_seconds': round(wall_seconds, 3),
+        'peak_rss_mb': round(peak_rss_mb, 1),
+        'returncode': returncode,
+        'stages': stages,
+        'log': os.path.join(work_dir, 'log.txt'),
+    }
+
+def report(results, baseline=None, tolerance=0.1):
+    print(f"\n{'scenario':<20} {'wall (s)':>10} {'peak RSS (MB)':>14}  stages (s)")
+    regressions = []
+    for name, result in results.items():
+        status = '' if result['returncode'] == 0 else f"  FAILED, see {result['log']}"
+        stages = ', '.join(f"{stage}={seconds:.2f}" for stage, seconds in
+                           sorted(result['stages'].items(), key=lambda item: -item[1])[:6])
+        print(f"{name:<20} {result['wall_seconds']:>10.2f} {result['peak_rss_mb']:>14.1f}  {stages}{status}")
+        if baseline and name in baseline:
+            previous = baseline[name]['wall_seconds']
+            if result['wall_seconds'] > previous * (1 + tolerance):
+                regressions.append(f"{name}: {previous:.2f}s -> {result['wall_seconds']:.2f}s")
+    if regressions:
+        print(f"\nslower than the baseline by more than {tolerance:.0%}:")
+        for regression in regressions:
+            print('  ' + regression)
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenarios', default=','.join(scenarios), help='comma separated subset of ' + ', '.join(scenarios))
+    parser.add_argument('--llm-latency', type=float, default=0.2, help='seconds before the first token of every LLM call')
+    parser.add_argument('--token-delay', type=float, default=0.002, help='seconds per generated token')
+    parser.add_argument('--tts-rtf', type=float, default=0.05, help='simulated real-time factor of the fake synthesizer')
+    parser.add_argument('--save', help='write the results to this json file')
+    parser.add_argument('--baseline', help='compare with results saved by --save')
+    parser.add_argument('--keep', action='store_true', help='keep the working directories')
+    args = parser.parse_args()
+
+    work_root = tempfile.mkdtemp(prefix='papercast_bench_')
+    fixture_ids = make_fixtures(os.path.join(work_root, 'fixtures'), papers=max(s['papers'] for s in scenarios.values()))
+    fixture = fixture_server.make_server(os.path.join(work_root, 'fixtures'), port=0)
+    fixture_url = start_in_thread(fixture)
+
+    results = {}
+    for name in args.scenarios.split(','):
+        print(f"running {name} ...", flush=True)
+        results[name] = run_scenario(name, scenarios[name], args, fixture_url, fixture_ids, work_root)
+    fixture.shutdown()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    regressions = report(results, baseline)
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=1)
+    if not args.keep:
+        shutil.rmtree(work_root)
+    sys.exit(1 if regressions or any(result['returncode'] for result in results.values()) else 0)
@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import soundfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mastering
+
+# Compare mastering.py with the pydub chain it replaces (normalize to -10 dBFS, then
+# compress_dynamic_range(threshold=-20, ratio=4, attack=5, release=50)) on a WAV file or a
+# synthetic speech-like signal: wall time of both, and how close the outputs are.
+#   python tools/bench_mastering.py --seconds 30
+#   python tools/bench_mastering.py audio/1706.03762.wav
+
+def pydub_master(path, target_dbfs, settings):
+    from pydub import AudioSegment
+    from pydub.effects import compress_dynamic_range
+    audio = AudioSegment.from_wav(path)
+    audio = audio.apply_gain(target_dbfs - audio.dBFS)
+    audio = compress_dynamic_range(audio, threshold=settings['threshold'], ratio=settings['ratio'],
+                                   attack=settings['attack'], release=settings['release'])
+    return np.array(audio.get_array_of_samples(), dtype=np.float64) / 32768
+
+# syllable-like bursts of a few harmonics with pauses, at varying loudness
+def make_speech_like(seconds, sample_rate=24000, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 120 + 60 * np.sin(2 * np.pi * 0.2 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    syllables = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) * (np.sin(2 * np.pi * 0.15 * t) > -0.6)
+    loudness = 0.05 + 0.25 * rng.random(int(seconds) + 1)[t.astype(int)]
+    return (voice * syllables * loudness + 0.003 * rng.standard_normal(len(t))).astype(np.float32)
+
+def level_db(x):
+    return mastering.dbfs(np.dot(x, x), len(x))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('wav', nargs='?', help='mono WAV file, a synthetic signal if omitted')
+    parser.add_argument('--seconds', type=float, default=30, help='length of the synthetic signal')
+    parser.add_argument('--skip-pydub', action='store_true', help='only time mastering.py (pydub takes minutes on long files)')
+    args = parser.parse_args()
+
+    path = args.wav
+    if path is None:
+        path = f"/tmp/bench_mastering_{int(args.seconds)}s.wav"
+        soundfile.write(path, make_speech_like(args.seconds), 24000, subtype='PCM_16')
+    settings = dict(mastering.default_settings, ceiling=None)
+    audio, sample_rate = soundfile.read(path)
+    print(f"{path}: {len(audio) / sample_rate:.1f}s at {sample_rate} Hz, {level_db(audio):.1f} dBFS")
+
+    start = time.perf_counter()
+    output = mastering.master(audio, sample_rate, **settings)
+    numpy_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    mastering.master_file(path, path + '.mastered.wav', block_seconds=10, **settings)
+    file_seconds = time.perf_counter() - start
+    os.remove(path + '.mastered.wav')
+    print(f"mastering.py, whole array:   {numpy_seconds:8.2f}s, output {level_db(output):.1f} dBFS")
+    print(f"mastering.py, 10s blocks:    {file_seconds:8.2f}s")
+
+    if not args.skip_pydub:
+        start = time.perf_counter()
+        reference = pydub_master(path, settings['target_dbfs'], settings)
+        pydub_seconds = time.perf_counter() - start
+        print(f"pydub:                       {pydub_seconds:8.2f}s, output {level_db(reference):.1f} dBFS "
+              f"({pydub_seconds / numpy_seconds:.0f}x slower)")
+        # short-term (50 ms) loudness of both outputs
+        window = int(sample_rate * 0.05)
+        frames = len(output) // window
+        envelope = lambda x: 10 * np.log10(np.mean(np.square(x[:frames * window]).reshape(frames, window), axis=1) + 1e-10)
+        voiced = envelope(reference) > -50
+        difference = np.abs(envelope(output) - envelope(reference))[voiced]
+        print(f"short-term loudness difference: median {np.median(difference):.2f} dB, "
+              f"95th percentile {np.percentile(difference, 95):.2f} dB, "
+              f"correlation of the waveforms {np.corrcoef(output, reference)[0, 1]:.4f}")
+        print("(the compressor of mastering.py approximates pydub's per-sample loop: the reduction reaches "
+              "its target at once instead of over the attack time, and is held for at most "
+              f"{mastering.compressor_hold_ms / 1000:g}s below the threshold)")
@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+import pdf_reader
+from disk_cache import DiskCache
+
+paragraph = ("Transformers replace recurrence with attention, so every position of a sequence attends to "
+             "every other position in a constant number of operations. ")
+
+# write a synthetic paper of the given number of pages, a few dense paragraphs per page
+def make_fixture(pdf_path, pages):
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        text = f"Section {page_number // 10 + 1}, page {page_number + 1}\n\n" + (paragraph * 3 + "\n\n") * 6
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=9)
+    doc.save(pdf_path)
+
+# change the text of one page, keeping all the other pages as they are
+def edit_page(pdf_path, page_number):
+    doc = fitz.open(pdf_path)
+    doc[page_number].insert_text((60, 820), "Erratum: this page was edited.", fontsize=8)
+    edited_path = pdf_path.replace('.pdf', '_edited.pdf')
+    doc.save(edited_path)
+    return edited_path
+
+def timed(label, function, *args, **kwargs):
+    start = time.perf_counter()
+    text = function(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed:>8.2f}s {len(text):>10} chars")
+    return elapsed
+
+def load_with_pypdf(pdf_path):
+    from pypdf import PdfReader
+    reader = PdfReader(pdf_path)
+    text = ""
+    for page in reader.pages:
+        text += page.extract_text()
+    return text
+
+# Benchmark the page text extraction on a multi-hundred-page PDF:
+# the former serial pypdf loop, PyMuPDF serial and parallel, and the page text cache
+# python tools/bench_pdf_extract.py --pages 400 --workers 8
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', type=int, default=400)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--pdf', help='benchmark an existing PDF instead of a synthetic one')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    pdf_reader.page_text_cache = DiskCache(os.path.join(work_dir, 'cache'), suffix='.txt')
+    pdf_path = args.pdf or os.path.join(work_dir, 'fixture.pdf')
+    if not args.pdf:
+        make_fixture(pdf_path, args.pages)
+    with fitz.open(pdf_path) as doc:
+        print(f"{pdf_path}: {len(doc)} pages, {os.path.getsize(pdf_path) / 1e6:.1f} MB\n")
+
+    try:
+        timed('pypdf serial (previous)', load_with_pypdf, pdf_path)
+    except ImportError:
+        print('pypdf not installed, skipping the previous path')
+    timed('PyMuPDF serial, no cache', pdf_reader.load_pdf_content, pdf_path, workers=1, use_cache=False)
+    timed(f'PyMuPDF {args.workers} workers, no cache', pdf_reader.load_pdf_content, pdf_path,
+          workers=args.workers, use_cache=False)
+    timed(f'PyMuPDF {args.workers} workers, cold cache', pdf_reader.load_pdf_content, pdf_path, workers=args.workers)
+    timed('warm cache', pdf_reader.load_pdf_content, pdf_path, workers=args.workers)
+    edited_path = edit_page(pdf_path, 10)
+    timed('one page edited', pdf_reader.load_pdf_content, edited_path, workers=args.workers)
+    print(f"\npage text cache: {pdf_reader.page_text_cache.stats()}")
+    shutil.rmtree(work_dir)
@@ -0,0 +1,94 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import time
+import subprocess
+
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+repo_dir = os.path.dirname(tools_dir)
+sys.path.insert(0, tools_dir)
+
+from make_fixtures import make_transcript
+
+# Startup time budget of run.py for the invocations that should never load the TTS model
+# or create the OpenAI client: `run.py --help` and a transcript-only run from the transcript
+# cache. Each command runs several times in a fresh interpreter; the script exits non-zero
+# if a median is over its budget or if torch / ChatTTS / openai get imported, e.g.
+#   python tools/bench_startup.py --repeat 5 --help-budget 1.0 --transcript-budget 2.0
+
+heavy_modules = ['torch', 'ChatTTS', 'openai']
+
+# run run.py in-process with the given arguments and print the heavy modules it imported
+probe = '''
+import json, runpy, sys
+sys.argv = [sys.argv[1]] + sys.argv[2:]
+sys.path.insert(0, {repo_dir!r})
+try:
+    runpy.run_path(sys.argv[0], run_name='__main__')
+except SystemExit:
+    pass
+print(json.dumps([name for name in {heavy_modules!r} if name in sys.modules]))
+'''
+
+def time_command(command, cwd, env, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=cwd, env=env, check=True, stdout=subprocess.DEVNULL)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+def loaded_heavy_modules(arguments, cwd, env):
+    code = probe.format(repo_dir=repo_dir, heavy_modules=heavy_modules)
+    output = subprocess.run([sys.executable, '-c', code, os.path.join(repo_dir, 'run.py')] + arguments,
+                            cwd=cwd, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+# a working directory with a cached transcript and a run yaml with use_cache: true
+def make_workdir(work_dir):
+    arxiv_id = '2401.00001'
+    os.makedirs(os.path.join(work_dir, 'transcript'))
+    with open(os.path.join(work_dir, 'transcript', arxiv_id + '.json'), 'w') as file:
+        json.dump({'arxiv_id': arxiv_id, 'summary': make_transcript(40)}, file)
+    config_path = os.path.join(work_dir, 'run.yaml')
+    with open(config_path, 'w') as file:
+        file.write(f'url: "https://arxiv.org/abs/{arxiv_id}"\n'
+                   f'use_cache: true\n'
+                   f'episode: 1\n'
+                   f'background_knowledge: "None"\n')
+    return config_path
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--help-budget', type=float, default=1.0, help='median seconds allowed for run.py --help')
+    parser.add_argument('--transcript-budget', type=float, default=2.0,
+                        help='median seconds allowed for a cached transcript-only run')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='papercast_startup_')
+    config_path = make_workdir(work_dir)
+    # no API key: a cache-only run must not need one
+    env = {key: value for key, value in os.environ.items() if key != 'OPENAI_API_KEY'}
+    run_py = os.path.join(repo_dir, 'run.py')
+    cases = [
+        ('run.py --help', ['--help'], args.help_budget),
+        ('run.py --transcript-only', [config_path, '--transcript-only'], args.transcript_budget),
+    ]
+
+    failed = False
+    print(f"{'command':<28} {'min (s)':>8} {'median (s)':>11} {'budget (s)':>11}  heavy imports")
+    for name, arguments, budget in cases:
+        seconds = time_command([sys.executable, run_py] + arguments, work_dir, env, args.repeat)
+        heavy = loaded_heavy_modules(arguments, work_dir, env)
+        median = statistics.median(seconds)
+        over = median > budget or bool(heavy)
+        failed = failed or over
+        print(f"{name:<28} {min(seconds):>8.2f} {median:>11.2f} {budget:>11.2f}  "
+              f"{', '.join(heavy) or 'none'}{'  OVER BUDGET' if over else ''}")
+    shutil.rmtree(work_dir)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,111 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import http.client
+
+# a store and a stream cache of its own, so the benchmark leaves nothing in the repo
+work_dir = tempfile.mkdtemp()
+os.environ['PAPERCAST_STORE'] = os.path.join(work_dir, 'papercast.db')
+os.environ['PAPERCAST_STREAM_CACHE_DIR'] = os.path.join(work_dir, 'stream_cache')
+
+# run from the repo root so the speaker embeddings and ChatTTS are found
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, tools_dir)
+sys.path.insert(0, os.path.dirname(tools_dir))
+
+from make_fixtures import make_transcript
+from run import parse_transcript
+from artifact_store import store
+from tts_gen import produce_audio
+import stream_server
+import tts_gen
+
+# Time to the first audio of stream_server.py against waiting for the WAV file of produce_audio,
+# on a synthetic transcript of --lines lines: several listeners join the same episode at
+# --stagger second intervals (wav, opus and vtt in turn), and each reports when its first byte
+# past the stream preamble (the WAV header, the WEBVTT line) arrived and when the stream ended.
+# All the wav listeners must receive the same bytes, those of the cached file, and a replay of
+# the finished episode comes from the cache.
+# Without the model weights, with the stand-in of tools/fake_chattts:
+#   PYTHONPATH=tools/fake_chattts FAKE_TTS_RTF=0.3 python tools/bench_stream_server.py --listeners 4
+
+# the bytes at the start of each stream before the first clip
+preamble_bytes = {'wav': 44, 'opus': 0, 'vtt': len(b'WEBVTT\n\n')}
+
+def listen(url, extension, results, index, delay, start):
+    time.sleep(delay)
+    connection = http.client.HTTPConnection(*url)
+    joined = time.perf_counter() - start
+    connection.request('GET', f"/episodes/bench_stream.{extension}")
+    response = connection.getresponse()
+    first_audio = None
+    chunks = []
+    received = 0
+    while True:
+        chunk = response.read1(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        received += len(chunk)
+        if first_audio is None and received > preamble_bytes[extension]:
+            first_audio = time.perf_counter() - start
+    connection.close()
+    results[index] = (extension, joined, first_audio, time.perf_counter() - start, b''.join(chunks),
+                      response.getheader('Transfer-Encoding') == 'chunked')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=20, help='lines of the synthetic transcript')
+    parser.add_argument('--listeners', type=int, default=4)
+    parser.add_argument('--stagger', type=float, default=2.0, help='seconds between two listeners joining')
+    args = parser.parse_args()
+
+    transcript = make_transcript(args.lines)
+    store.put('transcript', 'bench_stream', {'summary': transcript})
+    tts_gen.clip_cache_enabled = False
+    tts_gen.warmup().join()
+
+    start = time.perf_counter()
+    produce_audio(parse_transcript(transcript), audio_filename='bench_stream.wav')
+    file_seconds = time.perf_counter() - start
+    with open('audio/bench_stream.wav', 'rb') as file:
+        file_bytes = len(file.read())
+
+    server = stream_server.make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = server.server_address
+    extensions = ['wav', 'opus', 'vtt']
+    results = [None] * args.listeners
+    start = time.perf_counter()
+    threads = [threading.Thread(target=listen, args=(url, extensions[i % 3], results, i, i * args.stagger, start))
+               for i in range(args.listeners)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    live_seconds = max(result[3] for result in results)
+
+    replay = [None]
+    listen(url, 'wav', replay, 0, 0, time.perf_counter())
+    server.shutdown()
+
+    print(f"\n{args.lines} lines, WAV file of produce_audio: {file_bytes:,} bytes complete after {file_seconds:.2f}s")
+    print(f"{'listener':<10} {'joined (s)':>11} {'first audio (s)':>16} {'complete (s)':>13} {'bytes':>11} {'chunked':>8}")
+    for extension, joined, first_audio, complete, data, chunked in results + replay:
+        name = extension if replay[0][4] is not data else 'wav replay'
+        print(f"{name:<10} {joined:>11.2f} {first_audio:>16.2f} {complete:>13.2f} {len(data):>11,} {str(chunked):>8}")
+
+    wav_streams = [data for extension, _, _, _, data, _ in results if extension == 'wav']
+    cached = replay[0][4]
+    # the live streams have the header of an unknown length, the cached file the actual sizes
+    same = all(data[44:] == cached[44:] for data in wav_streams)
+    print(f"one synthesis run for all the listeners in {live_seconds:.2f}s, wav streams "
+          f"{'identical to' if same else 'DIFFERENT from'} the cached replay")
+    shutil.rmtree(work_dir)
+    for name in ['bench_stream.wav', 'subtitle_bench_stream.wav.srt', 'refined_text_bench_stream.wav.txt']:
+        os.remove(os.path.join('audio', name))
+    sys.exit(0 if same else 1)
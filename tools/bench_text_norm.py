@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+import contextlib
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from make_fixtures import make_transcript
+from run import parse_transcript, speaker_seed_map
+from text_norm import get_normalizer
+
+# Compare the table-driven transcript parser of text_norm.py with the chained str.replace
+# sanitizer and the line parser it replaces, on a large synthetic transcript with the
+# punctuation the rules remove (the old parser printed every line, timed here to /dev/null,
+# a terminal is much slower). The character table is timed on its own against the sanitizer;
+# the whole parser also resolves aliases and skips headings, so without the print it is not
+# faster than the old one. The outputs must be identical for an English dialogue.
+#   python tools/bench_text_norm.py --lines 20000
+
+# the parser of run.py before text_norm.py; it printed every line of the transcript
+def old_sanitize_text(text):
+    text = text.replace('?', ',')
+    text = text.replace('\'', ' ')
+    text = text.replace('’', ' ')
+    text = text.replace('!', ',')
+    text = text.replace('-', ' ')
+    text = text.replace('(', ' ')
+    text = text.replace(')', ' ')
+    text = text.replace('"', ' ')
+    text = text.replace("'", ' ')
+    text = text.replace(":", ' ')
+    return text
+
+def old_parse_transcript(transcript, echo=False):
+    sequence_id = 1
+    result = []
+    for line in transcript.split('\n'):
+        if echo:
+            print(line)
+        if line.startswith('**'):
+            speaker = line.split('**', 2)[1].strip(':')
+            if speaker not in speaker_seed_map:
+                continue
+            text = old_sanitize_text(line.split('**', 2)[2].strip())
+            result.append((text, speaker_seed_map[speaker], sequence_id))
+            sequence_id += 1
+    return result
+
+# sprinkle the characters of the rule table over the words of the transcript
+def add_punctuation(transcript, seed=0):
+    rng = random.Random(seed)
+    marks = ['?', '!', "'s", '’s', '-based', ' (see', ')', '"', ': ']
+    words = transcript.split(' ')
+    return ' '.join(word + rng.choice(marks) if rng.random() < 0.15 else word for word in words)
+
+def best_time(function, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lines', type=int, default=20000, help='speaker turns of the transcript')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    transcript = add_punctuation(make_transcript(args.lines))
+    print(f"transcript: {args.lines} turns, {len(transcript) / 1e6:.1f} MB")
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        echo_seconds, _ = best_time(lambda: old_parse_transcript(transcript, echo=True), args.repeat)
+    old_seconds, old_result = best_time(lambda: old_parse_transcript(transcript), args.repeat)
+    new_seconds, new_result = best_time(lambda: parse_transcript(transcript), args.repeat)
+    lines = [line.split('**', 2)[2].strip() for line in transcript.split('\n') if line.startswith('**')]
+    normalize = get_normalizer('en')
+    old_sanitize_seconds, old_texts = best_time(lambda: [old_sanitize_text(line) for line in lines], args.repeat)
+    normalize_seconds, texts = best_time(lambda: [normalize(line) for line in lines], args.repeat)
+    for name, seconds in [('old, printing lines', echo_seconds), ('old, no printing', old_seconds),
+                          ('text_norm', new_seconds), ('old sanitize only', old_sanitize_seconds),
+                          ('normalizer only', normalize_seconds)]:
+        print(f"{name:>20}: {seconds * 1000:8.1f} ms, {args.lines / seconds:10.0f} turns/s")
+    if new_result != old_result or texts != old_texts:
+        print("outputs differ")
+        sys.exit(1)
+    print("outputs identical")
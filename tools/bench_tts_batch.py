@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+import json
+import argparse
+
+# run from the repo root so the speaker embeddings and ChatTTS are found
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from run import parse_transcript
+from artifact_store import store
+from tts_gen import produce_audio
+import tts_gen
+
+# Benchmark the per-episode wall time of produce_audio for several batch sizes, with and
+# without the batched, cached refinement of tts_pipeline (the two passes never overlap, so
+# with the refine cache off only batching the refine calls can make a difference), on a
+# cached transcript, e.g.
+# python tools/bench_tts_batch.py 1706.03762 --batch-sizes 1,4,8,16
+# with an episode id of the artifact store or a transcript json file
+# Without the model weights, the stand-in of tools/fake_chattts simulates both stages:
+# PYTHONPATH=tools/fake_chattts FAKE_TTS_RTF=0.3 FAKE_TTS_REFINE_RTF=0.1 PAPERCAST_CLIP_CACHE=0 \
+#   PAPERCAST_REFINE_CACHE=0 python tools/bench_tts_batch.py 1706.03762
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('transcript', help='episode id or transcript json file')
+    parser.add_argument('--batch-sizes', default='1,2,4,8')
+    parser.add_argument('--pipeline', default='off,on', help='tts_pipeline settings to compare')
+    parser.add_argument('--lines', type=int, default=0, help='only use the first N lines, 0 for all')
+    args = parser.parse_args()
+
+    if os.path.exists(args.transcript):
+        with open(args.transcript) as file:
+            transcript_dict = json.load(file)
+    else:
+        transcript_dict = store.get('transcript', args.transcript)
+    parsed_transcript = parse_transcript(transcript_dict['summary'])
+    if args.lines:
+        parsed_transcript = parsed_transcript[:args.lines]
+
+    results = []
+    for pipeline in args.pipeline.split(','):
+        tts_gen.pipeline_enabled = pipeline == 'on'
+        for batch_size in [int(b) for b in args.batch_sizes.split(',')]:
+            audio_filename = f'bench_batch_{batch_size}_{pipeline}.wav'
+            start = time.perf_counter()
+            refined_text_all = produce_audio(parsed_transcript, audio_filename=audio_filename,
+                                             batch_size=batch_size)
+            elapsed = time.perf_counter() - start
+            with open(f'audio/subtitle_{audio_filename}.srt') as srt_file:
+                srt_entries = srt_file.read().count(' --> ')
+            results.append((pipeline, batch_size, elapsed, len(refined_text_all), srt_entries))
+
+    print(f"\n{len(parsed_transcript)} lines")
+    print(f"{'pipeline':>8} {'batch':>6} {'wall (s)':>10} {'s/line':>8} {'speedup':>8} {'clips':>6} {'srt':>5}")
+    baseline = results[0][2]
+    for pipeline, batch_size, elapsed, clips, srt_entries in results:
+        print(f"{pipeline:>8} {batch_size:>6} {elapsed:>10.1f} {elapsed / len(parsed_transcript):>8.2f} "
+              f"{baseline / elapsed:>8.2f} {clips:>6} {srt_entries:>5}")
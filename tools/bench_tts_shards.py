@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import json
+import argparse
+from concurrent.futures import wait
+
+import numpy as np
+import soundfile
+
+# run from the repo root so the speaker embeddings and ChatTTS are found
+tools_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, tools_dir)
+sys.path.insert(0, os.path.dirname(tools_dir))
+
+from make_fixtures import make_transcript
+from run import parse_transcript
+from artifact_store import store
+from tts_gen import produce_audio
+import tts_gen
+
+# Scaling benchmark of the sharded synthesis (tts_workers) from 1 to N worker processes on a
+# cached transcript (an episode id of the artifact store or a transcript json file), or on a
+# synthetic one of --lines lines. The models of the workers are loaded before the clock starts
+# (the load time is shown apart), the clip cache is off, and the episode of every worker count
+# must be identical to the one of a single worker. 0 workers is the in-process synthesis, for
+# reference (its lines are not seeded per line, so its audio differs).
+#   python tools/bench_tts_shards.py 1706.03762 --workers 0,1,2,4,8
+# Without the model weights, with the stand-in of tools/fake_chattts keeping a core busy:
+#   PYTHONPATH=tools/fake_chattts FAKE_TTS_RTF=0.3 FAKE_TTS_SPIN=1 python tools/bench_tts_shards.py --lines 40
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('transcript', nargs='?', help='episode id or transcript json file')
+    parser.add_argument('--lines', type=int, default=40, help='lines of the synthetic transcript, or the first N lines')
+    parser.add_argument('--workers', default=f"0,1,2,{os.cpu_count() or 1}")
+    args = parser.parse_args()
+
+    if args.transcript is None:
+        parsed_transcript = parse_transcript(make_transcript(args.lines))
+    else:
+        if os.path.exists(args.transcript):
+            with open(args.transcript) as file:
+                transcript_dict = json.load(file)
+        else:
+            transcript_dict = store.get('transcript', args.transcript)
+        parsed_transcript = parse_transcript(transcript_dict['summary'])[:args.lines or None]
+    tts_gen.clip_cache_enabled = False
+
+    results = []
+    reference = None
+    for workers in sorted(dict.fromkeys(int(w) for w in args.workers.split(','))):
+        tts_gen.shutdown_worker_pool()
+        tts_gen.tts_workers = workers
+        load_seconds = 0.0
+        if workers:
+            start = time.perf_counter()
+            tts_gen.get_worker_pool()
+            wait(tts_gen.worker_loads)
+            load_seconds = time.perf_counter() - start
+        audio_filename = f'bench_shards_{workers}.wav'
+        start = time.perf_counter()
+        produce_audio(parsed_transcript, audio_filename=audio_filename)
+        elapsed = time.perf_counter() - start
+        audio, _ = soundfile.read(f'audio/{audio_filename}', dtype='int16')
+        identical = ''
+        if workers:
+            if reference is None:
+                reference = audio
+            identical = 'yes' if np.array_equal(reference, audio) else 'NO'
+        results.append((workers, load_seconds, elapsed, len(audio) / 24000, identical))
+    tts_gen.shutdown_worker_pool()
+
+    print(f"\n{len(parsed_transcript)} lines, {os.cpu_count()} cores")
+    print(f"{'workers':>8} {'load (s)':>9} {'wall (s)':>9} {'lines/s':>8} {'speedup':>8} {'audio (s)':>10} {'identical':>10}")
+    single = next((elapsed for workers, _, elapsed, _, _ in results if workers == 1), results[0][2])
+    for workers, load_seconds, elapsed, audio_seconds, identical in results:
+        print(f"{workers:>8} {load_seconds:>9.1f} {elapsed:>9.1f} {len(parsed_transcript) / elapsed:>8.2f} "
+              f"{single / elapsed:>8.2f} {audio_seconds:>10.1f} {identical:>10}")
@@ -0,0 +1,61 @@
+import os
+import time
+import zlib
+import numpy as np
+
+# A deterministic stand-in for ChatTTS, for benchmarks without the model weights.
+# Put tools/fake_chattts first on PYTHONPATH and `import ChatTTS` picks it up.
+# The audio is a tone whose pitch and length depend only on the text (about 65 ms per
+# character), and FAKE_TTS_RTF simulates the synthesis cost as a real-time factor:
+# 0.1 sleeps 0.1s per second of generated audio. FAKE_TTS_REFINE_RTF does the same for the
+# text refinement (refine_text_only), relative to the audio length of the refined texts.
+# Like the sampling of the real model, a little noise comes from the torch random generator,
+# so the audio of a line depends on the seed set before the call. With FAKE_TTS_SPIN=1 the
+# simulated cost keeps a core busy instead of sleeping, for the CPU scaling benchmarks.
+
+seconds_per_char = 0.065
+sample_rate = 24000
+
+def sampling_noise(length):
+    try:
+        import torch
+    except ImportError:
+        return 0
+    return 0.01 * torch.randn(length).numpy()
+
+class Chat:
+    def __init__(self):
+        self.real_time_factor = float(os.environ.get('FAKE_TTS_RTF', '0.05'))
+        self.refine_real_time_factor = float(os.environ.get('FAKE_TTS_REFINE_RTF', '0'))
+        self.spin = os.environ.get('FAKE_TTS_SPIN', '0') == '1'
+
+    def wait(self, seconds):
+        if not self.spin:
+            time.sleep(seconds)
+            return
+        # CPU time, so processes sharing a core take longer, as the real model does
+        deadline = time.process_time() + seconds
+        while time.process_time() < deadline:
+            pass
+
+    def load_models(self, compile=False, **kwargs):
+        time.sleep(float(os.environ.get('FAKE_TTS_LOAD_SECONDS', '0')))
+        return True
+
+    def infer(self, text, skip_refine_text=False, refine_text_only=False,
+              params_refine_text=None, params_infer_code=None, **kwargs):
+        texts = [text] if isinstance(text, str) else list(text)
+        if refine_text_only:
+            self.wait(sum(len(t) for t in texts) * seconds_per_char * self.refine_real_time_factor)
+            return [t.strip() for t in texts]
+
+        wavs = []
+        for t in texts:
+            seed = zlib.crc32(t.encode('utf-8'))
+            length = int(sample_rate * max(0.5, len(t) * seconds_per_char))
+            frequency = 110 + seed % 220
+            phase = np.arange(length, dtype=np.float32) * (2 * np.pi * frequency / sample_rate)
+            wav = 0.3 * np.sin(phase) + sampling_noise(length)
+            wavs.append(wav.astype(np.float32)[np.newaxis, :])
+        self.wait(sum(wav.shape[1] for wav in wavs) / sample_rate * self.real_time_factor)
+        return wavs
@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import time
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# A local stand-in for the OpenAI chat completions API, to exercise the pipeline
+# (including the streaming mode) without an API key. Point the client at it with
+#   OPENAI_BASE_URL=http://127.0.0.1:8000/v1 OPENAI_API_KEY=fake python run.py examples/run_attention.yaml
+# The final transcript call (max_tokens >= 4096) is answered with a canned transcript,
+# JSON mode calls with a canned PDF extraction and every other call with a short text.
+
+default_transcript_json = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                       'transcript', '1706.03762.json')
+
+canned_pdf_json = {
+    'title': 'A Canned Paper',
+    'abstract': 'This is the abstract of a canned paper served by the fake OpenAI server.',
+    'authors': ['Justin', 'Emma'],
+    'full_text': {
+        'Introduction': 'The introduction of the canned paper.',
+        'Methods': 'The methods of the canned paper.',
+        'Results': 'The results of the canned paper.',
+        'Conclusion': 'The conclusion of the canned paper.',
+    },
+}
+
+# split the text into small chunks similar to the tokens streamed by the real API
+def split_tokens(text):
+    tokens = []
+    for line in text.split('\n'):
+        tokens.extend(word + ' ' for word in line.split(' ')[:-1])
+        tokens.append(line.split(' ')[-1] + '\n')
+    tokens[-1] = tokens[-1].rstrip('\n')
+    return tokens
+
+def make_handler(transcript, latency, token_delay):
+    class FakeOpenAIHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if not self.path.endswith('/chat/completions'):
+                self.send_error(404)
+                return
+
+            if request.get('response_format', {}).get('type') == 'json_object':
+                content = json.dumps(canned_pdf_json)
+            elif request.get('max_tokens', 0) >= 4096:
+                content = transcript
+            else:
+                content = 'Machine Learning'
+
+            time.sleep(latency)
+            if request.get('stream'):
+                self.send_stream(request, content)
+            else:
+                self.send_completion(request, content)
+
+        def send_completion(self, request, content):
+            tokens = split_tokens(content)
+            time.sleep(token_delay * len(tokens))
+            body = json.dumps({
+                'id': 'chatcmpl-fake',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': request.get('model', 'gpt-4o'),
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': content}}],
+                'usage': {'prompt_tokens': sum(len(m['content'].split()) for m in request['messages']),
+                          'completion_tokens': len(tokens),
+                          'total_tokens': 0},
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_stream(self, request, content):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for token in split_tokens(content) + [None]:
+                chunk = {
+                    'id': 'chatcmpl-fake',
+                    'object': 'chat.completion.chunk',
+                    'created': int(time.time()),
+                    'model': request.get('model', 'gpt-4o'),
+                    'choices': [{'index': 0,
+                                 'finish_reason': None if token is not None else 'stop',
+                                 'delta': {'content': token} if token is not None else {}}],
+                }
+                self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+                time.sleep(token_delay)
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.write_chunk(b"")
+
+        def write_chunk(self, data):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+    return FakeOpenAIHandler
+
+def make_server(host='127.0.0.1', port=8000, transcript=None, latency=0.0, token_delay=0.0):
+    if transcript is None:
+        with open(default_transcript_json) as file:
+            transcript = json.load(file)['summary']
+    return ThreadingHTTPServer((host, port), make_handler(transcript, latency, token_delay))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--transcript', default=default_transcript_json,
+                        help='json file whose "summary" is returned as the transcript')
+    parser.add_argument('--latency', type=float, default=0.5, help='seconds before the first token')
+    parser.add_argument('--token-delay', type=float, default=0.02, help='seconds per streamed token')
+    args = parser.parse_args()
+
+    with open(args.transcript) as file:
+        transcript = json.load(file)['summary']
+    server = make_server(args.host, args.port, transcript, args.latency, args.token_delay)
+    print(f"fake OpenAI server listening on http://{args.host}:{args.port}/v1", file=sys.stderr)
+    server.serve_forever()
@@ -0,0 +1,125 @@
+import os
+import re
+import sys
+import time
+import hashlib
+import argparse
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# A local stand-in for arxiv.org serving fixture files, to exercise the fetch layer
+# (pooling, ETag / If-Modified-Since revalidation, streamed PDF downloads, bulk version
+# lookup) without network access. The fixture directory is laid out as
+#   <root>/html/<arxiv_id>v<version>.html
+#   <root>/pdf/<arxiv_id>.pdf
+# and the readers are pointed at it with
+#   ARXIV_BASE_URL=http://127.0.0.1:8001 ARXIV_API_URL=http://127.0.0.1:8001/api/query
+# /api/query?id_list=... answers with an Atom feed of the latest fixture version of each id.
+
+def latest_fixture_versions(root):
+    versions = {}
+    html_dir = os.path.join(root, 'html')
+    if os.path.isdir(html_dir):
+        for name in os.listdir(html_dir):
+            match = re.match(r'(.+?)v(\d+)(?:\.html)?$', name)
+            if match:
+                arxiv_id, version = match.group(1), int(match.group(2))
+                versions[arxiv_id] = max(version, versions.get(arxiv_id, 0))
+    return versions
+
+def make_handler(root, latency=0.0):
+    class FixtureHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # counters to check the revalidation and pooling from a test or benchmark
+        stats = {'requests': 0, 'not_modified': 0, 'connections': 0}
+
+        def log_message(self, format, *args):
+            pass
+
+        def setup(self):
+            super().setup()
+            self.stats['connections'] += 1
+
+        def do_GET(self):
+            self.stats['requests'] += 1
+            if latency:
+                time.sleep(latency)
+            url = urlparse(self.path)
+            if url.path == '/api/query':
+                self.send_feed(parse_qs(url.query).get('id_list', [''])[0].split(','))
+                return
+
+            match = re.match(r'/(html|pdf)/(.+)$', url.path)
+            if not match:
+                self.send_error(404)
+                return
+            kind, name = match.groups()
+            extension = '.html' if kind == 'html' else '.pdf'
+            path = os.path.join(root, kind, name if name.endswith(extension) else name + extension)
+            if not os.path.isfile(path):
+                self.send_error(404)
+                return
+            self.send_file(path, 'text/html; charset=utf-8' if kind == 'html' else 'application/pdf')
+
+        def send_file(self, path, content_type):
+            stat = os.stat(path)
+            etag = '"' + hashlib.md5(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest() + '"'
+            last_modified = formatdate(int(stat.st_mtime), usegmt=True)
+            if self.headers.get('If-None-Match') == etag or self.not_modified_since(stat.st_mtime):
+                self.stats['not_modified'] += 1
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(stat.st_size))
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.end_headers()
+            with open(path, 'rb') as file:
+                while True:
+                    chunk = file.read(64 * 1024)
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+
+        def not_modified_since(self, mtime):
+            since = self.headers.get('If-Modified-Since')
+            if not since or self.headers.get('If-None-Match'):
+                return False
+            try:
+                return int(mtime) <= parsedate_to_datetime(since).timestamp()
+            except (TypeError, ValueError):
+                return False
+
+        def send_feed(self, arxiv_ids):
+            versions = latest_fixture_versions(root)
+            entries = ''.join(f"<entry><id>http://arxiv.org/abs/{arxiv_id}v{versions[arxiv_id]}</id>"
+                              f"<title>{arxiv_id}</title></entry>"
+                              for arxiv_id in arxiv_ids if arxiv_id in versions)
+            body = f'<?xml version="1.0" encoding="UTF-8"?><feed xmlns="http://www.w3.org/2005/Atom">{entries}</feed>'.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/atom+xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return FixtureHandler
+
+def make_server(root, host='127.0.0.1', port=8001, latency=0.0):
+    return ThreadingHTTPServer((host, port), make_handler(root, latency))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('root', help='fixture directory with html/ and pdf/ subdirectories')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    args = parser.parse_args()
+
+    server = make_server(args.root, args.host, args.port, args.latency)
+    print(f"fixture server for {args.root} listening on http://{args.host}:{args.port}", file=sys.stderr)
+    server.serve_forever()
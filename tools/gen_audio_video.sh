@@ -16,6 +16,7 @@ output_audio="${arxiv_id}_output.wav"
 output_video="${arxiv_id}.mp4"
 
 # Run the first ffmpeg command to concatenate audio files with crossfade
+# (not needed for episodes made with the intro / outro keys of the run yaml, which are already mixed)
 ffmpeg -i head.wav -i "$audio_file" -i tail.wav -filter_complex \
 "[0][1]acrossfade=d=1:c1=tri:c2=tri[a1]; [a1][2]acrossfade=d=1:c1=tri:c2=tri[a2]" \
 -map "[a2]" "$output_audio"
@@ -0,0 +1,114 @@
+import os
+import random
+import argparse
+
+# Generate synthetic arXiv papers for the offline benchmarks: LaTeXML-style HTML pages
+# with the markup arxiv_reader looks for (ltx_personname, ltx_abstract, nested ltx_section /
+# ltx_subsection) and, if PyMuPDF is installed, a matching PDF. The layout is the one
+# served by tools/fixture_server.py:
+#   <out_dir>/html/<arxiv_id>v1.html
+#   <out_dir>/pdf/<arxiv_id>.pdf
+
+words = ("attention model transformer layer sequence token training data loss gradient "
+         "benchmark baseline encoder decoder parameter accuracy latency memory scaling "
+         "evaluation dataset representation embedding inference optimization").split()
+
+def make_sentence(rng):
+    return ' '.join(rng.choice(words) for _ in range(rng.randint(8, 20))).capitalize() + '.'
+
+def make_paragraph(rng, sentences=5):
+    return ' '.join(make_sentence(rng) for _ in range(sentences))
+
+# an inline formula in the MathML markup of LaTeXML, most of the elements of a real page
+def make_math(rng):
+    symbol = rng.choice('xyzWQKV')
+    index = rng.randint(1, 9)
+    return (f'<math alttext="{symbol}_{{{index}}}" class="ltx_Math" display="inline"><semantics>'
+            f'<msub><mi>{symbol}</mi><mn>{index}</mn></msub>'
+            f'<annotation encoding="application/x-tex">{symbol}_{{{index}}}</annotation></semantics></math>')
+
+# a paragraph with formulas between its sentences
+def make_math_paragraph(rng, sentences=5, formulas=0):
+    parts = [make_sentence(rng) for _ in range(sentences)]
+    for _ in range(formulas):
+        parts.insert(rng.randint(0, len(parts)), make_math(rng))
+    return ' '.join(parts)
+
+def fixture_id(index):
+    return f"2401.{index + 1:05d}"
+
+# a LaTeXML-like page with sections, subsections and paragraphs, and a number of inline formulas in every paragraph
+def make_arxiv_html(arxiv_id, sections=8, subsections=2, paragraphs=4, seed=0, formulas=0):
+    rng = random.Random(seed)
+    title = f"Synthetic Paper {arxiv_id}: {make_sentence(rng)[:60]}"
+    authors = ''.join(f'<span class="ltx_creator ltx_role_author"><span class="ltx_personname">Author {i}'
+                      f'<sup class="ltx_sup">†</sup></span></span>' for i in range(rng.randint(2, 6)))
+    parts = [
+        '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">',
+        f'<title>{title}</title></head><body><div class="ltx_page_main"><article class="ltx_document">',
+        f'<h1 class="ltx_title ltx_title_document">{title}</h1>',
+        f'<div class="ltx_authors">{authors}</div>',
+        '<div class="ltx_abstract"><h6 class="ltx_title ltx_title_abstract">Abstract</h6>',
+        f'<p class="ltx_p">{make_paragraph(rng, 6)}</p></div>',
+    ]
+    for s in range(1, sections + 1):
+        parts.append(f'<section id="S{s}" class="ltx_section"><h2 class="ltx_title ltx_title_section">'
+                     f'<span class="ltx_tag ltx_tag_section">{s} </span>Section {s}</h2>')
+        for p in range(1, paragraphs + 1):
+            parts.append(f'<div id="S{s}.p{p}" class="ltx_para"><p class="ltx_p">'
+                         f'{make_math_paragraph(rng, 5, formulas)}</p></div>')
+        for ss in range(1, subsections + 1):
+            parts.append(f'<section id="S{s}.SS{ss}" class="ltx_subsection"><h3 class="ltx_title ltx_title_subsection">'
+                         f'<span class="ltx_tag ltx_tag_subsection">{s}.{ss} </span>Subsection {s}.{ss}</h3>')
+            for p in range(1, paragraphs + 1):
+                parts.append(f'<div id="S{s}.SS{ss}.p{p}" class="ltx_para"><p class="ltx_p">'
+                             f'{make_math_paragraph(rng, 5, formulas)}</p></div>')
+            parts.append('</section>')
+        parts.append('</section>')
+    parts.append('</article></div></body></html>')
+    return ''.join(parts)
+
+def make_pdf(pdf_path, pages=10, seed=0):
+    import fitz
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), '\n\n'.join(make_paragraph(rng) for _ in range(6)), fontsize=9)
+    doc.save(pdf_path)
+
+def make_fixtures(out_dir, papers=20, sections=8, subsections=2, paragraphs=4, pdf_pages=10):
+    os.makedirs(os.path.join(out_dir, 'html'), exist_ok=True)
+    os.makedirs(os.path.join(out_dir, 'pdf'), exist_ok=True)
+    arxiv_ids = []
+    for index in range(papers):
+        arxiv_id = fixture_id(index)
+        with open(os.path.join(out_dir, 'html', f"{arxiv_id}v1.html"), 'w', encoding='utf-8') as file:
+            file.write(make_arxiv_html(arxiv_id, sections, subsections, paragraphs, seed=index))
+        if pdf_pages:
+            try:
+                make_pdf(os.path.join(out_dir, 'pdf', f"{arxiv_id}.pdf"), pdf_pages, seed=index)
+            except ImportError:
+                pdf_pages = 0
+        arxiv_ids.append(arxiv_id)
+    return arxiv_ids
+
+# a transcript with the given number of speaker turns for the fake OpenAI server
+def make_transcript(lines, seed=0):
+    rng = random.Random(seed)
+    speakers = ['Justin', 'Emma']
+    return '\n\n'.join(f"**{speakers[i % 2]}:** {make_paragraph(rng, rng.randint(1, 4))}" for i in range(lines))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('out_dir')
+    parser.add_argument('--papers', type=int, default=20)
+    parser.add_argument('--sections', type=int, default=8)
+    parser.add_argument('--subsections', type=int, default=2)
+    parser.add_argument('--paragraphs', type=int, default=4)
+    parser.add_argument('--pdf-pages', type=int, default=10, help='0 to skip the PDFs')
+    args = parser.parse_args()
+
+    arxiv_ids = make_fixtures(args.out_dir, args.papers, args.sections, args.subsections,
+                              args.paragraphs, args.pdf_pages)
+    print(f"wrote {len(arxiv_ids)} papers to {args.out_dir}: {arxiv_ids[0]} ... {arxiv_ids[-1]}")
@@ -1,30 +1,159 @@
-import ChatTTS
-import torch
 import numpy as np
+import collections
+import itertools
+import multiprocessing
+import hashlib
+import io
+import json
 import os
-import soundfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+import telemetry
+from disk_cache import DiskCache, hash_key
+from episode_writer import EpisodeWriter, AudioOutput, get_output_path
+import mastering
+import mixing
 
-chat = ChatTTS.Chat()
-chat.load_models(compile=False)
+# The ChatTTS model and the speaker embeddings are loaded on first use instead of at import
+# (importing torch and loading the model takes several seconds), so a cache-only or
+# transcript-only run never pays for them. warmup() loads them in a background thread
+# while the transcript is being written
+chat = None
+model_lock = threading.Lock()
+# held by every seeded ChatTTS call: the model is not thread safe and torch.manual_seed is
+# process wide, so the seed and the infer calls it governs run together, one call at a time
+infer_lock = threading.RLock()
 
-# Load pre-trained speaker embeddings
-justin_spk = torch.load('seed_1509_restored_emb.pt', map_location=torch.device('cpu'))
-emma_spk = torch.load('seed_1742_restored_emb.pt', map_location=torch.device('cpu'))
-
-# Map speaker names to their embeddings
-speaker_embedding_map = {
-    "Justin": justin_spk,
-    "Emma": emma_spk
+# pre-trained speaker embeddings
+speaker_embedding_files = {
+    "Justin": 'seed_1509_restored_emb.pt',
+    "Emma": 'seed_1742_restored_emb.pt'
 }
+# Map speaker names to their embeddings, filled by get_speaker_embedding
+speaker_embedding_map = {}
+# Content hash of each embedding file, identifying the voice in the clip cache keys
+speaker_embedding_digest = {}
+
+def get_chat():
+    global chat
+    with model_lock:
+        if chat is None:
+            import ChatTTS
+            with telemetry.span('tts_model_load'):
+                model = ChatTTS.Chat()
+                model.load_models(compile=False)
+            chat = model
+    return chat
+
+def get_speaker_embedding(speaker_name):
+    speaker_name = get_speaker_key(speaker_name)  # Default to Justin if speaker not found
+    with model_lock:
+        if speaker_name not in speaker_embedding_map:
+            import torch
+            speaker_embedding_map[speaker_name] = torch.load(speaker_embedding_files[speaker_name],
+                                                             map_location=torch.device('cpu'))
+    return speaker_embedding_map[speaker_name]
+
+def file_digest(path):
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+def get_speaker_digest(speaker_name):
+    speaker_name = get_speaker_key(speaker_name)
+    if speaker_name not in speaker_embedding_digest:
+        speaker_embedding_digest[speaker_name] = file_digest(speaker_embedding_files[speaker_name])
+    return speaker_embedding_digest[speaker_name]
+
+# load the model and the embeddings in a background thread, returns the thread.
+# Nothing is loaded if a synthesis server (tts_server.py) is answering, and in sharded
+# mode the worker processes are started and load their own models instead
+def warmup():
+    def load():
+        if tts_server_available():
+            return
+        if tts_workers > 0:
+            get_worker_pool()
+            return
+        get_chat()
+        for speaker_name in speaker_embedding_files:
+            get_speaker_embedding(speaker_name)
+    thread = threading.Thread(target=load, name='tts-warmup', daemon=True)
+    thread.start()
+    return thread
+
+# A running tts_server.py (e.g. http://127.0.0.1:8765) that keeps the model loaded.
+# When set and reachable every batch is synthesized there, otherwise in this process
+tts_server_url = os.environ.get('PAPERCAST_TTS_SERVER')
+tts_server_timeout = 600
+tts_server_ok = None
+
+def tts_server_available():
+    global tts_server_ok
+    if not tts_server_url:
+        return False
+    if tts_server_ok is None:
+        try:
+            with urllib.request.urlopen(tts_server_url.rstrip('/') + '/health', timeout=2) as response:
+                tts_server_ok = json.load(response).get('status') == 'ok'
+        except (OSError, ValueError) as e:
+            print(f"TTS server {tts_server_url} not available ({e}), synthesizing in process")
+            tts_server_ok = False
+    return tts_server_ok
+
+# send a batch to the synthesis server, returns the clips like generate_audio_batch
+# or None if the server failed, in which case the rest of the run falls back to in-process synthesis
+def generate_audio_remote(texts, temperature, top_P, top_K, speaker_name, text_seed_input,
+                          refine_text_flag, speech_speed, params_refine_text):
+    global tts_server_ok
+    request = json.dumps({
+        'texts': list(texts), 'temperature': temperature, 'top_P': top_P, 'top_K': top_K,
+        'speaker_name': speaker_name, 'text_seed_input': text_seed_input,
+        'refine_text_flag': refine_text_flag, 'speech_speed': speech_speed,
+        'params_refine_text': params_refine_text,
+    }).encode()
+    try:
+        http_request = urllib.request.Request(tts_server_url.rstrip('/') + '/synthesize', data=request,
+                                              headers={'Content-Type': 'application/json'})
+        with telemetry.span('tts_server_call', texts=len(texts)), \
+                urllib.request.urlopen(http_request, timeout=tts_server_timeout) as response:
+            npz = np.load(io.BytesIO(response.read()))
+    except (OSError, ValueError) as e:
+        print(f"Error: TTS server {tts_server_url} failed ({e}), synthesizing in process")
+        tts_server_ok = False
+        return None
+    refined_texts = [str(text) for text in npz['refined_text']]
+    return [[(24000, npz[f"audio_{i}"]), text] for i, text in enumerate(refined_texts)]
+
+default_speech_speed = '[speed_1]'
+default_params_refine_text = {'prompt': '[oral_1][laugh_0][break_5]'}
+
+# On-disk cache of synthesized clips (float audio + refined text), so an edited
+# transcript only re-synthesizes the lines that changed
+clip_cache = DiskCache(os.environ.get('PAPERCAST_CLIP_CACHE_DIR', 'clip_cache'),
+                       max_bytes=int(os.environ.get('PAPERCAST_CLIP_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024)),
+                       suffix='.npz')
+clip_cache_enabled = os.environ.get('PAPERCAST_CLIP_CACHE', '1') != '0'
+# The manifest of the running episode (see manifest.py), set by produce_audio: every synthesized
+# clip is also checkpointed there, so a resumed run does not synthesize it again even without the clip cache
+run_manifest = None
 
 # Core function to produce audio data for a given text
 def generate_audio(text, temperature, top_P, top_K, speaker_name, text_seed_input, 
                    refine_text_flag, 
-                   speech_speed = '[speed_1]',
-                   params_refine_text = {'prompt': '[oral_1][laugh_0][break_5]'}):
+                   speech_speed = default_speech_speed,
+                   params_refine_text = default_params_refine_text):
 
     print(f"Generating audio for speaker: {speaker_name}")
-    spk_emb = speaker_embedding_map.get(speaker_name, justin_spk)  # Default to Justin if speaker not found
+    if tts_server_available():
+        results = generate_audio_remote([text], temperature, top_P, top_K, speaker_name, text_seed_input,
+                                        refine_text_flag, speech_speed, params_refine_text)
+        if results is not None:
+            return results[0]
+    import torch
+    spk_emb = get_speaker_embedding(speaker_name)
+    chat = get_chat()
     params_infer_code = {
         'spk_emb': spk_emb, 
         'temperature': temperature,
@@ -33,21 +162,22 @@ def generate_audio(text, temperature, top_P, top_K, speaker_name, text_seed_inpu
         'top_K': top_K,
     }
     
-    torch.manual_seed(text_seed_input)
+    with infer_lock:
+        torch.manual_seed(text_seed_input)
 
-    if refine_text_flag:
-        text = chat.infer(text, 
-                          skip_refine_text=False,
-                          refine_text_only=True,
-                          params_refine_text=params_refine_text,
-                          params_infer_code=params_infer_code
-                          )
+        if refine_text_flag:
+            text = chat.infer(text, 
+                              skip_refine_text=False,
+                              refine_text_only=True,
+                              params_refine_text=params_refine_text,
+                              params_infer_code=params_infer_code
+                              )
     
-    wav = chat.infer(text, 
-                     skip_refine_text=True, 
-                     params_refine_text=params_refine_text, 
-                     params_infer_code=params_infer_code
-                     )
+        wav = chat.infer(text, 
+                         skip_refine_text=True, 
+                         params_refine_text=params_refine_text, 
+                         params_infer_code=params_infer_code
+                         )
     
     audio_data = np.array(wav[0]).flatten()
     sample_rate = 24000
@@ -55,74 +185,455 @@ def generate_audio(text, temperature, top_P, top_K, speaker_name, text_seed_inpu
 
     return [(sample_rate, audio_data), text_data]
 
+# Sampling parameters shared by every utterance in an episode
+synthesis_params = {
+    'temperature': 0.7,
+    'top_P': 0.3,
+    'top_K': 20,
+    'text_seed_input': 43,
+    'refine_text_flag': True,
+}
+
+# Resolve the name of the speaker embedding actually used for a speaker,
+# mirroring the default in generate_audio
+def get_speaker_key(speaker_name):
+    return speaker_name if speaker_name in speaker_embedding_files else "Justin"
+
+# Batched version of generate_audio: ChatTTS infer accepts a list of texts,
+# so the refine and audio passes are run once for the whole batch
+def generate_audio_batch(texts, temperature, top_P, top_K, speaker_name, text_seed_input,
+                         refine_text_flag,
+                         speech_speed = default_speech_speed,
+                         params_refine_text = default_params_refine_text):
+
+    print(f"Generating audio for speaker: {speaker_name}, batch of {len(texts)}")
+    if tts_server_available():
+        results = generate_audio_remote(texts, temperature, top_P, top_K, speaker_name, text_seed_input,
+                                        refine_text_flag, speech_speed, params_refine_text)
+        if results is not None:
+            return results
+    import torch
+    spk_emb = get_speaker_embedding(speaker_name)
+    chat = get_chat()
+    params_infer_code = {
+        'spk_emb': spk_emb,
+        'temperature': temperature,
+        'prompt': speech_speed,
+        'top_P': top_P,
+        'top_K': top_K,
+    }
+
+    texts = list(texts)
+    with infer_lock:
+        torch.manual_seed(text_seed_input)
+
+        if refine_text_flag:
+            texts = chat.infer(texts,
+                               skip_refine_text=False,
+                               refine_text_only=True,
+                               params_refine_text=params_refine_text,
+                               params_infer_code=params_infer_code
+                               )
+
+        wavs = chat.infer(texts,
+                          skip_refine_text=True,
+                          params_refine_text=params_refine_text,
+                          params_infer_code=params_infer_code
+                          )
+
+    sample_rate = 24000
+    return [[(sample_rate, np.array(wav).flatten()), text] for wav, text in zip(wavs, texts)]
+
+# The refine stage of generate_audio_batch on its own: the texts rewritten by the ChatTTS
+# refine model (the [oral]/[laugh]/[break] tokens), ready for refine_text_flag=False
+def refine_texts(texts, text_seed_input, params_refine_text = default_params_refine_text):
+    import torch
+    chat = get_chat()
+    with infer_lock:
+        torch.manual_seed(text_seed_input)
+        return list(chat.infer(list(texts),
+                               skip_refine_text=False,
+                               refine_text_only=True,
+                               params_refine_text=params_refine_text
+                               ))
+
+# The clip cache key: everything that changes the synthesized audio of a line,
+# with the seed of the line in sharded mode
+def get_clip_key(text, speaker_name, seed=None):
+    parts = [text, get_speaker_digest(speaker_name), synthesis_params, default_speech_speed, default_params_refine_text]
+    if seed is not None:
+        parts.append(seed)
+    return hash_key(*parts)
+
+# load a clip as (audio, refined_text, audio_duration) from the run manifest or the clip cache, None if missing
+def load_cached_clip(text, speaker_name, seed=None):
+    if not clip_cache_enabled and run_manifest is None:
+        return None
+    key = get_clip_key(text, speaker_name, seed)
+    data = run_manifest.load_clip(key) if run_manifest is not None else None
+    if data is None and clip_cache_enabled:
+        data = clip_cache.get(key)
+    if data is None:
+        return None
+    npz = np.load(io.BytesIO(data))
+    audio = npz['audio']
+    return audio, str(npz['refined_text']), len(audio) / 24000
+
+def save_cached_clip(text, speaker_name, audio, refined_text, sequence_id=None, seed=None):
+    if not clip_cache_enabled and run_manifest is None:
+        return
+    buffer = io.BytesIO()
+    np.savez(buffer, audio=np.asarray(audio, dtype=np.float32), refined_text=np.array(refined_text))
+    key = get_clip_key(text, speaker_name, seed)
+    if clip_cache_enabled:
+        clip_cache.put(key, buffer.getvalue())
+    # a resumed run finds the clip in the clip cache, the run keeps its own copy only without it
+    elif run_manifest is not None:
+        run_manifest.save_clip(f"clip_{sequence_id}", key, buffer.getvalue())
+
 # Wrapper function to generate audio data for a given text, speaker name and sequence_id
 def produce_audio_data(text, speaker_name, sequence_id=1):
-    temperature = 0.7
-    top_P = 0.3
-    top_K = 20
-    text_seed_input = 43
-    refine_text_flag = True
+    cached_clip = load_cached_clip(text, speaker_name)
+    if cached_clip is not None:
+        telemetry.record('tts_cached_clip', 0, sequence_id=sequence_id, chars=len(text), audio_seconds=cached_clip[2])
+        return cached_clip
 
-    (sample_rate, audio), refined_text = generate_audio(text, temperature, top_P, top_K, speaker_name, text_seed_input, refine_text_flag)
+    start_time = time.perf_counter()
+    (sample_rate, audio), refined_text = generate_audio(text, synthesis_params['temperature'],
+                                                        synthesis_params['top_P'],
+                                                        synthesis_params['top_K'],
+                                                        speaker_name,
+                                                        synthesis_params['text_seed_input'],
+                                                        synthesis_params['refine_text_flag'])
 
+    record_utterance(sequence_id, text, len(audio) / sample_rate, time.perf_counter() - start_time)
+
+    save_cached_clip(text, speaker_name, audio, refined_text, sequence_id)
     # Calculate the audio duration in seconds 
     audio_duration = len(audio) / sample_rate
     return audio, refined_text, audio_duration
 
-# Given a list of text, speaker names and sequence_id, 
-# produce audio files for each speaker and save them to a single audio file
-def produce_audio(transcript, audio_filename = 'test.wav', offset=0):
-    audio_data = []
-    transcript_text = [text for text, _, _ in transcript]
+# telemetry of one synthesized utterance, with its real-time factor (synthesis / audio seconds)
+def record_utterance(sequence_id, text, audio_seconds, synthesis_seconds):
+    telemetry.record('tts_utterance', synthesis_seconds, sequence_id=sequence_id, chars=len(text),
+                     audio_seconds=round(audio_seconds, 3), synthesis_seconds=round(synthesis_seconds, 3),
+                     real_time_factor=round(synthesis_seconds / audio_seconds, 3) if audio_seconds else None)
+
+# Batched wrapper: group the lines by speaker embedding and sampling params,
+# synthesize each group in chunks of batch_size and return the clips
+# in the same (audio, refined_text, audio_duration) form as produce_audio_data,
+# keyed by sequence_id. Lines found in the clip cache are not synthesized again
+def produce_audio_data_batch(transcript, batch_size=8):
+    clips = {}
+    groups = {}
     for text, speaker_name, sequence_id in transcript:
-        audio, refined_text, audio_duration = produce_audio_data(text, speaker_name, sequence_id)
-        audio_data.append((audio, refined_text, audio_duration))
-        print(f"finished producing audio for sequence_id: {sequence_id}, speaker: {speaker_name}")
-        print(audio_duration, refined_text)
-    
-    audio_data_all, refined_text_all, audio_duration_all = zip(*audio_data)
-    audio_data_all = np.concatenate(audio_data_all)
-    sample_rate = 24000
+        cached_clip = load_cached_clip(text, speaker_name)
+        if cached_clip is not None:
+            telemetry.record('tts_cached_clip', 0, sequence_id=sequence_id, chars=len(text), audio_seconds=cached_clip[2])
+            clips[sequence_id] = cached_clip
+            continue
+        key = (get_speaker_key(speaker_name), tuple(sorted(synthesis_params.items())))
+        groups.setdefault(key, []).append((text, speaker_name, sequence_id))
 
-    # Generate the srt subtitle file with the audio duration from the transcript
-    srt_list = []
-    if offset > 0: # from zero to offset time, there is music, just show [MUSIC]
-        start_time_str = "{:02d}:{:02d}:{:02d},{:03d}".format(0, 0, 0, 0)
-        end_time_str = "{:02d}:{:02d}:{:02d},{:03d}".format(int(offset//3600), int((offset//60)%60), int(offset%60), int((offset*1000)%1000))
-        time_str = start_time_str + ' --> ' + end_time_str
-        srt_list.append((time_str, '[AI GENERATED MUSIC]'))
-    start_time = offset
-    for text, audio_duration in zip(transcript_text, audio_duration_all):
-        print(text, audio_duration)
-        end_time = start_time + audio_duration
-        # Convert the start and end time to the srt format
-        start_time_str = "{:02d}:{:02d}:{:02d},{:03d}".format(int(start_time//3600), int((start_time//60)%60), int(start_time%60), int((start_time*1000)%1000))
-        end_time_str = "{:02d}:{:02d}:{:02d},{:03d}".format(int(end_time//3600), int((end_time//60)%60), int(end_time%60), int((end_time*1000)%1000))
-        # Output the srt format
-        print(start_time_str, '-->', end_time_str)
-        time_str = start_time_str + ' --> ' + end_time_str
-        srt_list.append((time_str, text))
-        start_time = end_time
-
-    if not os.path.exists('audio'):
-        os.makedirs('audio')
-    
-    # Save the srt file
-    with open(f'audio/subtitle_{audio_filename}.srt', 'w') as srt_file:
-        for i, (time_str, text) in enumerate(srt_list):
-            srt_file.write(f"{i+1}\n")
-            srt_file.write(f"{time_str}\n")
-            srt_file.write(f"{text}\n\n")
-        
-    # Soundfile is a more friendly lib for concatenated audio in numpy array
-    soundfile.write(f"audio/{audio_filename}", audio_data_all, sample_rate)
-
-    with open(f'audio/refined_text_{audio_filename}.txt', 'w') as file:
-        for refined_text in refined_text_all:
-            file.write(f"{refined_text}\n")
-
-    print(f"Audio file saved to audio/{audio_filename} and refined text saved to audio/refined_text_{audio_filename}.txt")
-    return refined_text_all
+    for lines in groups.values():
+        for i in range(0, len(lines), batch_size):
+            batch = lines[i:i + batch_size]
+            start_time = time.perf_counter()
+            results = generate_audio_batch([text for text, _, _ in batch],
+                                           synthesis_params['temperature'],
+                                           synthesis_params['top_P'],
+                                           synthesis_params['top_K'],
+                                           batch[0][1],
+                                           synthesis_params['text_seed_input'],
+                                           synthesis_params['refine_text_flag'])
+            # the batch time is shared between its utterances in proportion to their audio length
+            batch_seconds = time.perf_counter() - start_time
+            total_samples = sum(len(audio) for (_, audio), _ in results) or 1
+            for (text, speaker_name, sequence_id), ((sample_rate, audio), refined_text) in zip(batch, results):
+                record_utterance(sequence_id, text, len(audio) / sample_rate, batch_seconds * len(audio) / total_samples)
+                save_cached_clip(text, speaker_name, audio, refined_text, sequence_id)
+                clips[sequence_id] = (audio, refined_text, len(audio) / sample_rate)
+    return clips
+
+# Split a lazily produced transcript into lists of at most batch_size lines
+def iter_windows(transcript, batch_size):
+    transcript = iter(transcript)
+    while True:
+        window = list(itertools.islice(transcript, batch_size))
+        if not window:
+            return
+        yield window
+
+# lines of a list transcript grouped by speaker at a time in batch mode,
+# only the clips of one window are held in memory
+batch_window_lines = 64
+
+# Two-stage synthesis: the text refinement runs as its own ChatTTS calls, refine_batch_size
+# lines at a time, ahead of the audio code generation of those lines, and the refined text of
+# every line is kept in refine_cache, so a re-run (or an edited transcript) only refines the
+# lines it has not seen. The two stages do not overlap: they share the one model, which is not
+# thread safe, and torch.manual_seed is process wide, so every call seeds and infers under
+# infer_lock. With the fake model of tools/bench_tts_batch.py the wall time is the same as
+# without it; the gain is the batched refine calls and the refine cache on the real model.
+# The output is reproducible, but differs from the run without it (the refine pass is seeded
+# apart from the audio pass). Not used with a TTS server, which does both stages. Off by
+# default, PAPERCAST_TTS_PIPELINE=1 or tts_pipeline: true to enable
+pipeline_enabled = os.environ.get('PAPERCAST_TTS_PIPELINE', '0') == '1'
+refine_batch_size = 16
+refine_cache = DiskCache(os.environ.get('PAPERCAST_REFINE_CACHE_DIR', 'refine_cache'),
+                         max_bytes=64 * 1024 * 1024, suffix='.txt')
+refine_cache_enabled = os.environ.get('PAPERCAST_REFINE_CACHE', '1') != '0'
+
+def use_pipeline():
+    return pipeline_enabled and synthesis_params['refine_text_flag'] and not tts_server_available()
+
+def get_refine_key(text):
+    return hash_key(text, synthesis_params['text_seed_input'], default_params_refine_text)
+
+# the refined texts of some lines, from the refine cache or refined in one batch
+def refine_lines(lines):
+    refined = {}
+    if refine_cache_enabled:
+        for text, _, sequence_id in lines:
+            data = refine_cache.get(get_refine_key(text))
+            if data is not None:
+                refined[sequence_id] = data.decode('utf-8')
+    missing = [(text, sequence_id) for text, _, sequence_id in lines if sequence_id not in refined]
+    if missing:
+        with telemetry.span('tts_refine', lines=len(missing)):
+            texts = refine_texts([text for text, _ in missing], synthesis_params['text_seed_input'])
+        for (text, sequence_id), refined_text in zip(missing, texts):
+            refined[sequence_id] = refined_text
+            if refine_cache_enabled:
+                refine_cache.put(get_refine_key(text), refined_text.encode('utf-8'))
+    return [refined[sequence_id] for _, _, sequence_id in lines]
+
+# The refine stage: yields (text, speaker_name, sequence_id, cached_clip, refined_text) for every
+# line in transcript order, with either the clip from the clip cache or the refined text
+def iter_refined(transcript, window_size, first_size=1):
+    lines = iter(transcript)
+    # the first batch is only what the audio stage needs to start (first_size lines),
+    # the next ones double up to window_size
+    size = first_size
+    while True:
+        window = list(itertools.islice(lines, size))
+        if not window:
+            return
+        size = min(size * 2, window_size)
+        clips = [load_cached_clip(text, speaker_name) for text, speaker_name, _ in window]
+        missing = [line for line, clip in zip(window, clips) if clip is None]
+        refined = iter(refine_lines(missing) if missing else [])
+        for line, clip in zip(window, clips):
+            yield (*line, clip, None if clip is not None else next(refined))
+
+# The audio stage: synthesize the refined texts of a window of (text, speaker_name, sequence_id,
+# refined_text) lines, grouped by speaker in chunks of batch_size, keyed by sequence_id
+def produce_refined_audio_data(lines, batch_size=1):
+    clips = {}
+    groups = {}
+    for line in lines:
+        groups.setdefault(get_speaker_key(line[1]), []).append(line)
+    for group in groups.values():
+        for i in range(0, len(group), batch_size):
+            batch = group[i:i + batch_size]
+            start_time = time.perf_counter()
+            results = generate_audio_batch([refined_text for _, _, _, refined_text in batch],
+                                           synthesis_params['temperature'],
+                                           synthesis_params['top_P'],
+                                           synthesis_params['top_K'],
+                                           batch[0][1],
+                                           synthesis_params['text_seed_input'],
+                                           False)
+            batch_seconds = time.perf_counter() - start_time
+            total_samples = sum(len(audio) for (_, audio), _ in results) or 1
+            for (text, speaker_name, sequence_id, _), ((sample_rate, audio), refined_text) in zip(batch, results):
+                record_utterance(sequence_id, text, len(audio) / sample_rate, batch_seconds * len(audio) / total_samples)
+                save_cached_clip(text, speaker_name, audio, refined_text, sequence_id)
+                clips[sequence_id] = (audio, refined_text, len(audio) / sample_rate)
+    return clips
+
+# Sharded synthesis: with tts_workers > 0 the lines are synthesized by a pool of worker processes,
+# each with its own model and torch.set_num_threads(worker_threads, by default the cores divided
+# between the workers). Every line is seeded from (text_seed_input, sequence_id) instead of one
+# seed per call or batch, so an episode comes out the same whatever the number of workers, and
+# the clips are written in transcript order as soon as the first pending one is ready. The lines
+# are synthesized one at a time (batch_size and the refine pipeline do not apply)
+tts_workers = int(os.environ.get('PAPERCAST_TTS_WORKERS', '0'))
+worker_threads = int(os.environ.get('PAPERCAST_TTS_WORKER_THREADS', '0')) or None
+worker_pool = None
+# the model loading task of every worker, to wait for a warm pool
+worker_loads = []
+worker_pool_lock = threading.Lock()
+
+def get_line_seed(seed, sequence_id):
+    return int(hashlib.sha256(f"{seed}:{sequence_id}".encode()).hexdigest()[:8], 16)
+
+def init_worker(threads):
+    import torch
+    torch.set_num_threads(threads)
+
+def load_worker_model():
+    get_chat()
+    for speaker_name in speaker_embedding_files:
+        get_speaker_embedding(speaker_name)
+    return os.getpid()
+
+# the worker processes are spawned (not forked: the parent may already run torch threads)
+# and start loading their models at once
+def get_worker_pool():
+    global worker_pool
+    with worker_pool_lock:
+        if worker_pool is None:
+            threads = worker_threads or max(1, (os.cpu_count() or 1) // tts_workers)
+            print(f"starting {tts_workers} TTS worker processes with {threads} torch threads each")
+            worker_pool = ProcessPoolExecutor(tts_workers, mp_context=multiprocessing.get_context('spawn'),
+                                              initializer=init_worker, initargs=(threads,))
+            worker_loads[:] = [worker_pool.submit(load_worker_model) for _ in range(tts_workers)]
+    return worker_pool
+
+def shutdown_worker_pool():
+    global worker_pool
+    with worker_pool_lock:
+        if worker_pool is not None:
+            worker_pool.shutdown()
+            worker_pool = None
+
+# the task of a worker process: one line with its own seed
+def synthesize_line(text, speaker_name, seed, params):
+    start_time = time.perf_counter()
+    (sample_rate, audio), refined_text = generate_audio(text, params['temperature'], params['top_P'], params['top_K'],
+                                                        speaker_name, seed, params['refine_text_flag'])
+    return np.asarray(audio, dtype=np.float32), refined_text, time.perf_counter() - start_time
+
+def iter_sharded_clips(transcript):
+    pool = get_worker_pool()
+    # at most two lines per worker wait for the writer, so a streamed transcript is not read ahead
+    max_pending = 2 * tts_workers
+    pending = collections.deque()
+
+    def finish(text, speaker_name, sequence_id, seed, result):
+        if isinstance(result, tuple):
+            telemetry.record('tts_cached_clip', 0, sequence_id=sequence_id, chars=len(text), audio_seconds=result[2])
+            return text, speaker_name, sequence_id, result
+        audio, refined_text, synthesis_seconds = result.result()
+        record_utterance(sequence_id, text, len(audio) / 24000, synthesis_seconds)
+        save_cached_clip(text, speaker_name, audio, refined_text, sequence_id, seed)
+        return text, speaker_name, sequence_id, (audio, refined_text, len(audio) / 24000)
+
+    for text, speaker_name, sequence_id in transcript:
+        seed = get_line_seed(synthesis_params['text_seed_input'], sequence_id)
+        cached_clip = load_cached_clip(text, speaker_name, seed)
+        result = cached_clip if cached_clip is not None else \
+            pool.submit(synthesize_line, text, speaker_name, seed, synthesis_params)
+        pending.append((text, speaker_name, sequence_id, seed, result))
+        while pending and (len(pending) >= max_pending or isinstance(pending[0][4], tuple) or pending[0][4].done()):
+            yield finish(*pending.popleft())
+    while pending:
+        yield finish(*pending.popleft())
+
+# Yield every transcript line together with its synthesized clip, in transcript order.
+# A list transcript is batched batch_window_lines at a time; any other iterable (e.g. turns
+# streamed from the LLM) is consumed lazily, batch_size lines at a time
+def iter_clips(transcript, batch_size=1):
+    if tts_workers > 0 and not tts_server_available():
+        yield from iter_sharded_clips(transcript)
+        return
+    lazy = not isinstance(transcript, (list, tuple))
+    if use_pipeline():
+        # a short window keeps the audio stage close behind the refine stage: two batches,
+        # about batch_size lines for each speaker of a dialogue
+        window_size = max(batch_size, 1) if lazy or batch_size <= 1 else 2 * batch_size
+        refined = iter_refined(transcript, window_size if lazy else max(refine_batch_size, window_size), window_size)
+        for window in iter_windows(refined, window_size):
+            clips = produce_refined_audio_data([item[:3] + (item[4],) for item in window if item[3] is None],
+                                               max(batch_size, 1))
+            for text, speaker_name, sequence_id, cached_clip, _ in window:
+                if cached_clip is None:
+                    yield text, speaker_name, sequence_id, clips[sequence_id]
+                    continue
+                telemetry.record('tts_cached_clip', 0, sequence_id=sequence_id, chars=len(text),
+                                 audio_seconds=cached_clip[2])
+                yield text, speaker_name, sequence_id, cached_clip
+        return
+    if batch_size <= 1:
+        for text, speaker_name, sequence_id in transcript:
+            yield text, speaker_name, sequence_id, produce_audio_data(text, speaker_name, sequence_id)
+        return
+    window_size = batch_size if lazy else max(batch_size, batch_window_lines)
+    for window in iter_windows(transcript, window_size):
+        clips = produce_audio_data_batch(window, batch_size)
+        for text, speaker_name, sequence_id in window:
+            yield text, speaker_name, sequence_id, clips[sequence_id]
+
+# Given a list of text, speaker names and sequence_id, 
+# produce audio files for each speaker and save them to a single audio file.
+# With batch_size > 1 the lines are synthesized in batches and reassembled
+# in sequence_id order, so the WAV, SRT and refined text keep the same layout.
+# Every clip is written out as soon as it is ready (see episode_writer.py).
+# master (a dict of mastering.py settings, {} for the defaults) normalizes, compresses
+# and limits the finished episode, and mix ({'intro': path, 'outro': path, 'crossfade': s,
+# 'duck_db': dB}, see mixing.py) adds the music around the speech, in the same final pass
+# over a float WAV so the audio is only quantized once. With an intro the subtitles start
+# where the speech starts in the mix, instead of at offset. With the manifest of a run
+# (manifest.py) every clip is checkpointed as soon as it is synthesized.
+# The episode is written in audio_format (wav, flac or opus, see episode_writer.output_formats),
+# and with segment_seconds as segments of that many seconds listed in audio/<id>.m3u8, each
+# encoded as soon as its clips are synthesized, or as the final pass reaches it with master or mix
+def produce_audio(transcript, audio_filename = 'test.wav', offset=0, batch_size=1, master=None, mix=None,
+                  manifest=None, audio_format='wav', segment_seconds=None):
+    global run_manifest
+    run_manifest = manifest
+    cache_hits, cache_misses = clip_cache.hits, clip_cache.misses
+    if mix:
+        intro, outro = mixing.load_mix(mix)
+        offset = mixing.speech_offset(intro, mix.get('crossfade', 1.0))
+    float_wav = master is not None or mix
+    output_path = get_output_path(audio_filename, audio_format, segment_seconds)
+    if float_wav:
+        # the speech only, until the final pass
+        writer = EpisodeWriter(audio_filename, offset, subtype='FLOAT',
+                               audio_path=os.path.splitext(output_path)[0] + '.speech.wav')
+    else:
+        writer = EpisodeWriter(audio_filename, offset, audio_format=audio_format, segment_seconds=segment_seconds)
+    with writer:
+        for text, speaker_name, sequence_id, (audio, refined_text, audio_duration) in iter_clips(transcript, batch_size):
+            print(f"finished producing audio for sequence_id: {sequence_id}, speaker: {speaker_name}")
+            print(audio_duration, refined_text)
+            writer.add(text, audio, refined_text)
+        if mix and len(outro):
+            overlap = min(mixing.overlap_samples(outro, mix.get('crossfade', 1.0)), writer.samples) / writer.sample_rate
+            writer.write_srt_entry(writer.time - overlap, writer.time - overlap + len(outro) / writer.sample_rate,
+                                   '[AI GENERATED MUSIC]')
+
+    if float_wav:
+        gain_db = 0.0
+        settings = {**mastering.default_settings, **(master or {})}
+        if master is not None and writer.samples:
+            gain_db = mastering.normalization_gain_db(settings['target_dbfs'],
+                                                      mastering.dbfs(writer.sum_squares, writer.samples))
+        output = AudioOutput(output_path, writer.sample_rate, audio_format, segment_seconds)
+        # the mixed episode starts with the music, the speech alone at offset
+        origin = 0 if mix else offset
+        for start_time, end_time, text in writer.subtitles:
+            output.add_subtitle(start_time - origin, end_time - origin, text)
+        try:
+            with telemetry.span('mastering', audio_seconds=round(writer.samples / writer.sample_rate, 3), mixed=bool(mix)):
+                if mix:
+                    mixing.mix_file(writer.paths['audio'], None, mix, master, speech_gain_db=gain_db, output=output)
+                elif writer.samples:
+                    mastering.master_file(writer.paths['audio'], None, gain_db=gain_db, output=output, **settings)
+        except BaseException:
+            output.close(keep=False)
+            raise
+        output.close()
+        os.remove(writer.paths['audio'])
+
+    print(f"Audio file saved to {output_path} and refined text saved to audio/refined_text_{audio_filename}.txt")
+    if clip_cache_enabled:
+        print(f"clip cache: {clip_cache.hits - cache_hits} lines reused, {clip_cache.misses - cache_misses} lines synthesized")
+    if manifest is not None and manifest.restored_clips:
+        print(f"{manifest.restored_clips} clips restored from {manifest.folder}")
+    return tuple(writer.refined_texts)
 
 if __name__ == '__main__':
     test_transcript = [
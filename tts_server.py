@@ -0,0 +1,93 @@
+import io
+import json
+import argparse
+import threading
+import numpy as np
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import tts_gen
+
+# A long-running local synthesis service that keeps the ChatTTS model and the speaker
+# embeddings loaded, so a run.py process does not pay for loading them again:
+#   python tts_server.py --port 8765
+#   PAPERCAST_TTS_SERVER=http://127.0.0.1:8765 python run.py examples/run_attention.yaml
+# POST /synthesize takes a json batch of texts with the speaker and sampling parameters of
+# tts_gen.generate_audio_batch and returns the clips as an npz (audio_0, audio_1, ... and
+# refined_text). Requests from several clients are queued and synthesized one batch at a time,
+# since the model is not thread safe. GET /health reports the model state and the queue length.
+
+synthesis_lock = threading.Lock()
+queued = 0
+queued_lock = threading.Lock()
+
+def synthesize(request):
+    global queued
+    with queued_lock:
+        queued += 1
+    try:
+        with synthesis_lock:
+            return tts_gen.generate_audio_batch(request['texts'], request['temperature'], request['top_P'],
+                                                request['top_K'], request['speaker_name'],
+                                                request['text_seed_input'], request['refine_text_flag'],
+                                                speech_speed=request['speech_speed'],
+                                                params_refine_text=request['params_refine_text'])
+    finally:
+        with queued_lock:
+            queued -= 1
+
+def encode_clips(results):
+    arrays = {f"audio_{i}": np.asarray(audio, dtype=np.float32) for i, ((_, audio), _) in enumerate(results)}
+    buffer = io.BytesIO()
+    np.savez(buffer, refined_text=np.array([text for _, text in results]), **arrays)
+    return buffer.getvalue()
+
+class TTSHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/health':
+            self.send_error(404)
+            return
+        health = {'status': 'ok', 'model_loaded': tts_gen.chat is not None, 'queued': queued}
+        self.send_body(200, json.dumps(health).encode(), 'application/json')
+
+    def do_POST(self):
+        if self.path != '/synthesize':
+            self.send_error(404)
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            request = json.loads(self.rfile.read(length))
+            body = encode_clips(synthesize(request))
+        except Exception as e:
+            print(f"Error: synthesis failed: {e}")
+            self.send_body(500, json.dumps({'error': str(e)}).encode(), 'application/json')
+            return
+        print(f"synthesized a batch of {len(request['texts'])} for speaker {request['speaker_name']}")
+        self.send_body(200, body, 'application/octet-stream')
+
+def make_server(host='127.0.0.1', port=8765):
+    # the server synthesizes in process, never through another server
+    tts_gen.tts_server_url = None
+    return ThreadingHTTPServer((host, port), TTSHandler)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Keep ChatTTS loaded and synthesize speech for run.py processes')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port)
+    tts_gen.warmup().join()
+    print(f"TTS server listening on http://{args.host}:{args.port}")
+    server.serve_forever()